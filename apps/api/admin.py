@@ -0,0 +1,63 @@
+﻿from __future__ import annotations
+
+import hmac
+from datetime import date
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from daily_checkin.config import settings
+from daily_checkin.db import read_session_scope
+from daily_checkin.repositories import StatsRepository, UserRepository, UserSummaryRepository
+from daily_checkin.services.history import DEFAULT_HISTORY_DAYS, build_history
+from daily_checkin.utils_time import local_date_for, utc_now
+
+
+def require_admin(x_admin_token: str | None = Header(default=None)) -> None:
+    if not settings.admin_api_token or not x_admin_token:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    if not hmac.compare_digest(x_admin_token, settings.admin_api_token):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+router = APIRouter(prefix="/admin", dependencies=[Depends(require_admin)])
+
+
+@router.get("/stats/{date_local}")
+def daily_stats(date_local: date, timezone: str | None = None):
+    with read_session_scope() as session:
+        totals = StatsRepository(session).for_date(date_local, timezone)
+    return {"date": date_local.isoformat(), "timezone": timezone, **totals}
+
+
+@router.get("/users/{user_id}/history")
+def user_history(user_id: int, days: int = DEFAULT_HISTORY_DAYS):
+    with read_session_scope() as session:
+        user = UserRepository(session).get_view(user_id)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        today = local_date_for(user.timezone, utc_now())
+        summary = UserSummaryRepository(session).get(user_id)
+        return {"user_id": user_id, **build_history(summary, today, days)}
+
+
+@router.get("/export/checkins.csv")
+def export_checkins(
+    date_from: date = Query(alias="from"),
+    date_to: date = Query(alias="to"),
+    user_id: list[int] | None = Query(default=None),
+):
+    from daily_checkin.services.export import iter_csv, iter_export_batches
+
+    def stream():
+        # The session lives as long as the response body, not the request handler.
+        with read_session_scope() as session:
+            yield from iter_csv(iter_export_batches(session, date_from, date_to, user_id))
+
+    filename = f"checkins_{date_from}_{date_to}.csv"
+    return StreamingResponse(
+        stream(),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
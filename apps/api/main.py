@@ -3,33 +3,51 @@
 import asyncio
 import contextlib
 
-from fastapi import FastAPI, Request, HTTPException
+import orjson
+from fastapi import FastAPI, Request, HTTPException, Response
+from aiogram.fsm.storage.redis import RedisStorage
 from aiogram.types import Update
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from redis.asyncio import Redis
 
+from daily_checkin import db
 from daily_checkin.config import settings
+from daily_checkin.metrics import DUPLICATE_UPDATES, WEBHOOK_LATENCY
 from daily_checkin.telegram.bot import create_bot, create_dispatcher
+from daily_checkin.telegram.coordination import PollingLeader, register_webhook
+from daily_checkin.telegram.dedup import UpdateDeduplicator
+from daily_checkin.telegram.lanes import LaneExecutor
 from daily_checkin.telegram.handlers import router
 
+from .admin import router as admin_router
+
+db.configure("api")
+
 app = FastAPI()
+app.include_router(admin_router)
 
+# Several workers/hosts may serve the API: dispatcher state lives in Redis and
+# webhook registration / polling is coordinated through Redis locks.
+redis = Redis.from_url(settings.redis_url)
 bot = create_bot()
-dp = create_dispatcher()
+lanes = LaneExecutor(settings.update_lanes, settings.update_lane_queue_size)
+dp = create_dispatcher(storage=RedisStorage(redis), lanes=lanes)
 dp.include_router(router)
+dedup = UpdateDeduplicator(redis, settings.update_dedup_ttl_seconds)
 polling_task: asyncio.Task | None = None
 
 
 @app.on_event("startup")
 async def on_startup():
     if settings.public_base_url:
-        await bot.set_webhook(
-            url=f"{settings.public_base_url}/webhook",
-            secret_token=settings.webhook_secret,
+        await register_webhook(
+            bot, redis, f"{settings.public_base_url}/webhook", settings.webhook_secret
         )
     else:
         # Polling mode for local/dev when no public URL is configured.
-        await bot.delete_webhook(drop_pending_updates=True)
         global polling_task
-        polling_task = asyncio.create_task(dp.start_polling(bot))
+        leader = PollingLeader(dp, bot, redis, settings.polling_leader_ttl_seconds)
+        polling_task = asyncio.create_task(leader.run())
 
 
 @app.on_event("shutdown")
@@ -38,20 +56,39 @@ async def on_shutdown():
         polling_task.cancel()
         with contextlib.suppress(asyncio.CancelledError):
             await polling_task
+    await lanes.close()
+    await dp.storage.close()
+    await bot.session.close()
 
 
 @app.post("/webhook")
 async def webhook(request: Request):
-    if settings.webhook_secret:
-        secret = request.headers.get("X-Telegram-Bot-Api-Secret-Token")
-        if secret != settings.webhook_secret:
-            raise HTTPException(status_code=403, detail="Invalid secret token")
+    with WEBHOOK_LATENCY.time():
+        if settings.webhook_secret:
+            secret = request.headers.get("X-Telegram-Bot-Api-Secret-Token")
+            if secret != settings.webhook_secret:
+                raise HTTPException(status_code=403, detail="Invalid secret token")
+
+        payload = orjson.loads(await request.body())
+        update_id = payload.get("update_id")
+        if isinstance(update_id, int) and await dedup.seen(update_id):
+            DUPLICATE_UPDATES.inc()
+            return {"ok": True}
 
-    update = Update.model_validate(await request.json())
-    await dp.feed_update(bot, update)
-    return {"ok": True}
+        try:
+            await dp.feed_update(bot, Update.model_validate(payload))
+        except Exception:
+            if isinstance(update_id, int):
+                await dedup.forget(update_id)
+            raise
+        return {"ok": True}
 
 
 @app.get("/healthz")
 async def healthz():
     return {"status": "ok"}
+
+
+@app.get("/metrics")
+async def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
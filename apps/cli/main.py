@@ -0,0 +1,144 @@
+﻿from __future__ import annotations
+
+import argparse
+import sys
+from datetime import date, datetime, timedelta, timezone
+
+import orjson
+
+
+def lag_report(args) -> int:
+    from daily_checkin.db import read_session_scope
+    from daily_checkin.services.reports import LAG_PERCENTILES, send_lag_report
+
+    until = datetime.now(timezone.utc)
+    since = until - timedelta(days=args.days)
+    with read_session_scope() as session:
+        report = send_lag_report(session, since, until)
+
+    if args.json:
+        sys.stdout.write(orjson.dumps(report, option=orjson.OPT_INDENT_2).decode() + "\n")
+        return 0
+
+    header = "".join(f"{f'p{pct}':>10}" for pct in LAG_PERCENTILES)
+    for section, title in (("by_type", "type"), ("by_hour", "type:hour (UTC)")):
+        print(f"{title:<24}{'count':>10}{header}")
+        for key, row in report[section].items():
+            values = "".join(f"{row[f'p{pct}']:>10.1f}" for pct in LAG_PERCENTILES)
+            print(f"{key:<24}{row['count']:>10}{values}")
+        print()
+    return 0
+
+
+def rebuild_stats(args) -> int:
+    from daily_checkin.db import session_scope
+    from daily_checkin.repositories import StatsRepository
+
+    with session_scope() as session:
+        rows = StatsRepository(session).rebuild(args.date_from, args.date_to)
+    print(f"rebuilt {rows} daily_stats rows for {args.date_from}..{args.date_to}")
+    return 0
+
+
+def rebuild_summaries(args) -> int:
+    from daily_checkin.db import session_scope
+    from daily_checkin.repositories import UserSummaryRepository
+
+    with session_scope() as session:
+        rows = UserSummaryRepository(session).rebuild_all()
+    print(f"rebuilt {rows} user_summary rows")
+    return 0
+
+
+def export_checkins(args) -> int:
+    from daily_checkin.db import read_session_scope
+    from daily_checkin.services.export import iter_export_batches, write_csv, write_parquet
+
+    with read_session_scope() as session:
+        batches = iter_export_batches(session, args.date_from, args.date_to, args.user_ids)
+        if args.format == "parquet":
+            rows = write_parquet(batches, args.output)
+        elif args.output == "-":
+            rows = write_csv(batches, sys.stdout)
+        else:
+            with open(args.output, "w", newline="", encoding="utf-8") as stream:
+                rows = write_csv(batches, stream)
+    print(f"exported {rows} check-ins for {args.date_from}..{args.date_to}", file=sys.stderr)
+    return 0
+
+
+def broadcast(args) -> int:
+    from daily_checkin.services.broadcast import BroadcastAborted, create_broadcast, run_broadcast
+
+    broadcast_id = args.resume
+    if broadcast_id is None:
+        if not args.text:
+            print("either --text or --resume is required", file=sys.stderr)
+            return 2
+        broadcast_id = create_broadcast(args.text)
+        print(f"created broadcast {broadcast_id}", file=sys.stderr)
+
+    try:
+        totals = run_broadcast(broadcast_id, args.page_size)
+    except BroadcastAborted as exc:
+        print(f"{exc}; fix the cause and run with --resume {broadcast_id}", file=sys.stderr)
+        return 1
+    if totals is None:
+        print(f"broadcast {broadcast_id} is missing or already finished", file=sys.stderr)
+        return 1
+    print(f"broadcast {broadcast_id}: " + " ".join(f"{k.lower()}={v}" for k, v in totals.items()))
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="daily-checkin")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    lag = commands.add_parser("lag-report", help="send lag percentiles from notification_log")
+    lag.add_argument("--days", type=int, default=7)
+    lag.add_argument("--json", action="store_true")
+    lag.set_defaults(func=lag_report)
+
+    rebuild = commands.add_parser("rebuild-stats", help="recompute daily_stats from daily_state")
+    rebuild.add_argument("--from", dest="date_from", type=date.fromisoformat, required=True)
+    rebuild.add_argument("--to", dest="date_to", type=date.fromisoformat, required=True)
+    rebuild.set_defaults(func=rebuild_stats)
+
+    summaries = commands.add_parser(
+        "rebuild-summaries", help="recompute streaks and history bitmaps from daily_state"
+    )
+    summaries.set_defaults(func=rebuild_summaries)
+
+    export = commands.add_parser("export-checkins", help="stream check-ins with their day state")
+    export.add_argument("--from", dest="date_from", type=date.fromisoformat, required=True)
+    export.add_argument("--to", dest="date_to", type=date.fromisoformat, required=True)
+    export.add_argument("--user-id", dest="user_ids", type=int, action="append")
+    export.add_argument("--format", choices=("csv", "parquet"), default="csv")
+    export.add_argument(
+        "--output", default="-", help="file path, '-' for stdout (csv only; parquet needs a file)"
+    )
+    export.set_defaults(func=export_checkins)
+
+    send_all = commands.add_parser("broadcast", help="send a message to every active user")
+    send_all.add_argument("--text")
+    send_all.add_argument("--resume", type=int, help="continue an interrupted broadcast by id")
+    send_all.add_argument("--page-size", type=int)
+    send_all.set_defaults(func=broadcast)
+
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == "export-checkins" and args.format == "parquet" and args.output == "-":
+        parser.error("export-checkins --format parquet needs --output with a file path")
+
+    from daily_checkin import db
+
+    db.configure("scheduler")
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
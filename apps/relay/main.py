@@ -0,0 +1,27 @@
+﻿from __future__ import annotations
+
+import logging
+import signal
+import threading
+
+from daily_checkin import db
+from daily_checkin.config import settings
+from daily_checkin.services.outbox import run_relay
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    db.configure("worker")
+    if settings.relay_metrics_port:
+        from daily_checkin.metrics import start_metrics_server
+
+        start_metrics_server(settings.relay_metrics_port)
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    run_relay(stop)
+
+
+if __name__ == "__main__":
+    main()
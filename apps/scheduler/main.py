@@ -1,8 +1,31 @@
-﻿from daily_checkin.services.scheduler import schedule_window
+﻿import argparse
+import logging
+import signal
+import threading
 
+from daily_checkin import db
+from daily_checkin.services.scheduler import run_due_loop, schedule_window
+from daily_checkin.tracing import unit_of_work
 
-def main():
-    schedule_window()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="scheduler")
+    parser.add_argument(
+        "--loop", action="store_true", help="run continuously from the in-memory due index"
+    )
+    args = parser.parse_args(argv)
+
+    db.configure("scheduler")
+    if not args.loop:
+        with unit_of_work("scheduler.schedule_window"):
+            schedule_window()
+        return
+
+    logging.basicConfig(level=logging.INFO)
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    run_due_loop(stop)
 
 
 if __name__ == "__main__":
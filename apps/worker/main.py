@@ -1,86 +1,142 @@
 ﻿from __future__ import annotations
 
-from datetime import datetime, timedelta, timezone
+import random
+from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 
-from celery import Celery
+from celery.signals import task_postrun, task_prerun, worker_init, worker_process_shutdown
 
 from daily_checkin.config import settings
+from daily_checkin import db, state_cache
+from daily_checkin.celery_app import TaskMessage, get_celery_app, publish, publish_many
 from daily_checkin.db import session_scope
+from daily_checkin.metrics import mark_process_dead, observe_send_lag, start_metrics_server
 from daily_checkin.models import DailyStateEnum, UserStatus
+from daily_checkin.tracing import begin_unit, end_unit
 from daily_checkin.repositories import (
     CheckinRepository,
     DailyStateRepository,
     NotificationLogRepository,
+    StatsRepository,
     UserRepository,
+    UserSummaryRepository,
 )
 from daily_checkin.services.notifications import (
     notify_contacts_last_checkin,
     notify_contacts_online,
     send_contact_consent_request,
+    send_error_code,
 )
 from daily_checkin.storage import upload_bytes
-from daily_checkin.utils_time import add_minutes
+from daily_checkin.utils_time import add_hours, add_minutes, ensure_utc, utc_now
 
-from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter, TelegramAPIError
+db.configure("worker")
+
+celery_app = get_celery_app()
+
+
+@worker_init.connect
+def _start_metrics_server(**kwargs):
+    if settings.worker_metrics_port:
+        start_metrics_server(settings.worker_metrics_port)
+
+
+@worker_process_shutdown.connect
+def _release_process_metrics(pid=None, **kwargs):
+    if pid:
+        mark_process_dead(pid)
+
+
+_unit_tokens = {}
+
+
+@task_prerun.connect
+def _begin_task_unit(task_id=None, task=None, **kwargs):
+    _unit_tokens[task_id] = begin_unit(task.name)
+
+
+@task_postrun.connect
+def _end_task_unit(task_id=None, **kwargs):
+    token = _unit_tokens.pop(task_id, None)
+    if token is not None:
+        end_unit(token)
+
+
+def _retry_payload(
+    text: str,
+    date_local: str,
+    reply_markup: dict | None = None,
+    expires_at: datetime | None = None,
+):
+    # What the retry engine needs to resend the message without the task that built it.
+    return {
+        "text": text,
+        "date_local": date_local,
+        "reply_markup": reply_markup,
+        "expires_at": ensure_utc(expires_at).isoformat() if expires_at else None,
+    }
 
-celery_app = Celery(
-    "daily_checkin",
-    broker=settings.celery_broker_url,
-    backend=settings.celery_result_backend,
-)
-celery_app.conf.enable_utc = True
-celery_app.conf.timezone = "UTC"
+
+def _flood_delay(exc) -> float:
+    # Telegram's retry_after plus a little spread, so deferred sends do not all
+    # hit the API in the same instant when the pause ends.
+    return exc.retry_after + random.uniform(0, settings.flood_retry_jitter_seconds)
 
 
 @celery_app.task(name="tasks.checkin_due")
 def checkin_due(user_id: int, date_local: str | None = None):
+    if date_local:
+        cached = state_cache.get(user_id, datetime.fromisoformat(date_local).date())
+        if cached and cached.state != DailyStateEnum.PENDING:
+            return
+
     with session_scope() as session:
         users = UserRepository(session)
         states = DailyStateRepository(session)
-        user = users.get_by_id(user_id)
+        user = users.get_view(user_id)
         if not user:
             return
 
-        now = datetime.utcnow().replace(tzinfo=timezone.utc)
-        if user.status == UserStatus.PAUSED:
-            if user.pause_until and user.pause_until <= now:
-                user.status = UserStatus.ACTIVE
-            else:
-                return
-        if user.status != UserStatus.ACTIVE:
+        now = utc_now()
+        # An expired pause counts as active; the lifecycle sweep flips the status.
+        pause_expired = (
+            user.status == UserStatus.PAUSED
+            and user.pause_until
+            and ensure_utc(user.pause_until) <= now
+        )
+        if user.status != UserStatus.ACTIVE and not pause_expired:
             return
 
         tz = ZoneInfo(user.timezone)
         if not date_local:
-            date_local = datetime.utcnow().astimezone(tz).date().isoformat()
+            date_local = utc_now().astimezone(tz).date().isoformat()
 
         state = states.get_state(user.id, datetime.fromisoformat(date_local).date())
         if not state or state.state != DailyStateEnum.PENDING:
             return
 
-        celery_app.send_task(
-            "tasks.reminder", args=[user.id, date_local, 1], eta=add_minutes(state.due_at_utc, 30)
-        )
-        celery_app.send_task(
-            "tasks.reminder", args=[user.id, date_local, 2], eta=add_minutes(state.due_at_utc, 60)
-        )
-        celery_app.send_task(
-            "tasks.reminder", args=[user.id, date_local, 3], eta=add_minutes(state.due_at_utc, 90)
-        )
-        celery_app.send_task(
-            "tasks.deadline_missed", args=[user.id, date_local], eta=state.deadline_at_utc
+        messages = [
+            TaskMessage("tasks.reminder", [user.id, date_local, n], eta=add_minutes(state.due_at_utc, 30 * n))
+            for n in (1, 2, 3)
+        ]
+        messages.append(
+            TaskMessage("tasks.deadline_missed", [user.id, date_local], eta=state.deadline_at_utc)
         )
+        publish_many(messages)
+
 
+@celery_app.task(name="tasks.reminder", bind=True, max_retries=None)
+def reminder(self, user_id: int, date_local: str, n: int):
+    cached = state_cache.get(user_id, datetime.fromisoformat(date_local).date())
+    if cached and (cached.state != DailyStateEnum.PENDING or cached.reminders_sent_count >= n):
+        return
 
-@celery_app.task(name="tasks.reminder")
-def reminder(user_id: int, date_local: str, n: int):
     with session_scope() as session:
         users = UserRepository(session)
         states = DailyStateRepository(session)
         logs = NotificationLogRepository(session)
 
-        user = users.get_by_id(user_id)
+        user = users.get_view(user_id)
         if not user or user.status != UserStatus.ACTIVE:
             return
         state = states.get_state(user_id, datetime.fromisoformat(date_local).date())
@@ -90,37 +146,45 @@ def reminder(user_id: int, date_local: str, n: int):
             return
 
         key = f"reminder:{user_id}:{date_local}:{n}"
-        if not logs.try_insert(key, "REMINDER", user_id, user.tg_chat_id):
+        scheduled_for = add_minutes(state.due_at_utc, 30 * n)
+        if not logs.try_insert(key, "REMINDER", user_id, user.tg_chat_id, scheduled_for=scheduled_for):
             return
 
         from daily_checkin.telegram.bot import create_bot
+        from daily_checkin.telegram.flood import FloodControlError
+        from aiogram.exceptions import TelegramForbiddenError
         import asyncio
 
-        bot = create_bot()
+        bot = create_bot(enforce_flood_gate=True)
         text = "Напоминание: пора сделать отметку (селфи)."
         try:
             asyncio.run(bot.send_message(user.tg_chat_id, text))
             logs.mark_sent(key)
+            observe_send_lag("REMINDER", scheduled_for)
             states.increment_reminders(user_id, datetime.fromisoformat(date_local).date())
+            users.clear_unreachable(user_id)
         except TelegramForbiddenError as exc:
             logs.mark_error(key, "FORBIDDEN", str(exc))
             _mark_unreachable(user_id)
-        except TelegramRetryAfter as exc:
-            logs.mark_error(key, "RATE_LIMIT", str(exc))
-            raise
-        except TelegramAPIError as exc:
-            logs.mark_error(key, "API_ERROR", str(exc))
+        except FloodControlError as exc:
+            # Rolling back drops the PENDING log row, so the retry can claim it again.
+            raise self.retry(countdown=_flood_delay(exc))
         except Exception as exc:
-            logs.mark_error(key, "SEND_ERROR", str(exc))
+            payload = _retry_payload(text, date_local, expires_at=state.deadline_at_utc)
+            logs.mark_error(key, send_error_code(exc), str(exc), payload)
 
 
 @celery_app.task(name="tasks.deadline_missed")
 def deadline_missed(user_id: int, date_local: str):
+    cached = state_cache.get(user_id, datetime.fromisoformat(date_local).date())
+    if cached and cached.state != DailyStateEnum.PENDING:
+        return
+
     with session_scope() as session:
         states = DailyStateRepository(session)
         logs = NotificationLogRepository(session)
         users = UserRepository(session)
-        user = users.get_by_id(user_id)
+        user = users.get_view(user_id)
         if not user:
             return
         state = states.get_state(user_id, datetime.fromisoformat(date_local).date())
@@ -128,52 +192,114 @@ def deadline_missed(user_id: int, date_local: str):
             return
 
         key = f"deadline:{user_id}:{date_local}"
-        if not logs.try_insert(key, "DEADLINE", user_id, user.tg_chat_id):
+        deadline_at = state.deadline_at_utc
+        if not logs.try_insert(key, "DEADLINE", user_id, user.tg_chat_id, scheduled_for=deadline_at):
             return
 
         state_date = datetime.fromisoformat(date_local).date()
         states.mark_missed(user_id, state_date)
-        states.set_escalation_sent(user_id, state_date, datetime.utcnow())
+        UserSummaryRepository(session).record(user_id, state_date, done=False)
+        states.set_escalation_sent(user_id, state_date, utc_now())
+        StatsRepository(session).increment(
+            state_date, user.timezone, missed_count=1, escalation_count=1
+        )
+        # Nothing goes to the user here; SENT records when the deadline was handled,
+        # which is the lag the report shows for DEADLINE.
+        logs.mark_sent(key)
+        observe_send_lag("DEADLINE", deadline_at)
+
+    _notify_contacts_or_defer(user_id, "Пропуск ежедневной отметки.", deadline_at)
+
+
+@celery_app.task(name="tasks.sweep_user_lifecycle")
+def sweep_user_lifecycle_task():
+    from daily_checkin.services.lifecycle import sweep_user_lifecycle
 
-    notify_contacts_last_checkin(user_id, reason="Пропуск ежедневной отметки.")
+    return sweep_user_lifecycle()
 
 
 @celery_app.task(name="tasks.unreachable_recheck")
 def unreachable_recheck(user_id: int):
+    # Only drains ETA messages queued before the lifecycle sweep replaced them.
+    from daily_checkin.services.lifecycle import UNREACHABLE_REASON
+
     with session_scope() as session:
         users = UserRepository(session)
-        states = DailyStateRepository(session)
         user = users.get_by_id(user_id)
         if not user or not user.unreachable_since:
             return
 
-        now = datetime.utcnow().replace(tzinfo=timezone.utc)
-        if user.unreachable_since + timedelta(hours=settings.unreachable_recheck_hours) > now:
+        now = utc_now()
+        recheck_at = user.unreachable_since + timedelta(hours=settings.unreachable_recheck_hours)
+        if recheck_at > now:
             return
+        user.unreachable_notified_at = now
+
+    _notify_contacts_or_defer(user_id, UNREACHABLE_REASON, recheck_at)
+
+
+def _notify_contacts_or_defer(user_id: int, reason: str, scheduled_for: datetime | None):
+    # The calling task has already committed its state change and must not run
+    # again, so a flood pause hands the escalation to a task of its own.
+    from daily_checkin.telegram.flood import FloodControlError
+
+    try:
+        notify_contacts_last_checkin(user_id, reason=reason, scheduled_for=scheduled_for)
+    except FloodControlError as exc:
+        publish(
+            "tasks.notify_contacts_last_checkin",
+            args=[user_id, reason, scheduled_for.isoformat() if scheduled_for else None],
+            eta=utc_now() + timedelta(seconds=_flood_delay(exc)),
+        )
+
+
+@celery_app.task(name="tasks.notify_contacts_last_checkin", bind=True, max_retries=None)
+def notify_contacts_last_checkin_task(
+    self, user_id: int, reason: str, scheduled_for: str | None = None
+):
+    from daily_checkin.telegram.flood import FloodControlError
 
-    notify_contacts_last_checkin(
-        user_id,
-        reason="Пользователь недоступен/возможно удалил или заблокировал бота.",
-    )
+    try:
+        notify_contacts_last_checkin(
+            user_id,
+            reason=reason,
+            scheduled_for=datetime.fromisoformat(scheduled_for) if scheduled_for else None,
+        )
+    except FloodControlError as exc:
+        raise self.retry(countdown=_flood_delay(exc))
 
 
-@celery_app.task(name="tasks.send_contact_consent_request")
-def send_contact_consent_request_task(user_id: int, contact_id: int):
-    send_contact_consent_request(user_id, contact_id)
+@celery_app.task(name="tasks.send_contact_consent_request", bind=True, max_retries=None)
+def send_contact_consent_request_task(self, user_id: int, contact_id: int):
+    from daily_checkin.telegram.flood import FloodControlError
+
+    try:
+        send_contact_consent_request(user_id, contact_id)
+    except FloodControlError as exc:
+        raise self.retry(countdown=_flood_delay(exc))
 
 
-@celery_app.task(name="tasks.send_online_status")
-def send_online_status(user_id: int, date_local: str):
-    notify_contacts_online(user_id, when_text=date_local)
+@celery_app.task(name="tasks.send_online_status", bind=True, max_retries=None)
+def send_online_status(self, user_id: int, date_local: str):
+    from daily_checkin.telegram.flood import FloodControlError
+
+    try:
+        notify_contacts_online(user_id, when_text=date_local)
+    except FloodControlError as exc:
+        raise self.retry(countdown=_flood_delay(exc))
+
 
+@celery_app.task(name="tasks.send_late_checkin_prompt", bind=True, max_retries=None)
+def send_late_checkin_prompt(self, user_id: int, date_local: str):
+    cached = state_cache.get(user_id, datetime.fromisoformat(date_local).date())
+    if cached and cached.late_prompt_response_at is not None:
+        return
 
-@celery_app.task(name="tasks.send_late_checkin_prompt")
-def send_late_checkin_prompt(user_id: int, date_local: str):
     with session_scope() as session:
         users = UserRepository(session)
         states = DailyStateRepository(session)
         logs = NotificationLogRepository(session)
-        user = users.get_by_id(user_id)
+        user = users.get_view(user_id)
         if not user:
             return
         state = states.get_state(user_id, datetime.fromisoformat(date_local).date())
@@ -185,6 +311,8 @@ def send_late_checkin_prompt(user_id: int, date_local: str):
             return
 
         from daily_checkin.telegram.bot import create_bot
+        from daily_checkin.telegram.flood import FloodControlError
+        from aiogram.exceptions import TelegramForbiddenError
         from aiogram.utils.keyboard import InlineKeyboardBuilder
         import asyncio
 
@@ -197,27 +325,47 @@ def send_late_checkin_prompt(user_id: int, date_local: str):
         )
 
         try:
-            asyncio.run(create_bot().send_message(user.tg_chat_id, text, reply_markup=kb.as_markup()))
+            bot = create_bot(enforce_flood_gate=True)
+            asyncio.run(bot.send_message(user.tg_chat_id, text, reply_markup=kb.as_markup()))
             logs.mark_sent(key)
-            states.mark_late_prompt_sent(user_id, datetime.fromisoformat(date_local).date(), datetime.utcnow())
+            states.mark_late_prompt_sent(user_id, datetime.fromisoformat(date_local).date(), utc_now())
+            users.clear_unreachable(user_id)
         except TelegramForbiddenError as exc:
             logs.mark_error(key, "FORBIDDEN", str(exc))
             _mark_unreachable(user_id)
+        except FloodControlError as exc:
+            raise self.retry(countdown=_flood_delay(exc))
         except Exception as exc:
-            logs.mark_error(key, "SEND_ERROR", str(exc))
+            payload = _retry_payload(
+                text,
+                date_local,
+                reply_markup=kb.as_markup().model_dump(exclude_none=True),
+                expires_at=add_hours(state.deadline_at_utc, settings.checkin_grace_hours),
+            )
+            logs.mark_error(key, send_error_code(exc), str(exc), payload)
+
+
+@celery_app.task(name="tasks.retry_notifications")
+def retry_notifications():
+    from daily_checkin.services.retries import retry_failed_notifications
 
+    return retry_failed_notifications()
 
-@celery_app.task(name="tasks.store_media_s3")
-def store_media_s3(checkin_id: int, file_id: str):
+
+@celery_app.task(name="tasks.store_media_s3", bind=True, max_retries=None)
+def store_media_s3(self, checkin_id: int, file_id: str):
     if not settings.store_media_in_s3:
         return
     from daily_checkin.telegram.bot import create_bot
+    from daily_checkin.telegram.flood import FloodControlError
     import asyncio
 
-    bot = create_bot()
+    bot = create_bot(enforce_flood_gate=True)
     try:
         file = asyncio.run(bot.get_file(file_id))
         file_bytes = asyncio.run(bot.download_file(file.file_path))
+    except FloodControlError as exc:
+        raise self.retry(countdown=_flood_delay(exc))
     except Exception:
         return
 
@@ -237,15 +385,9 @@ def store_media_s3(checkin_id: int, file_id: str):
 def _mark_unreachable(user_id: int):
     with session_scope() as session:
         users = UserRepository(session)
-        user = users.get_by_id(user_id)
+        user = users.get_view(user_id)
         if not user:
             return
         if user.unreachable_since:
             return
-        users.set_unreachable(user_id, datetime.utcnow().replace(tzinfo=timezone.utc))
-
-    celery_app.send_task(
-        "tasks.unreachable_recheck",
-        args=[user_id],
-        eta=datetime.utcnow().replace(tzinfo=timezone.utc) + timedelta(hours=settings.unreachable_recheck_hours),
-    )
+        users.set_unreachable(user_id, utc_now())
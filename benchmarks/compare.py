@@ -0,0 +1,65 @@
+﻿from __future__ import annotations
+
+import argparse
+import sys
+
+import orjson
+
+DEFAULT_BASELINE = "benchmarks/baseline.json"
+
+
+def compare(baseline: dict, current: dict, threshold: float, metric: str = "median") -> list[dict]:
+    rows = []
+    base_results = baseline.get("results", {})
+    for key, stats in sorted(current.get("results", {}).items()):
+        base = base_results.get(key)
+        if base is None:
+            rows.append({"key": key, "status": "NEW", "current": stats[metric]})
+            continue
+        before = base[metric]
+        after = stats[metric]
+        change = (after - before) / before if before else 0.0
+        if change > threshold:
+            status = "REGRESSION"
+        elif change < -threshold:
+            status = "IMPROVED"
+        else:
+            status = "OK"
+        rows.append(
+            {"key": key, "status": status, "baseline": before, "current": after, "change": change}
+        )
+    return rows
+
+
+def _load(path: str) -> dict:
+    with open(path, "rb") as fh:
+        return orjson.loads(fh.read())
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare benchmark results against a baseline")
+    parser.add_argument("current")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed slowdown, 0.15 = 15%%")
+    parser.add_argument("--metric", default="median", choices=["min", "median", "p95", "mean"])
+    args = parser.parse_args(argv)
+
+    rows = compare(_load(args.baseline), _load(args.current), args.threshold, args.metric)
+    for row in rows:
+        if row["status"] == "NEW":
+            print(f"{row['status']:<10} {row['key']}: {row['current']:.6f}s")
+        else:
+            print(
+                f"{row['status']:<10} {row['key']}: "
+                f"{row['baseline']:.6f}s -> {row['current']:.6f}s ({row['change']:+.1%})"
+            )
+
+    regressions = [row for row in rows if row["status"] == "REGRESSION"]
+    if regressions:
+        print(f"{len(regressions)} regression(s) over {args.threshold:.0%}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+﻿from __future__ import annotations
+
+import argparse
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+import orjson
+
+from benchmarks.compare import compare
+
+# Entry points and the heavy packages they must not load at import time.
+ENTRY_POINTS = {
+    "apps.scheduler.main": ("aiogram", "boto3", "celery", "prometheus_client", "redis"),
+    "apps.worker.main": ("aiogram", "boto3"),
+    "apps.cli.main": ("aiogram", "boto3", "celery", "prometheus_client", "sqlalchemy"),
+}
+# Absolute ceilings in seconds, about three times the committed baseline, so a
+# regression fails on any machine even without comparing against the baseline.
+IMPORT_BUDGETS = {
+    "apps.scheduler.main": 1.2,
+    "apps.worker.main": 1.5,
+    "apps.cli.main": 0.3,
+}
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "import_baseline.json")
+
+_PROBE = (
+    "import sys, time\n"
+    "started = time.perf_counter()\n"
+    "import {module}\n"
+    "elapsed = time.perf_counter() - started\n"
+    "print(elapsed)\n"
+    "print(','.join(sorted({{name.split('.')[0] for name in sys.modules}})))\n"
+)
+
+
+def probe(module: str) -> tuple[float, set[str]]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(path for path in sys.path if path)
+    env.setdefault("TELEGRAM_BOT_TOKEN", "0:bench")
+    env.setdefault("DATABASE_URL", "sqlite://")
+    env.setdefault("REDIS_URL", "redis://localhost:6379/0")
+    env.setdefault("CELERY_BROKER_URL", "memory://")
+    env.setdefault("CELERY_RESULT_BACKEND", "cache+memory://")
+    output = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(module=module)],
+        capture_output=True,
+        text=True,
+        check=True,
+        env=env,
+    ).stdout.splitlines()
+    return float(output[0]), set(output[1].split(","))
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure cold import time of the entry points")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default="bench-import.json")
+    parser.add_argument(
+        "--baseline", default=DEFAULT_BASELINE, help="fail if slower than this results file"
+    )
+    parser.add_argument("--threshold", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    failed = False
+    results = {}
+    for module, forbidden in ENTRY_POINTS.items():
+        samples = []
+        for _ in range(args.repeat):
+            elapsed, loaded = probe(module)
+            samples.append(elapsed)
+        leaked = sorted(loaded.intersection(forbidden))
+        if leaked:
+            failed = True
+            print(f"{module} imports {', '.join(leaked)} at startup", file=sys.stderr)
+        if min(samples) > IMPORT_BUDGETS[module]:
+            failed = True
+            print(f"{module} takes {min(samples):.3f}s to import", file=sys.stderr)
+        results[f"import/{module}"] = {
+            "samples": len(samples),
+            "min": min(samples),
+            "median": statistics.median(samples),
+            "max": max(samples),
+        }
+        print(f"{module}: median={results[f'import/{module}']['median']:.3f}s", file=sys.stderr)
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "results": results,
+    }
+    with open(args.output, "wb") as fh:
+        fh.write(orjson.dumps(report, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS))
+
+    if args.baseline:
+        with open(args.baseline, "rb") as fh:
+            baseline = orjson.loads(fh.read())
+        for row in compare(baseline, report, args.threshold, metric="min"):
+            if row["status"] == "REGRESSION":
+                failed = True
+                print(f"{row['key']} regressed by {row['change']:+.1%}", file=sys.stderr)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,316 @@
+﻿from __future__ import annotations
+
+import argparse
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import orjson
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+DEFAULT_SQLITE_URL = "sqlite:///bench.sqlite3"
+
+
+def _summary(samples: list[float]) -> dict:
+    ordered = sorted(samples)
+    p95_index = max(0, int(round(0.95 * len(ordered))) - 1)
+    return {
+        "samples": len(ordered),
+        "min": ordered[0],
+        "median": statistics.median(ordered),
+        "p95": ordered[p95_index],
+        "max": ordered[-1],
+        "mean": statistics.fmean(ordered),
+    }
+
+
+def _timed(fn, *args, **kwargs) -> float:
+    started = time.perf_counter()
+    fn(*args, **kwargs)
+    return time.perf_counter() - started
+
+
+class BenchContext:
+    def __init__(self, engine, n_users: int, ops: int, repeat: int, seed: int):
+        self.engine = engine
+        self.n_users = n_users
+        self.ops = ops
+        self.repeat = repeat
+        self.rng = random.Random(seed)
+        self.run_id = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+
+    def sample_user_ids(self) -> list[int]:
+        return [self.rng.randint(1, self.n_users) for _ in range(self.ops)]
+
+
+def bench_schedule_window(ctx: BenchContext) -> list[float]:
+    from daily_checkin.services.scheduler import schedule_window
+
+    return [_timed(schedule_window) for _ in range(ctx.repeat)]
+
+
+def bench_schedule_window_memory(ctx: BenchContext) -> list[float]:
+    from daily_checkin.services.scheduler import schedule_window
+
+    # Peak Python heap of one pass, in MiB; tracemalloc slows the pass down, so
+    # it is kept out of the timing case above.
+    samples = []
+    for _ in range(ctx.repeat):
+        tracemalloc.start()
+        schedule_window()
+        samples.append(tracemalloc.get_traced_memory()[1] / 2**20)
+        tracemalloc.stop()
+    return samples
+
+
+def bench_task_checkin_due(ctx: BenchContext) -> list[float]:
+    from apps.worker.main import checkin_due
+
+    # Python CPU time of the whole task body, not wall time spent waiting on the database.
+    today = datetime.now(timezone.utc).date().isoformat()
+    samples = []
+    for user_id in ctx.sample_user_ids():
+        started = time.process_time()
+        checkin_due(user_id, today)
+        samples.append(time.process_time() - started)
+    return samples
+
+
+def bench_record_checkin(ctx: BenchContext) -> list[float]:
+    from daily_checkin.db import session_scope
+    from daily_checkin.repositories import UserRepository
+    from daily_checkin.services.state_machine import record_checkin
+
+    samples = []
+    for user_id in ctx.sample_user_ids():
+        started = time.perf_counter()
+        with session_scope() as session:
+            user = UserRepository(session).get_by_id(user_id)
+            record_checkin(session, user, f"bench_{ctx.run_id}_{user_id}")
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def bench_ingest_checkin(ctx: BenchContext) -> list[float]:
+    from daily_checkin.db import session_scope
+    from daily_checkin.services.state_machine import ingest_checkin
+
+    samples = []
+    for user_id in ctx.sample_user_ids():
+        started = time.perf_counter()
+        with session_scope() as session:
+            ingest_checkin(session, 1_000_000 + user_id, f"bench_{ctx.run_id}_{user_id}")
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def bench_notify_contacts_last_checkin(ctx: BenchContext) -> list[float]:
+    from daily_checkin.services.notifications import notify_contacts_last_checkin
+
+    return [
+        _timed(notify_contacts_last_checkin, user_id, f"bench {ctx.run_id} #{i}")
+        for i, user_id in enumerate(ctx.sample_user_ids())
+    ]
+
+
+def _bench_repository_call(ctx: BenchContext, call) -> list[float]:
+    from daily_checkin.db import session_scope
+
+    samples = []
+    for user_id in ctx.sample_user_ids():
+        with session_scope() as session:
+            started = time.perf_counter()
+            call(session, user_id)
+            samples.append(time.perf_counter() - started)
+    return samples
+
+
+def bench_user_get_by_id(ctx: BenchContext) -> list[float]:
+    from daily_checkin.repositories import UserRepository
+
+    return _bench_repository_call(ctx, lambda s, uid: UserRepository(s).get_by_id(uid))
+
+
+def bench_user_get_view(ctx: BenchContext) -> list[float]:
+    from daily_checkin.repositories import UserRepository
+
+    return _bench_repository_call(ctx, lambda s, uid: UserRepository(s).get_view(uid))
+
+
+def bench_user_get_by_tg_user_id(ctx: BenchContext) -> list[float]:
+    from daily_checkin.repositories import UserRepository
+
+    return _bench_repository_call(
+        ctx, lambda s, uid: UserRepository(s).get_by_tg_user_id(1_000_000 + uid)
+    )
+
+
+def bench_state_get_state(ctx: BenchContext) -> list[float]:
+    from daily_checkin.repositories import DailyStateRepository
+
+    today = datetime.now(timezone.utc).date()
+    return _bench_repository_call(ctx, lambda s, uid: DailyStateRepository(s).get_state(uid, today))
+
+
+def bench_state_upsert_state(ctx: BenchContext) -> list[float]:
+    from daily_checkin.repositories import DailyStateRepository
+
+    now = datetime.now(timezone.utc)
+    return _bench_repository_call(
+        ctx, lambda s, uid: DailyStateRepository(s).upsert_state(uid, now.date(), now, now)
+    )
+
+
+def bench_contact_list_approved(ctx: BenchContext) -> list[float]:
+    from daily_checkin.repositories import ContactRepository
+
+    return _bench_repository_call(ctx, lambda s, uid: ContactRepository(s).list_approved(uid))
+
+
+def bench_checkin_latest_for_user(ctx: BenchContext) -> list[float]:
+    from daily_checkin.repositories import CheckinRepository
+
+    return _bench_repository_call(ctx, lambda s, uid: CheckinRepository(s).latest_for_user(uid))
+
+
+def bench_notification_log_try_insert(ctx: BenchContext) -> list[float]:
+    from daily_checkin.repositories import NotificationLogRepository
+
+    return _bench_repository_call(
+        ctx,
+        lambda s, uid: NotificationLogRepository(s).try_insert(
+            f"bench:{ctx.run_id}:{uid}:{ctx.rng.random()}", "BENCH", uid, uid
+        ),
+    )
+
+
+def bench_broker_publish(ctx: BenchContext) -> list[float]:
+    from daily_checkin.celery_app import publish
+
+    return [_timed(publish, "bench.noop", args=[user_id]) for user_id in ctx.sample_user_ids()]
+
+
+def bench_broker_publish_many(ctx: BenchContext) -> list[float]:
+    from daily_checkin.celery_app import TaskMessage, publish_many
+
+    messages = [TaskMessage("bench.noop", [user_id]) for user_id in ctx.sample_user_ids()]
+    # Reported per message so it is directly comparable with broker.publish.
+    return [_timed(publish_many, messages) / len(messages) for _ in range(ctx.repeat)]
+
+
+BROKER_CASES = {
+    "broker.publish": bench_broker_publish,
+    "broker.publish_many": bench_broker_publish_many,
+}
+
+CASES = {
+    "schedule_window": bench_schedule_window,
+    "schedule_window.peak_mib": bench_schedule_window_memory,
+    "task.checkin_due.cpu": bench_task_checkin_due,
+    "record_checkin": bench_record_checkin,
+    "ingest_checkin": bench_ingest_checkin,
+    "notify_contacts_last_checkin": bench_notify_contacts_last_checkin,
+    "repo.user.get_by_id": bench_user_get_by_id,
+    "repo.user.get_view": bench_user_get_view,
+    "repo.user.get_by_tg_user_id": bench_user_get_by_tg_user_id,
+    "repo.state.get_state": bench_state_get_state,
+    "repo.state.upsert_state": bench_state_upsert_state,
+    "repo.contact.list_approved": bench_contact_list_approved,
+    "repo.checkin.latest_for_user": bench_checkin_latest_for_user,
+    "repo.notification_log.try_insert": bench_notification_log_try_insert,
+}
+
+
+def _prepare_environment(database_url: str) -> None:
+    # Settings are read at import time, so the target database has to be in the
+    # environment before anything from daily_checkin.db is imported.
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:bench")
+    os.environ.setdefault("REDIS_URL", "redis://localhost:6379/0")
+    os.environ.setdefault("CELERY_BROKER_URL", "memory://")
+    os.environ.setdefault("CELERY_RESULT_BACKEND", "cache+memory://")
+
+
+def _isolate_side_effects(use_broker: bool) -> None:
+    # Only the database work is measured: Telegram calls are no-ops and, unless
+    # --broker is given, task publishing is dropped.
+    from daily_checkin.celery_app import set_message_sink
+    from daily_checkin.services import notifications
+
+    async def _no_send(*args, **kwargs):
+        return None
+
+    notifications._send_message = _no_send
+    notifications._send_photo = _no_send
+
+    if not use_broker:
+        set_message_sink(lambda messages: None)
+
+
+def run(args) -> dict:
+    _prepare_environment(args.database_url)
+
+    from sqlalchemy import __version__ as sqlalchemy_version
+
+    from benchmarks.seed import reset_schema, seed_users
+    from daily_checkin.db import engine
+
+    _isolate_side_effects(args.broker)
+
+    cases = dict(CASES)
+    if args.broker:
+        cases.update(BROKER_CASES)
+    selected = args.cases or list(cases)
+    results = {}
+    for n_users in args.users:
+        print(f"[{engine.dialect.name}] seeding {n_users} users", file=sys.stderr)
+        reset_schema(engine)
+        seed_users(engine, n_users)
+        for name in selected:
+            ctx = BenchContext(engine, n_users, args.ops, args.repeat, args.seed)
+            samples = cases[name](ctx)
+            key = f"{engine.dialect.name}/{n_users}/{name}"
+            results[key] = _summary(samples)
+            print(f"{key}: median={results[key]['median']:.6f}", file=sys.stderr)
+
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "sqlalchemy": sqlalchemy_version,
+        "database": engine.dialect.name,
+        "ops": args.ops,
+        "repeat": args.repeat,
+        "results": results,
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the core service paths")
+    parser.add_argument("--database-url", default=DEFAULT_SQLITE_URL)
+    parser.add_argument("--users", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--cases", nargs="+", choices=sorted({**CASES, **BROKER_CASES}))
+    parser.add_argument("--ops", type=int, default=500, help="samples per per-call case")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of schedule_window")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--broker", action="store_true", help="publish to the real broker")
+    parser.add_argument("--output", default="bench-results.json")
+    args = parser.parse_args(argv)
+    # Without --broker publishing goes to a no-op sink, so these would measure nothing.
+    if not args.broker and set(args.cases or ()) & BROKER_CASES.keys():
+        parser.error("broker.* cases require --broker")
+
+    report = run(args)
+    with open(args.output, "wb") as fh:
+        fh.write(orjson.dumps(report, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS))
+    print(f"results written to {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
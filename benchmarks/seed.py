@@ -0,0 +1,76 @@
+﻿from __future__ import annotations
+
+import random
+from datetime import datetime, time, timedelta, timezone
+
+from sqlalchemy import insert
+
+from daily_checkin.models import Base, Checkin, ContactStatus, TrustedContact, User, UserStatus
+
+TIMEZONES = [
+    "UTC",
+    "Europe/Moscow",
+    "Europe/Berlin",
+    "Europe/London",
+    "Asia/Yekaterinburg",
+    "Asia/Novosibirsk",
+    "Asia/Vladivostok",
+    "Asia/Tokyo",
+    "America/New_York",
+    "America/Los_Angeles",
+    "Australia/Sydney",
+    "Asia/Kolkata",
+]
+
+CHUNK_SIZE = 10_000
+
+
+def reset_schema(engine):
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+
+
+def seed_users(engine, n_users: int, contacts_per_user: int = 2, seed: int = 42) -> None:
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+
+    with engine.begin() as conn:
+        for start in range(0, n_users, CHUNK_SIZE):
+            stop = min(start + CHUNK_SIZE, n_users)
+            users = []
+            contacts = []
+            checkins = []
+            for i in range(start, stop):
+                user_id = i + 1
+                users.append(
+                    {
+                        "id": user_id,
+                        "tg_user_id": 1_000_000 + user_id,
+                        "tg_chat_id": 1_000_000 + user_id,
+                        "timezone": TIMEZONES[i % len(TIMEZONES)],
+                        "checkin_time_local": time(rng.randint(6, 11), rng.choice((0, 15, 30, 45))),
+                        "status": UserStatus.ACTIVE,
+                    }
+                )
+                for c in range(contacts_per_user):
+                    contacts.append(
+                        {
+                            "user_id": user_id,
+                            "contact_tg_user_id": 50_000_000 + user_id * 10 + c,
+                            "contact_chat_id": 50_000_000 + user_id * 10 + c,
+                            "status": ContactStatus.APPROVED,
+                        }
+                    )
+                checkins.append(
+                    {
+                        "user_id": user_id,
+                        "date_local": (now - timedelta(days=1)).date(),
+                        "created_at": now - timedelta(days=1),
+                        "photo_file_id": f"seed_{user_id}",
+                        "is_late": False,
+                    }
+                )
+            conn.execute(insert(User), users)
+            if contacts:
+                conn.execute(insert(TrustedContact), contacts)
+            conn.execute(insert(Checkin), checkins)
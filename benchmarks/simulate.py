@@ -0,0 +1,454 @@
+﻿from __future__ import annotations
+
+import argparse
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import orjson
+
+from benchmarks.run import _prepare_environment
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SQLITE_URL = "sqlite:///simulation.sqlite3"
+
+# Share of users per behaviour; the rest never check in.
+PROFILES = (
+    ("on_time", 0.70),
+    ("after_reminder", 0.12),
+    ("late", 0.06),
+    ("paused", 0.03),
+)
+CONTACT_CHAT_ID_FROM = 50_000_000
+
+
+class VirtualClock:
+    def __init__(self, now: datetime):
+        self.now = now
+
+    def __call__(self) -> datetime:
+        return self.now
+
+
+class FakeBot:
+    # Stands in for aiogram's Bot everywhere the services create one.
+    def __init__(self, simulation: Simulation):
+        self.simulation = simulation
+        self.session = SimpleNamespace(close=self._close)
+
+    async def _close(self):
+        return None
+
+    async def send_message(self, chat_id, text, reply_markup=None, **kwargs):
+        self.simulation.on_send(chat_id, reply_markup)
+
+    async def send_photo(self, chat_id, photo, caption=None, **kwargs):
+        self.simulation.on_send(chat_id, None)
+
+
+class FakeMessage:
+    def __init__(self, simulation: Simulation, tg_user_id: int, text: str = "", photo_file_id=None):
+        self.simulation = simulation
+        self.from_user = SimpleNamespace(id=tg_user_id)
+        self.chat = SimpleNamespace(id=tg_user_id)
+        self.text = text
+        self.photo = [SimpleNamespace(file_id=photo_file_id)] if photo_file_id else None
+
+    async def answer(self, text, **kwargs):
+        self.simulation._count(self.simulation.sends, "reply")
+
+
+class FakeCallback:
+    def __init__(self, simulation: Simulation, tg_user_id: int, data: str):
+        self.from_user = SimpleNamespace(id=tg_user_id)
+        self.message = FakeMessage(simulation, tg_user_id)
+        self.data = data
+
+    async def answer(self, *args, **kwargs):
+        return None
+
+
+class Simulation:
+    # One event heap on virtual time: broker messages by ETA, periodic jobs and
+    # the actions of simulated users. Every event runs in-process to completion.
+
+    def __init__(
+        self,
+        start: datetime,
+        hours: int,
+        scheduler: str,
+        schedule_every: int,
+        seed: int,
+        warmup_hours: int = 12,
+    ):
+        from daily_checkin.utils_time import combine_local_to_utc
+
+        self._combine = combine_local_to_utc
+        # Nothing is counted during the warm-up: it only lets the scheduler and the
+        # days already in progress at `start` reach a steady state.
+        self.origin = start - timedelta(hours=warmup_hours)
+        self.clock = VirtualClock(self.origin)
+        self.start = start
+        self.end = start + timedelta(hours=hours)
+        self.scheduler = scheduler
+        self.schedule_every = timedelta(minutes=schedule_every)
+        self.rng = random.Random(seed)
+        self._events: list = []
+        self._seq = itertools.count()
+        self.activity = "setup"
+        self.queries: Counter = Counter()
+        self.published: Counter = Counter()
+        self.sends: Counter = Counter()
+        self.actions: Counter = Counter()
+        self.task_errors: Counter = Counter()
+        self.profiles: dict[int, str] = {}
+        self._planned_until: dict[int, datetime] = {}
+        self.user_days = 0
+        self._due_index = None
+
+    @property
+    def counting(self) -> bool:
+        return self.clock.now >= self.start
+
+    def at(self, when: datetime, label: str, fn, *args) -> None:
+        heapq.heappush(self._events, (max(when, self.clock.now), next(self._seq), label, fn, args))
+
+    # Message sink: everything the services publish lands here instead of Celery.
+    def publish(self, messages) -> None:
+        from daily_checkin.utils_time import ensure_utc
+
+        for message in messages:
+            if self.counting:
+                self.published[message.name] += 1
+            eta = ensure_utc(message.eta) if message.eta else self.clock.now
+            self.at(eta, message.name, self._run_task, message)
+
+    def count_query(self, *args) -> None:
+        if self.counting:
+            self.queries[self.activity] += 1
+
+    def _run_task(self, message) -> None:
+        from daily_checkin.celery_app import get_celery_app
+
+        task = get_celery_app().tasks[message.name]
+        try:
+            task(*message.args, **(message.kwargs or {}))
+        except Exception:
+            self.task_errors[message.name] += 1
+            logger.exception("task %s failed", message.name)
+
+    def _count(self, counter: Counter, key: str) -> None:
+        if self.counting:
+            counter[key] += 1
+
+    def on_send(self, chat_id: int, reply_markup) -> None:
+        if chat_id >= CONTACT_CHAT_ID_FROM:
+            self._count(self.sends, "contact")
+            return
+        if reply_markup is not None:
+            self._count(self.sends, "late_prompt")
+            date_local = reply_markup.inline_keyboard[0][0].callback_data.rsplit(":", 1)[1]
+            if self.profiles.get(chat_id) == "late":
+                when = self.clock.now + timedelta(minutes=self.rng.uniform(1, 10))
+                self.at(when, "handler.late_notify", self._late_answer, chat_id, date_local)
+            return
+        self._count(self.sends, "reminder")
+        if self.profiles.get(chat_id) != "after_reminder":
+            return
+        # Each reminder of the day gets a chance until one of them works.
+        planned = self._planned_until.get(chat_id)
+        if planned is not None and planned > self.clock.now - timedelta(hours=12):
+            return
+        if self.rng.random() < 0.6:
+            when = self.clock.now + timedelta(minutes=self.rng.uniform(1, 10))
+            self._plan_checkin(chat_id, when)
+
+    def _plan_checkin(self, tg_user_id: int, when: datetime) -> None:
+        self._planned_until[tg_user_id] = when
+        self.at(when, "handler.checkin_photo", self._checkin, tg_user_id)
+
+    def _checkin(self, tg_user_id: int) -> None:
+        from daily_checkin.telegram.handlers import checkin_photo
+
+        self._count(self.actions, "checkin")
+        file_id = f"sim_{tg_user_id}_{next(self._seq)}"
+        asyncio.run(checkin_photo(FakeMessage(self, tg_user_id, photo_file_id=file_id)))
+        self._relay()
+
+    def _late_answer(self, tg_user_id: int, date_local: str) -> None:
+        from daily_checkin.telegram.handlers import late_notify_callback
+
+        self._count(self.actions, "late_answer")
+        callback = FakeCallback(self, tg_user_id, f"late_notify:yes:{date_local}")
+        asyncio.run(late_notify_callback(callback))
+        self._relay()
+
+    def _pause(self, tg_user_id: int) -> None:
+        from daily_checkin.telegram.handlers import pause_cmd
+
+        self._count(self.actions, "pause")
+        asyncio.run(pause_cmd(FakeMessage(self, tg_user_id, text="/pause 1d")))
+
+    def _relay(self) -> None:
+        # The relay is modelled as picking rows up right after the transaction
+        # that wrote them instead of polling every OUTBOX_POLL_INTERVAL_SECONDS.
+        from daily_checkin.config import settings
+        from daily_checkin.services.outbox import relay_batch
+
+        while relay_batch() == settings.outbox_batch_size:
+            pass
+
+    def _schedule_window(self) -> None:
+        from daily_checkin.services.scheduler import schedule_window
+
+        schedule_window()
+        self.at(self.clock.now + self.schedule_every, "scheduler", self._schedule_window)
+
+    def _schedule_minute(self) -> None:
+        from daily_checkin.services.scheduler import load_due_index, schedule_due_minute
+
+        minute = self.clock.now
+        if self._due_index is None:
+            self._due_index = load_due_index(minute)
+        self._due_index.refresh_offsets(minute)
+        schedule_due_minute(self._due_index, minute)
+        self.at(minute + timedelta(minutes=1), "scheduler", self._schedule_minute)
+
+    def _every(self, seconds: float, fn) -> None:
+        fn()
+        next_run = self.clock.now + timedelta(seconds=seconds)
+        self.at(next_run, self.activity, self._every, seconds, fn)
+
+    def plan_users(self, users) -> None:
+        # Decides up front what every user does on each day that falls due in
+        # the simulated period.
+        weights = [share for _, share in PROFILES]
+        names = [name for name, _ in PROFILES]
+        for user in users:
+            roll = self.rng.random()
+            profile = "silent"
+            for name, share in zip(names, itertools.accumulate(weights)):
+                if roll < share:
+                    profile = name
+                    break
+            self.profiles[user.tg_chat_id] = profile
+            if profile == "paused":
+                when = self.origin + timedelta(minutes=self.rng.uniform(0, 120))
+                self.at(when, "handler.pause", self._pause, user.tg_user_id)
+
+            for due_at in self._due_times(user):
+                self.user_days += due_at >= self.start
+                if profile == "on_time":
+                    delay = self.rng.uniform(0, 25)
+                elif profile == "late":
+                    delay = self.rng.uniform(100, 300)
+                else:
+                    continue
+                self._plan_checkin(user.tg_user_id, due_at + timedelta(minutes=delay))
+
+    def _due_times(self, user):
+        day = (self.origin - timedelta(days=1)).date()
+        while True:
+            due_at = self._combine(user.timezone, day, user.checkin_time_local)
+            if due_at >= self.end:
+                return
+            if due_at >= self.origin:
+                yield due_at
+            day += timedelta(days=1)
+
+    def run(self) -> None:
+        from daily_checkin.config import settings
+        from daily_checkin.services.lifecycle import sweep_user_lifecycle
+        from daily_checkin.services.retries import retry_failed_notifications
+
+        if self.scheduler == "loop":
+            self.at(self.origin, "scheduler", self._schedule_minute)
+        else:
+            self.at(self.origin, "scheduler", self._schedule_window)
+        self.at(
+            self.origin,
+            "tasks.retry_notifications",
+            self._every,
+            settings.notification_retry_interval_seconds,
+            retry_failed_notifications,
+        )
+
+        def sweep():
+            sweep_user_lifecycle()
+            self._relay()
+
+        self.at(
+            self.origin,
+            "tasks.sweep_user_lifecycle",
+            self._every,
+            settings.lifecycle_sweep_interval_seconds,
+            sweep,
+        )
+
+        while self._events and self._events[0][0] < self.end:
+            when, _, label, fn, args = heapq.heappop(self._events)
+            self.clock.now = when
+            self.activity = label
+            fn(*args)
+        self.activity = "report"
+
+
+def _outcomes(start: datetime, end: datetime) -> dict[str, int]:
+    from sqlalchemy import func, select
+
+    from daily_checkin.db import session_scope
+    from daily_checkin.models import DailyState
+
+    with session_scope() as session:
+        rows = session.execute(
+            select(DailyState.state, func.count())
+            .where(DailyState.due_at_utc >= start, DailyState.due_at_utc < end)
+            .group_by(DailyState.state)
+        ).all()
+    return {getattr(state, "value", state): count for state, count in rows}
+
+
+def simulate(
+    start: datetime,
+    hours: int,
+    scheduler: str = "window",
+    schedule_every: int = 60,
+    seed: int = 42,
+    warmup_hours: int = 12,
+) -> dict:
+    # Runs against the already seeded DATABASE_URL; the worker tasks, handlers and
+    # services are the production ones, only the clock, broker and bot are swapped.
+    from sqlalchemy import event, select
+
+    import apps.worker.main  # noqa: F401  registers the Celery tasks
+    from daily_checkin import db, utils_time
+    from daily_checkin.celery_app import set_message_sink
+    from daily_checkin.config import settings
+    from daily_checkin.models import User
+    from daily_checkin.services import notifications
+    from daily_checkin.telegram import bot as telegram_bot
+
+    simulation = Simulation(start, hours, scheduler, schedule_every, seed, warmup_hours)
+    fake_bot = FakeBot(simulation)
+    overrides = {
+        "daily_state_cache_enabled": False,
+        "store_media_in_s3": False,
+    }
+    saved_settings = {name: getattr(settings, name) for name in overrides}
+    saved_bots = (telegram_bot.create_bot, notifications._create_bot)
+
+    with db.session_scope() as session:
+        users = session.execute(
+            select(User.tg_user_id, User.tg_chat_id, User.timezone, User.checkin_time_local)
+        ).all()
+    simulation.plan_users(users)
+
+    engine = db.get_engine()
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+    telegram_bot.create_bot = lambda enforce_flood_gate=False: fake_bot
+    notifications._create_bot = lambda: fake_bot
+    utils_time.set_clock(simulation.clock)
+    set_message_sink(simulation.publish)
+    event.listen(engine, "before_cursor_execute", simulation.count_query)
+    started = time.perf_counter()
+    try:
+        simulation.run()
+    finally:
+        elapsed = time.perf_counter() - started
+        event.remove(engine, "before_cursor_execute", simulation.count_query)
+        set_message_sink(None)
+        utils_time.set_clock(None)
+        telegram_bot.create_bot, notifications._create_bot = saved_bots
+        for name, value in saved_settings.items():
+            setattr(settings, name, value)
+
+    user_days = max(simulation.user_days, 1)
+    totals = {
+        "queries": sum(simulation.queries.values()),
+        "broker_messages": sum(simulation.published.values()),
+        "sends": sum(count for kind, count in simulation.sends.items() if kind != "reply"),
+    }
+    return {
+        "database": engine.dialect.name,
+        "users": len(users),
+        "hours": hours,
+        "warmup_hours": warmup_hours,
+        "scheduler": scheduler,
+        "user_days": simulation.user_days,
+        "wall_seconds": elapsed,
+        **totals,
+        "per_user_day": {name: value / user_days for name, value in totals.items()},
+        "queries_by_activity": dict(simulation.queries.most_common()),
+        "broker_messages_by_task": dict(simulation.published.most_common()),
+        "sends_by_kind": dict(simulation.sends.most_common()),
+        "actions": dict(simulation.actions),
+        "task_errors": dict(simulation.task_errors),
+        "outcomes": _outcomes(start, simulation.end),
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay simulated days on a virtual clock")
+    parser.add_argument("--database-url", default=DEFAULT_SQLITE_URL)
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--hours", type=int, default=24)
+    parser.add_argument(
+        "--start",
+        type=datetime.fromisoformat,
+        help="UTC start of the simulated period, next midnight by default",
+    )
+    parser.add_argument("--scheduler", choices=("window", "loop"), default="window")
+    parser.add_argument(
+        "--schedule-every", type=int, default=60, help="minutes between schedule_window runs"
+    )
+    parser.add_argument("--warmup-hours", type=int, default=12, help="simulated but not counted")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="simulation-results.json")
+    args = parser.parse_args(argv)
+
+    _prepare_environment(args.database_url)
+    logging.basicConfig(level=logging.WARNING)
+
+    from benchmarks.seed import reset_schema, seed_users
+    from daily_checkin.db import get_engine
+
+    start = args.start
+    if start is None:
+        start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        start += timedelta(days=1)
+    elif start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+
+    engine = get_engine()
+    print(f"[{engine.dialect.name}] seeding {args.users} users", file=sys.stderr)
+    reset_schema(engine)
+    seed_users(engine, args.users, seed=args.seed)
+
+    report = simulate(
+        start, args.hours, args.scheduler, args.schedule_every, args.seed, args.warmup_hours
+    )
+    per_user_day = report["per_user_day"]
+    print(
+        f"{report['user_days']} user-days in {report['wall_seconds']:.1f}s: "
+        f"{per_user_day['queries']:.1f} queries, "
+        f"{per_user_day['broker_messages']:.1f} broker messages, "
+        f"{per_user_day['sends']:.2f} sends per user-day",
+        file=sys.stderr,
+    )
+    with open(args.output, "wb") as fh:
+        fh.write(orjson.dumps(report, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS))
+    print(f"results written to {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
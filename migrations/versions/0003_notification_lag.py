@@ -0,0 +1,15 @@
+﻿from alembic import op
+import sqlalchemy as sa
+
+revision = "0003_notification_lag"
+down_revision = "0002_late_prompt"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("notification_log", sa.Column("scheduled_for", sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade():
+    op.drop_column("notification_log", "scheduled_for")
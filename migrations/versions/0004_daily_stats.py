@@ -0,0 +1,23 @@
+﻿from alembic import op
+import sqlalchemy as sa
+
+revision = "0004_daily_stats"
+down_revision = "0003_notification_lag"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "daily_stats",
+        sa.Column("date_local", sa.Date, primary_key=True),
+        sa.Column("timezone", sa.String(length=64), primary_key=True),
+        sa.Column("done_count", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("missed_count", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("late_count", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("escalation_count", sa.Integer, nullable=False, server_default="0"),
+    )
+
+
+def downgrade():
+    op.drop_table("daily_stats")
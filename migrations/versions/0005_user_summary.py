@@ -0,0 +1,26 @@
+﻿from alembic import op
+import sqlalchemy as sa
+
+revision = "0005_user_summary"
+down_revision = "0004_daily_stats"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "user_summary",
+        sa.Column("user_id", sa.Integer, sa.ForeignKey("users.id"), primary_key=True),
+        sa.Column("current_streak", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("best_streak", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("total_done", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("total_missed", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("last_done_date", sa.Date, nullable=True),
+        sa.Column("history_end", sa.Date, nullable=True),
+        sa.Column("done_bits", sa.BigInteger, nullable=False, server_default="0"),
+        sa.Column("missed_bits", sa.BigInteger, nullable=False, server_default="0"),
+    )
+
+
+def downgrade():
+    op.drop_table("user_summary")
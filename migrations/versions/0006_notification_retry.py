@@ -0,0 +1,27 @@
+﻿from alembic import op
+import sqlalchemy as sa
+
+revision = "0006_notification_retry"
+down_revision = "0005_user_summary"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "notification_log", sa.Column("attempts", sa.Integer, nullable=False, server_default="0")
+    )
+    op.add_column(
+        "notification_log", sa.Column("next_attempt_at", sa.DateTime(timezone=True), nullable=True)
+    )
+    op.add_column("notification_log", sa.Column("payload", sa.JSON, nullable=True))
+    op.create_index(
+        "ix_notification_log_retry", "notification_log", ["status", "next_attempt_at"]
+    )
+
+
+def downgrade():
+    op.drop_index("ix_notification_log_retry", table_name="notification_log")
+    op.drop_column("notification_log", "payload")
+    op.drop_column("notification_log", "next_attempt_at")
+    op.drop_column("notification_log", "attempts")
@@ -0,0 +1,23 @@
+﻿from alembic import op
+import sqlalchemy as sa
+
+revision = "0007_task_outbox"
+down_revision = "0006_notification_retry"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "task_outbox",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("task_name", sa.String(128), nullable=False),
+        sa.Column("args", sa.JSON, nullable=False),
+        sa.Column("kwargs", sa.JSON, nullable=True),
+        sa.Column("eta", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+
+
+def downgrade():
+    op.drop_table("task_outbox")
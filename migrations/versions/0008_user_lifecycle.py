@@ -0,0 +1,26 @@
+﻿from alembic import op
+import sqlalchemy as sa
+
+revision = "0008_user_lifecycle"
+down_revision = "0007_task_outbox"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "users", sa.Column("unreachable_notified_at", sa.DateTime(timezone=True), nullable=True)
+    )
+    # Already-unreachable users were (or are about to be) handled by their per-user
+    # recheck message; the sweeper must not notify their contacts a second time.
+    op.execute(
+        "UPDATE users SET unreachable_notified_at = unreachable_since WHERE unreachable_since IS NOT NULL"
+    )
+    op.create_index("ix_users_pause_until", "users", ["pause_until"])
+    op.create_index("ix_users_unreachable_since", "users", ["unreachable_since"])
+
+
+def downgrade():
+    op.drop_index("ix_users_unreachable_since", table_name="users")
+    op.drop_index("ix_users_pause_until", table_name="users")
+    op.drop_column("users", "unreachable_notified_at")
@@ -0,0 +1,34 @@
+﻿from alembic import op
+import sqlalchemy as sa
+
+revision = "0009_broadcasts"
+down_revision = "0008_user_lifecycle"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "broadcasts",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("text", sa.Text, nullable=False),
+        sa.Column("status", sa.String(32), nullable=False),
+        sa.Column("last_user_id", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("sent_count", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("failed_count", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("finished_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_table(
+        "broadcast_deliveries",
+        sa.Column("broadcast_id", sa.Integer, sa.ForeignKey("broadcasts.id"), primary_key=True),
+        sa.Column("user_id", sa.Integer, primary_key=True),
+        sa.Column("status", sa.String(32), nullable=False),
+        sa.Column("error_code", sa.String(64), nullable=True),
+        sa.Column("sent_at", sa.DateTime(timezone=True), nullable=True),
+    )
+
+
+def downgrade():
+    op.drop_table("broadcast_deliveries")
+    op.drop_table("broadcasts")
@@ -0,0 +1,15 @@
+﻿from alembic import op
+import sqlalchemy as sa
+
+revision = "0010_daily_state_version"
+down_revision = "0009_broadcasts"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("daily_state", sa.Column("version", sa.Integer(), nullable=False, server_default="0"))
+
+
+def downgrade():
+    op.drop_column("daily_state", "version")
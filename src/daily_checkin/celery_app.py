@@ -0,0 +1,115 @@
+﻿from __future__ import annotations
+
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+from typing import Callable, Iterable, NamedTuple
+
+from .config import settings
+
+
+class TaskMessage(NamedTuple):
+    name: str
+    args: tuple | list = ()
+    kwargs: dict | None = None
+    eta: datetime | None = None
+
+
+# Replaces the broker entirely when set (simulation and benchmarks).
+_message_sink: Callable[[list[TaskMessage]], None] | None = None
+
+
+@lru_cache(maxsize=1)
+def get_celery_app():
+    from celery import Celery
+
+    app = Celery(
+        "daily_checkin",
+        broker=settings.celery_broker_url,
+        backend=settings.celery_result_backend,
+    )
+    app.conf.enable_utc = True
+    app.conf.timezone = "UTC"
+    app.conf.broker_pool_limit = settings.celery_broker_pool_limit
+    app.conf.beat_schedule = {
+        "retry-notifications": {
+            "task": "tasks.retry_notifications",
+            "schedule": settings.notification_retry_interval_seconds,
+        },
+        "sweep-user-lifecycle": {
+            "task": "tasks.sweep_user_lifecycle",
+            "schedule": settings.lifecycle_sweep_interval_seconds,
+        },
+    }
+    return app
+
+
+def __getattr__(name: str):
+    if name == "celery_app":
+        return get_celery_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def set_message_sink(sink: Callable[[list[TaskMessage]], None] | None) -> None:
+    global _message_sink
+    _message_sink = sink
+
+
+@contextmanager
+def _redis_pipeline(producer):
+    # kombu's Redis channel issues one LPUSH round trip per message through
+    # conn_or_acquire(); routing it to a pipeline batches them into one write.
+    # Both hooks are kombu internals: without them messages go out one by one.
+    channel = producer.channel
+    if (
+        producer.connection.transport.driver_type != "redis"
+        or not callable(getattr(channel, "_create_client", None))
+        or not callable(getattr(channel, "conn_or_acquire", None))
+    ):
+        yield None
+        return
+    pipe = channel._create_client().pipeline(transaction=False)
+    missing = object()
+    original = vars(channel).get("conn_or_acquire", missing)
+
+    @contextmanager
+    def conn_or_acquire(client=None):
+        yield client or pipe
+
+    channel.conn_or_acquire = conn_or_acquire
+    try:
+        yield pipe
+        pipe.execute()
+    finally:
+        if original is missing:
+            del channel.conn_or_acquire
+        else:
+            channel.conn_or_acquire = original
+
+
+def publish_many(messages: Iterable[TaskMessage]) -> int:
+    if _message_sink is not None:
+        batch = list(messages)
+        _message_sink(batch)
+        return len(batch)
+
+    app = get_celery_app()
+    batch_size = settings.celery_publish_batch_size
+    count = 0
+    with app.producer_or_acquire() as producer, _redis_pipeline(producer) as pipe:
+        for message in messages:
+            app.send_task(
+                message.name,
+                args=message.args,
+                kwargs=message.kwargs,
+                eta=message.eta,
+                producer=producer,
+            )
+            count += 1
+            if pipe is not None and count % batch_size == 0:
+                pipe.execute()
+    return count
+
+
+def publish(name: str, args=(), kwargs=None, eta: datetime | None = None) -> None:
+    publish_many([TaskMessage(name, args, kwargs, eta)])
@@ -1,5 +1,7 @@
 ﻿from __future__ import annotations
 
+from functools import lru_cache
+
 from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -17,11 +19,36 @@ class Settings(BaseSettings):
 
     # Database
     database_url: str = Field(alias="DATABASE_URL")
+    database_replica_url: str | None = Field(default=None, alias="DATABASE_REPLICA_URL")
+    db_replica_max_lag_seconds: float = Field(default=10.0, alias="DB_REPLICA_MAX_LAG_SECONDS")
+    db_replica_check_interval_seconds: float = Field(
+        default=5.0, alias="DB_REPLICA_CHECK_INTERVAL_SECONDS"
+    )
+    process_role: str = Field(default="api", alias="PROCESS_ROLE")
+    db_pgbouncer: bool = Field(default=False, alias="DB_PGBOUNCER")
+    db_pool_recycle: int = Field(default=1800, alias="DB_POOL_RECYCLE")
+    db_pool_size_api: int = Field(default=5, alias="DB_POOL_SIZE_API")
+    db_max_overflow_api: int = Field(default=5, alias="DB_MAX_OVERFLOW_API")
+    db_pool_timeout_api: int = Field(default=10, alias="DB_POOL_TIMEOUT_API")
+    db_pool_size_worker: int = Field(default=2, alias="DB_POOL_SIZE_WORKER")
+    db_max_overflow_worker: int = Field(default=1, alias="DB_MAX_OVERFLOW_WORKER")
+    db_pool_timeout_worker: int = Field(default=30, alias="DB_POOL_TIMEOUT_WORKER")
+    db_pool_size_scheduler: int = Field(default=1, alias="DB_POOL_SIZE_SCHEDULER")
+    db_max_overflow_scheduler: int = Field(default=0, alias="DB_MAX_OVERFLOW_SCHEDULER")
+    db_pool_timeout_scheduler: int = Field(default=60, alias="DB_POOL_TIMEOUT_SCHEDULER")
 
     # Redis / Celery
     redis_url: str = Field(alias="REDIS_URL")
+    polling_leader_ttl_seconds: int = Field(default=30, alias="POLLING_LEADER_TTL_SECONDS")
+    update_dedup_ttl_seconds: int = Field(default=86400, alias="UPDATE_DEDUP_TTL_SECONDS")
+    update_lanes: int = Field(default=16, alias="UPDATE_LANES")
+    update_lane_queue_size: int = Field(default=100, alias="UPDATE_LANE_QUEUE_SIZE")
     celery_broker_url: str = Field(alias="CELERY_BROKER_URL")
     celery_result_backend: str = Field(alias="CELERY_RESULT_BACKEND")
+    celery_broker_pool_limit: int = Field(default=10, alias="CELERY_BROKER_POOL_LIMIT")
+    celery_publish_batch_size: int = Field(default=500, alias="CELERY_PUBLISH_BATCH_SIZE")
+    outbox_batch_size: int = Field(default=500, alias="OUTBOX_BATCH_SIZE")
+    outbox_poll_interval_seconds: float = Field(default=0.5, alias="OUTBOX_POLL_INTERVAL_SECONDS")
 
     # S3 storage (optional)
     store_media_in_s3: bool = Field(default=False, alias="STORE_MEDIA_IN_S3")
@@ -30,14 +57,68 @@ class Settings(BaseSettings):
     s3_access_key: str | None = Field(default=None, alias="S3_ACCESS_KEY")
     s3_secret_key: str | None = Field(default=None, alias="S3_SECRET_KEY")
 
+    # Today's/tomorrow's DailyState mirrored in Redis
+    daily_state_cache_enabled: bool = Field(default=True, alias="DAILY_STATE_CACHE_ENABLED")
+    daily_state_cache_ttl_seconds: int = Field(default=172800, alias="DAILY_STATE_CACHE_TTL_SECONDS")
+
     # Scheduling
     checkin_grace_hours: int = Field(default=6, alias="CHECKIN_GRACE_HOURS")
     scheduler_window_hours: int = Field(default=36, alias="SCHEDULER_WINDOW_HOURS")
+    due_index_lead_seconds: int = Field(default=30, alias="DUE_INDEX_LEAD_SECONDS")
+    due_index_rebuild_minutes: int = Field(default=60, alias="DUE_INDEX_REBUILD_MINUTES")
     retention_days: int = Field(default=7, alias="RETENTION_DAYS")
+    export_batch_size: int = Field(default=5000, alias="EXPORT_BATCH_SIZE")
     unreachable_recheck_hours: int = Field(default=12, alias="UNREACHABLE_RECHECK_HOURS")
+    lifecycle_sweep_interval_seconds: int = Field(default=300, alias="LIFECYCLE_SWEEP_INTERVAL_SECONDS")
+    lifecycle_sweep_batch_size: int = Field(default=1000, alias="LIFECYCLE_SWEEP_BATCH_SIZE")
 
     # Rate limiting
     telegram_rate_limit_per_sec: int = Field(default=25, alias="TG_RATE_LIMIT_PER_SEC")
+    flood_retry_jitter_seconds: float = Field(default=1.0, alias="TG_FLOOD_RETRY_JITTER_SECONDS")
+    broadcast_page_size: int = Field(default=500, alias="BROADCAST_PAGE_SIZE")
+    broadcast_concurrency: int = Field(default=25, alias="BROADCAST_CONCURRENCY")
+
+    # Retries of failed notifications
+    notification_retry_interval_seconds: int = Field(
+        default=60, alias="NOTIFICATION_RETRY_INTERVAL_SECONDS"
+    )
+    notification_retry_batch_size: int = Field(default=200, alias="NOTIFICATION_RETRY_BATCH_SIZE")
+    notification_retry_max_attempts: int = Field(default=5, alias="NOTIFICATION_RETRY_MAX_ATTEMPTS")
+    notification_retry_base_seconds: int = Field(default=60, alias="NOTIFICATION_RETRY_BASE_SECONDS")
+    notification_retry_max_delay_seconds: int = Field(
+        default=3600, alias="NOTIFICATION_RETRY_MAX_DELAY_SECONDS"
+    )
+
+    # Observability
+    worker_metrics_port: int | None = Field(default=None, alias="WORKER_METRICS_PORT")
+    relay_metrics_port: int | None = Field(default=None, alias="RELAY_METRICS_PORT")
+    sql_tracing_enabled: bool = Field(default=True, alias="SQL_TRACING_ENABLED")
+    sql_tracing_comment: bool = Field(default=False, alias="SQL_TRACING_COMMENT")
+    sql_slow_query_ms: int = Field(default=200, alias="SQL_SLOW_QUERY_MS")
+    sql_repeat_warn_threshold: int = Field(default=20, alias="SQL_REPEAT_WARN_THRESHOLD")
+
+    # Admin API (disabled while the token is empty)
+    admin_api_token: str | None = Field(default=None, alias="ADMIN_API_TOKEN")
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    return Settings()
+
+
+class _LazySettings:
+    # Reading .env and validating happens on first attribute access, so importing
+    # modules that reference `settings` stays cheap.
+    def __getattr__(self, name: str):
+        return getattr(get_settings(), name)
+
+    # Writes go to the real instance too, so monkeypatching `settings` in tests
+    # never leaves a shadowing attribute on the proxy.
+    def __setattr__(self, name: str, value) -> None:
+        setattr(get_settings(), name, value)
+
+    def __delattr__(self, name: str) -> None:
+        delattr(get_settings(), name)
 
 
-settings = Settings()
+settings = _LazySettings()
@@ -1,24 +1,232 @@
 ﻿from __future__ import annotations
 
+import logging
+import os
+import time
 from contextlib import contextmanager
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
 
+from sqlalchemy.pool import QueuePool
+
 from .config import settings
 
-engine = create_engine(settings.database_url, pool_pre_ping=True)
-SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+logger = logging.getLogger(__name__)
+
+ROLES = ("api", "worker", "scheduler")
+
+# Drivers that cache server-side prepared statements and the connect_args that
+# turn the cache off, so connections can be shared by PgBouncer in transaction mode.
+_PGBOUNCER_CONNECT_ARGS = {
+    "psycopg": {"prepare_threshold": None},
+    "asyncpg": {"statement_cache_size": 0, "prepared_statement_cache_size": 0},
+}
+
+_role: str | None = None
+_engine = None
+_engine_pid: int | None = None
+_replica_engine = None
+_replica_pid: int | None = None
+# (checked_at monotonic, usable) of the last replica health check.
+_replica_health: tuple[float, bool] | None = None
+
+# Seconds the replica is behind the primary. A replica that has replayed
+# everything it received is current even if the primary has been idle.
+_REPLICA_LAG_SQL = text(
+    "SELECT CASE"
+    " WHEN NOT pg_is_in_recovery() THEN 0"
+    " WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0"
+    " ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)"
+    " END"
+)
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False)
+
+
+def _engine_options(url: str, role: str) -> dict:
+    options = {"pool_pre_ping": True}
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite":
+        return options
+
+    poolclass = QueuePool
+    if role != "scheduler":
+        # Pool metrics are only scraped from long-running processes; the scheduler
+        # is a short cron job and skips loading prometheus_client.
+        from .metrics import TimedQueuePool
+
+        poolclass = TimedQueuePool
+
+    options.update(
+        poolclass=poolclass,
+        pool_size=getattr(settings, f"db_pool_size_{role}"),
+        max_overflow=getattr(settings, f"db_max_overflow_{role}"),
+        pool_timeout=getattr(settings, f"db_pool_timeout_{role}"),
+        pool_recycle=settings.db_pool_recycle,
+    )
+    if settings.db_pgbouncer:
+        connect_args = _PGBOUNCER_CONNECT_ARGS.get(parsed.get_driver_name())
+        if connect_args:
+            options["connect_args"] = connect_args
+    return options
+
+
+def configure(role: str) -> None:
+    global _role
+    if role not in ROLES:
+        raise ValueError(f"Unknown process role: {role}")
+    if role != _role:
+        _role = role
+        dispose_engine()
+
+
+def _create_engine(url: str, pool_metrics: bool):
+    role = _role or settings.process_role
+    engine = create_engine(url, **_engine_options(url, role))
+    if role != "scheduler" and pool_metrics:
+        from .metrics import instrument_pool
+
+        instrument_pool(engine.pool)
+    if settings.sql_tracing_enabled:
+        from .tracing import instrument_engine
+
+        instrument_engine(engine)
+    return engine
+
+
+def get_engine():
+    global _engine, _engine_pid
+    if _engine is not None and _engine_pid != os.getpid():
+        # Inherited from the parent process: never reuse its sockets.
+        _engine.dispose(close=False)
+        _engine = None
+    if _engine is None:
+        _engine = _create_engine(settings.database_url, pool_metrics=True)
+        _engine_pid = os.getpid()
+    return _engine
+
+
+def get_replica_engine():
+    global _replica_engine, _replica_pid, _replica_health
+    if not settings.database_replica_url:
+        return None
+    if _replica_engine is not None and _replica_pid != os.getpid():
+        _replica_engine.dispose(close=False)
+        _replica_engine = None
+    if _replica_engine is None:
+        # Pool gauges describe the primary; the replica pool is not instrumented.
+        _replica_engine = _create_engine(settings.database_replica_url, pool_metrics=False)
+        _replica_pid = os.getpid()
+        _replica_health = None
+    return _replica_engine
+
+
+def _replica_lag_seconds(engine) -> float:
+    with engine.connect() as conn:
+        if engine.dialect.name != "postgresql":
+            return 0.0
+        return float(conn.execute(_REPLICA_LAG_SQL).scalar())
+
+
+def mark_replica_unavailable() -> None:
+    global _replica_health
+    _replica_health = (time.monotonic(), False)
+
+
+def _read_engine():
+    global _replica_health
+    replica = get_replica_engine()
+    if replica is None:
+        return get_engine()
+
+    now = time.monotonic()
+    checked_at = _replica_health[0] if _replica_health else None
+    if checked_at is None or now - checked_at >= settings.db_replica_check_interval_seconds:
+        try:
+            lag = _replica_lag_seconds(replica)
+        except DBAPIError:
+            logger.warning("read replica unavailable, reading from the primary", exc_info=True)
+            usable = False
+        else:
+            usable = lag <= settings.db_replica_max_lag_seconds
+            if not usable:
+                logger.warning("read replica is %.1fs behind, reading from the primary", lag)
+        _replica_health = (now, usable)
+    return replica if _replica_health[1] else get_engine()
+
+
+def dispose_engine() -> None:
+    global _engine, _replica_engine
+    if _engine is not None:
+        _engine.dispose(close=_engine_pid == os.getpid())
+        _engine = None
+    if _replica_engine is not None:
+        _replica_engine.dispose(close=_replica_pid == os.getpid())
+        _replica_engine = None
+
+
+def _after_fork_in_child() -> None:
+    global _engine, _replica_engine
+    if _engine is not None:
+        _engine.dispose(close=False)
+        _engine = None
+    if _replica_engine is not None:
+        _replica_engine.dispose(close=False)
+        _replica_engine = None
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def __getattr__(name: str):
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 @contextmanager
 def session_scope():
-    session = SessionLocal()
+    session = SessionLocal(bind=get_engine())
     try:
         yield session
         session.commit()
     except Exception:
         session.rollback()
         raise
+    finally:
+        session.close()
+
+
+@event.listens_for(ReadSessionLocal, "do_orm_execute")
+def _fall_back_to_primary(orm_execute_state):
+    # A replica that drops mid-request: the failed statement runs once more on the
+    # primary, and so does the rest of the session.
+    session = orm_execute_state.session
+    primary = get_engine()
+    if session.bind is primary:
+        return None
+    try:
+        return orm_execute_state.invoke_statement()
+    except DBAPIError as exc:
+        if not exc.connection_invalidated:
+            raise
+    logger.warning("read replica connection lost, retrying on the primary", exc_info=True)
+    mark_replica_unavailable()
+    session.bind = primary
+    return orm_execute_state.invoke_statement(bind_arguments={"bind": primary})
+
+
+@contextmanager
+def read_session_scope():
+    # Read-only work: served by the replica when it is configured, reachable and
+    # within DB_REPLICA_MAX_LAG_SECONDS, otherwise by the primary. Nothing is
+    # committed; loaded objects stay readable after the scope ends.
+    session = ReadSessionLocal(bind=_read_engine())
+    try:
+        yield session
     finally:
         session.close()
\ No newline at end of file
@@ -0,0 +1,171 @@
+﻿from __future__ import annotations
+
+import os
+import time
+from datetime import datetime
+
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, start_http_server
+from sqlalchemy.pool import QueuePool
+
+from .utils_time import ensure_utc, utc_now
+
+NAMESPACE = "daily_checkin"
+
+WEBHOOK_LATENCY = Histogram(
+    "webhook_request_seconds",
+    "Time spent serving a Telegram webhook request",
+    namespace=NAMESPACE,
+)
+UPDATES_IN_FLIGHT = Gauge(
+    "updates_in_flight",
+    "Telegram updates currently being processed",
+    namespace=NAMESPACE,
+)
+DUPLICATE_UPDATES = Counter(
+    "duplicate_updates_total",
+    "Redelivered Telegram updates dropped before processing",
+    namespace=NAMESPACE,
+)
+LANE_QUEUE_DEPTH = Gauge(
+    "update_lane_queue_depth",
+    "Updates waiting in a per-chat processing lane",
+    ["lane"],
+    namespace=NAMESPACE,
+)
+LANE_WAIT_SECONDS = Histogram(
+    "update_lane_wait_seconds",
+    "Time an update waited in its lane before processing",
+    ["lane"],
+    namespace=NAMESPACE,
+)
+HANDLER_LATENCY = Histogram(
+    "handler_seconds",
+    "Time spent inside an aiogram handler",
+    ["handler"],
+    namespace=NAMESPACE,
+)
+HANDLER_ERRORS = Counter(
+    "handler_errors_total",
+    "Exceptions raised by aiogram handlers",
+    ["handler"],
+    namespace=NAMESPACE,
+)
+BOT_API_LATENCY = Histogram(
+    "bot_api_request_seconds",
+    "Telegram Bot API call latency",
+    ["method"],
+    namespace=NAMESPACE,
+)
+BOT_API_ERRORS = Counter(
+    "bot_api_errors_total",
+    "Failed Telegram Bot API calls",
+    ["method", "error"],
+    namespace=NAMESPACE,
+)
+TELEGRAM_FLOOD_PAUSES = Counter(
+    "telegram_flood_pauses_total",
+    "429 responses that paused all Bot API senders",
+    namespace=NAMESPACE,
+)
+TELEGRAM_FLOOD_DEFERRED = Counter(
+    "telegram_flood_deferred_total",
+    "Bot API calls rescheduled because of an active flood pause",
+    namespace=NAMESPACE,
+)
+OUTBOX_RELAYED = Counter(
+    "outbox_relayed_total",
+    "Tasks moved from task_outbox to the Celery broker",
+    namespace=NAMESPACE,
+)
+BROADCAST_MESSAGES = Counter(
+    "broadcast_messages_total",
+    "Broadcast deliveries by outcome",
+    ["outcome"],
+    namespace=NAMESPACE,
+)
+NOTIFICATION_RETRIES = Counter(
+    "notification_retries_total",
+    "Failed notifications picked up by the retry engine, by outcome",
+    ["type", "outcome"],
+    namespace=NAMESPACE,
+)
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "db_pool_checkout_seconds",
+    "Time spent waiting for a connection from the SQLAlchemy pool",
+    namespace=NAMESPACE,
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out",
+    "Connections currently checked out of the pool",
+    namespace=NAMESPACE,
+)
+DB_POOL_SIZE = Gauge("db_pool_size", "Configured pool size", namespace=NAMESPACE)
+DB_POOL_OVERFLOW = Gauge(
+    "db_pool_overflow",
+    "Connections opened above pool_size (negative while the pool is not full)",
+    namespace=NAMESPACE,
+)
+NOTIFICATION_LAG = Histogram(
+    "notification_lag_seconds",
+    "Delay between the intended fire time of a notification and its delivery",
+    ["type"],
+    namespace=NAMESPACE,
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200, 21600),
+)
+UOW_STATEMENTS = Histogram(
+    "unit_of_work_statements",
+    "SQL statements executed per Celery task or aiogram handler invocation",
+    ["unit"],
+    namespace=NAMESPACE,
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000),
+)
+UOW_DB_SECONDS = Histogram(
+    "unit_of_work_db_seconds",
+    "Database time per Celery task or aiogram handler invocation",
+    ["unit"],
+    namespace=NAMESPACE,
+)
+
+
+class TimedQueuePool(QueuePool):
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - started)
+
+
+def instrument_pool(pool) -> None:
+    if not isinstance(pool, QueuePool):
+        return
+    DB_POOL_CHECKED_OUT.set_function(pool.checkedout)
+    DB_POOL_SIZE.set_function(pool.size)
+    DB_POOL_OVERFLOW.set_function(pool.overflow)
+
+
+def start_metrics_server(port: int) -> None:
+    # Celery prefork children observe metrics in their own processes; with
+    # PROMETHEUS_MULTIPROC_DIR set they are aggregated from the shared directory.
+    registry = REGISTRY
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    start_http_server(port, registry=registry)
+
+
+def mark_process_dead(pid: int) -> None:
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(pid)
+
+
+def observe_send_lag(type_: str, scheduled_for: datetime | None) -> None:
+    if scheduled_for is None:
+        return
+    lag = (utc_now() - ensure_utc(scheduled_for)).total_seconds()
+    NOTIFICATION_LAG.labels(type_).observe(max(lag, 0.0))
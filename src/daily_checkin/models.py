@@ -4,13 +4,16 @@ import enum
 from datetime import datetime, date, time
 
 from sqlalchemy import (
+    BigInteger,
     Boolean,
     Date,
     DateTime,
     Enum,
     Float,
     ForeignKey,
+    Index,
     Integer,
+    JSON,
     String,
     Text,
     Time,
@@ -51,8 +54,14 @@ class User(Base):
     timezone: Mapped[str] = mapped_column(String(64))
     checkin_time_local: Mapped[time] = mapped_column(Time)
     status: Mapped[UserStatus] = mapped_column(Enum(UserStatus), default=UserStatus.ACTIVE)
-    pause_until: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
-    unreachable_since: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    pause_until: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True, index=True)
+    unreachable_since: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True, index=True
+    )
+    # Set once contacts were told the user is unreachable; cleared with unreachable_since.
+    unreachable_notified_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
     updated_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
@@ -108,6 +117,8 @@ class DailyState(Base):
     late_prompt_sent_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
     late_prompt_response_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
     late_notify_contacts: Mapped[bool | None] = mapped_column(Boolean, nullable=True)
+    # Bumped by every UPDATE; orders the snapshots written to the Redis state cache.
+    version: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
 
 
 class NotificationLog(Base):
@@ -118,9 +129,78 @@ class NotificationLog(Base):
     type: Mapped[str] = mapped_column(String(64))
     user_id: Mapped[int] = mapped_column(Integer, index=True)
     target_chat_id: Mapped[int] = mapped_column(Integer, index=True)
+    scheduled_for: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
     sent_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
     status: Mapped[str] = mapped_column(String(32))
     error_code: Mapped[str | None] = mapped_column(String(64), nullable=True)
     error_message: Mapped[str | None] = mapped_column(Text, nullable=True)
+    # Retry bookkeeping: payload is what to send again (text, photo, keyboard).
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    next_attempt_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    payload: Mapped[dict | None] = mapped_column(JSON, nullable=True)
 
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (Index("ix_notification_log_retry", "status", "next_attempt_at"),)
+
+
+class DailyStats(Base):
+    __tablename__ = "daily_stats"
+
+    date_local: Mapped[date] = mapped_column(Date, primary_key=True)
+    timezone: Mapped[str] = mapped_column(String(64), primary_key=True)
+    done_count: Mapped[int] = mapped_column(Integer, default=0)
+    missed_count: Mapped[int] = mapped_column(Integer, default=0)
+    late_count: Mapped[int] = mapped_column(Integer, default=0)
+    escalation_count: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class UserSummary(Base):
+    __tablename__ = "user_summary"
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), primary_key=True)
+    current_streak: Mapped[int] = mapped_column(Integer, default=0)
+    best_streak: Mapped[int] = mapped_column(Integer, default=0)
+    total_done: Mapped[int] = mapped_column(Integer, default=0)
+    total_missed: Mapped[int] = mapped_column(Integer, default=0)
+    last_done_date: Mapped[date | None] = mapped_column(Date, nullable=True)
+    # Bit i of the bitmaps is the day `history_end - i`.
+    history_end: Mapped[date | None] = mapped_column(Date, nullable=True)
+    done_bits: Mapped[int] = mapped_column(BigInteger, default=0)
+    missed_bits: Mapped[int] = mapped_column(BigInteger, default=0)
+
+
+class TaskOutbox(Base):
+    __tablename__ = "task_outbox"
+
+    # Celery tasks written in the publishing transaction; the relay sends them after commit.
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    task_name: Mapped[str] = mapped_column(String(128))
+    args: Mapped[list] = mapped_column(JSON, default=list)
+    kwargs: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+    eta: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+
+class Broadcast(Base):
+    __tablename__ = "broadcasts"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    text: Mapped[str] = mapped_column(Text)
+    status: Mapped[str] = mapped_column(String(32), default="PENDING")
+    # Keyset checkpoint: every active user with a smaller id has a delivery row.
+    last_user_id: Mapped[int] = mapped_column(Integer, default=0)
+    sent_count: Mapped[int] = mapped_column(Integer, default=0)
+    failed_count: Mapped[int] = mapped_column(Integer, default=0)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+
+class BroadcastDelivery(Base):
+    __tablename__ = "broadcast_deliveries"
+
+    broadcast_id: Mapped[int] = mapped_column(ForeignKey("broadcasts.id"), primary_key=True)
+    user_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    status: Mapped[str] = mapped_column(String(32))
+    error_code: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    sent_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
@@ -0,0 +1,42 @@
+﻿from __future__ import annotations
+
+from datetime import date, datetime, time
+from typing import NamedTuple
+
+from .models import ContactStatus, DailyStateEnum, UserStatus
+
+# Immutable rows for hot read paths. They are not tracked by the session, so
+# code that changes a user or a day goes through the ORM entities instead.
+
+
+class UserView(NamedTuple):
+    id: int
+    tg_user_id: int
+    tg_chat_id: int
+    timezone: str
+    checkin_time_local: time
+    status: UserStatus
+    pause_until: datetime | None
+    unreachable_since: datetime | None
+
+
+class DailyStateView(NamedTuple):
+    user_id: int
+    date_local: date
+    due_at_utc: datetime
+    deadline_at_utc: datetime
+    state: DailyStateEnum
+    reminders_sent_count: int
+    escalation_sent_at: datetime | None
+    late_prompt_sent_at: datetime | None
+    late_prompt_response_at: datetime | None
+    late_notify_contacts: bool | None
+    version: int
+
+
+class ContactView(NamedTuple):
+    id: int
+    user_id: int
+    contact_tg_user_id: int
+    contact_chat_id: int
+    status: ContactStatus
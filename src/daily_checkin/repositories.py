@@ -1,19 +1,88 @@
 ﻿from __future__ import annotations
 
+import random
 from datetime import date, datetime, timedelta
 
-from sqlalchemy import select, update, insert
+from sqlalchemy import (
+    BigInteger,
+    Date,
+    DateTime,
+    Integer,
+    and_,
+    bindparam,
+    case,
+    cast,
+    delete,
+    func,
+    insert,
+    literal,
+    or_,
+    select,
+    true,
+    update,
+)
 from sqlalchemy.exc import IntegrityError
 
+from . import state_cache
+from .config import settings
 from .models import (
+    Broadcast,
+    BroadcastDelivery,
     Checkin,
     ContactStatus,
     DailyState,
     DailyStateEnum,
+    DailyStats,
     NotificationLog,
+    TaskOutbox,
     TrustedContact,
     User,
     UserStatus,
+    UserSummary,
+)
+from .read_models import ContactView, DailyStateView, UserView
+from .utils_time import utc_now
+
+# Hot reads run statements built once at import: a call only binds parameters
+# and the compiled SQL comes from the engine's statement cache.
+_USER_VIEW_COLUMNS = (
+    User.id,
+    User.tg_user_id,
+    User.tg_chat_id,
+    User.timezone,
+    User.checkin_time_local,
+    User.status,
+    User.pause_until,
+    User.unreachable_since,
+)
+_STATE_VIEW_COLUMNS = (
+    DailyState.user_id,
+    DailyState.date_local,
+    DailyState.due_at_utc,
+    DailyState.deadline_at_utc,
+    DailyState.state,
+    DailyState.reminders_sent_count,
+    DailyState.escalation_sent_at,
+    DailyState.late_prompt_sent_at,
+    DailyState.late_prompt_response_at,
+    DailyState.late_notify_contacts,
+    DailyState.version,
+)
+_CONTACT_VIEW_COLUMNS = (
+    TrustedContact.id,
+    TrustedContact.user_id,
+    TrustedContact.contact_tg_user_id,
+    TrustedContact.contact_chat_id,
+    TrustedContact.status,
+)
+_USER_VIEW_BY_ID = select(*_USER_VIEW_COLUMNS).where(User.id == bindparam("user_id"))
+_ACTIVE_USER_VIEWS = select(*_USER_VIEW_COLUMNS).where(User.status == UserStatus.ACTIVE)
+_STATE_VIEW = select(*_STATE_VIEW_COLUMNS).where(
+    DailyState.user_id == bindparam("user_id"), DailyState.date_local == bindparam("date_local")
+)
+_APPROVED_CONTACT_VIEWS = select(*_CONTACT_VIEW_COLUMNS).where(
+    TrustedContact.user_id == bindparam("user_id"),
+    TrustedContact.status == ContactStatus.APPROVED,
 )
 
 
@@ -29,6 +98,10 @@ class UserRepository:
     def get_by_id(self, user_id: int) -> User | None:
         return self.session.execute(select(User).where(User.id == user_id)).scalar_one_or_none()
 
+    def get_view(self, user_id: int) -> UserView | None:
+        row = self.session.execute(_USER_VIEW_BY_ID, {"user_id": user_id}).one_or_none()
+        return UserView._make(row) if row is not None else None
+
     def create_user(
         self, tg_user_id: int, tg_chat_id: int, timezone: str, checkin_time_local
     ) -> User:
@@ -43,21 +116,82 @@ class UserRepository:
         self.session.flush()
         return user
 
-    def list_active(self) -> list[User]:
-        return (
-            self.session.execute(select(User).where(User.status == UserStatus.ACTIVE))
-            .scalars()
-            .all()
-        )
+    def list_active(self) -> list[UserView]:
+        return [UserView._make(row) for row in self.session.execute(_ACTIVE_USER_VIEWS)]
 
     def list_all(self) -> list[User]:
         return self.session.execute(select(User)).scalars().all()
 
+    def iter_schedule_rows(self, user_ids=None):
+        # (id, timezone, checkin_time_local) of every user that may get a check-in,
+        # ordered by id; paused users are included and filtered when they come due.
+        stmt = (
+            select(User.id, User.timezone, User.checkin_time_local)
+            .where(User.status != UserStatus.DISABLED)
+            .order_by(User.id)
+            .execution_options(yield_per=10000)
+        )
+        if user_ids is not None:
+            stmt = stmt.where(User.id.in_(user_ids))
+        return self.session.execute(stmt)
+
+    def list_due_candidates(self, user_ids, now: datetime) -> list:
+        return self.session.execute(
+            select(User.id, User.timezone, User.checkin_time_local).where(
+                User.id.in_(user_ids),
+                or_(
+                    User.status == UserStatus.ACTIVE,
+                    and_(User.status == UserStatus.PAUSED, User.pause_until <= now),
+                ),
+            )
+        ).all()
+
     def set_unreachable(self, user_id: int, since: datetime):
         self.session.execute(
             update(User).where(User.id == user_id).values(unreachable_since=since)
         )
 
+    def mark_unreachable_many(self, user_ids: list[int], since: datetime) -> None:
+        if user_ids:
+            self.session.execute(
+                update(User)
+                .where(User.id.in_(user_ids), User.unreachable_since.is_(None))
+                .values(unreachable_since=since)
+            )
+
+    def clear_unreachable(self, user_id: int):
+        # Matches no rows for reachable users, so it is cheap to call on every interaction.
+        self.session.execute(
+            update(User)
+            .where(User.id == user_id, User.unreachable_since.is_not(None))
+            .values(unreachable_since=None, unreachable_notified_at=None)
+        )
+
+    def reactivate_expired_pauses(self, now: datetime) -> int:
+        result = self.session.execute(
+            update(User)
+            .where(User.status == UserStatus.PAUSED, User.pause_until <= now)
+            .values(status=UserStatus.ACTIVE, pause_until=None)
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount
+
+    def claim_unreachable_due(self, cutoff: datetime, now: datetime, limit: int) -> list:
+        rows = self.session.execute(
+            select(User.id, User.unreachable_since)
+            .where(User.unreachable_since <= cutoff, User.unreachable_notified_at.is_(None))
+            .order_by(User.unreachable_since)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if rows:
+            self.session.execute(
+                update(User)
+                .where(User.id.in_([row.id for row in rows]))
+                .values(unreachable_notified_at=now)
+            )
+        return rows
+
 
 class ContactRepository:
     def __init__(self, session):
@@ -88,17 +222,9 @@ class ContactRepository:
             .values(status=status)
         )
 
-    def list_approved(self, user_id: int) -> list[TrustedContact]:
-        return (
-            self.session.execute(
-                select(TrustedContact).where(
-                    TrustedContact.user_id == user_id,
-                    TrustedContact.status == ContactStatus.APPROVED,
-                )
-            )
-            .scalars()
-            .all()
-        )
+    def list_approved(self, user_id: int) -> list[ContactView]:
+        rows = self.session.execute(_APPROVED_CONTACT_VIEWS, {"user_id": user_id})
+        return [ContactView._make(row) for row in rows]
 
 
 class CheckinRepository:
@@ -134,6 +260,173 @@ class CheckinRepository:
             update(Checkin).where(Checkin.id == checkin_id).values(photo_s3_key=key)
         )
 
+    def ingest(self, tg_user_id: int, photo_file_id: str, now_utc: datetime, deadline_minutes: int):
+        # PostgreSQL only: one statement resolves the user, creates or completes
+        # today's daily_state, inserts the checkin and updates daily_stats and
+        # user_summary. Returns None for an unknown user.
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+        now = literal(now_utc, DateTime(timezone=True))
+        user = (
+            select(
+                User.id.label("user_id"),
+                User.timezone,
+                cast(func.timezone(User.timezone, now), Date).label("date_local"),
+                User.checkin_time_local,
+            )
+            .where(User.tg_user_id == tg_user_id)
+            .cte("ingest_user")
+        )
+        # Locks an existing row so the pre-checkin state below is current.
+        prior = (
+            select(DailyState.state, DailyState.escalation_sent_at)
+            .join(
+                user,
+                and_(
+                    DailyState.user_id == user.c.user_id,
+                    DailyState.date_local == user.c.date_local,
+                ),
+            )
+            .with_for_update(of=DailyState)
+            .cte("ingest_prior")
+        )
+        flags = (
+            select(
+                user,
+                prior.c.state.label("prior_state"),
+                prior.c.escalation_sent_at,
+                or_(prior.c.state.is_(None), prior.c.state == DailyStateEnum.PENDING).label(
+                    "was_pending"
+                ),
+            )
+            .select_from(user.outerjoin(prior, true()))
+            .cte("ingest_flags")
+        )
+
+        due = func.timezone(
+            flags.c.timezone,
+            flags.c.date_local + flags.c.checkin_time_local,
+            type_=DateTime(timezone=True),
+        )
+        state_insert = pg_insert(DailyState).from_select(
+            [
+                "user_id",
+                "date_local",
+                "due_at_utc",
+                "deadline_at_utc",
+                "state",
+                "reminders_sent_count",
+                "version",
+            ],
+            select(
+                flags.c.user_id,
+                flags.c.date_local,
+                due,
+                due + timedelta(minutes=deadline_minutes),
+                cast(literal(DailyStateEnum.DONE.value), DailyState.state.type),
+                literal(0),
+                literal(0),
+            ),
+        )
+        state_row = (
+            state_insert.on_conflict_do_update(
+                index_elements=[DailyState.user_id, DailyState.date_local],
+                set_={
+                    "state": case(
+                        (DailyState.state == DailyStateEnum.PENDING, DailyStateEnum.DONE),
+                        else_=DailyState.state,
+                    ),
+                    "version": DailyState.version + 1,
+                },
+            )
+            .returning(*_STATE_VIEW_COLUMNS)
+            .cte("ingest_state")
+        )
+
+        checkin = (
+            insert(Checkin)
+            .from_select(
+                ["user_id", "date_local", "photo_file_id", "is_late"],
+                select(
+                    state_row.c.user_id,
+                    state_row.c.date_local,
+                    literal(photo_file_id),
+                    now > state_row.c.deadline_at_utc,
+                ),
+            )
+            .returning(Checkin.id, Checkin.is_late)
+            .cte("ingest_checkin")
+        )
+
+        stats_insert = pg_insert(DailyStats).from_select(
+            ["date_local", "timezone", *STAT_COLUMNS],
+            select(
+                flags.c.date_local,
+                flags.c.timezone,
+                cast(flags.c.was_pending, Integer),
+                literal(0),
+                cast(checkin.c.is_late, Integer),
+                literal(0),
+            ).select_from(flags.join(checkin, true())),
+        )
+        stats = stats_insert.on_conflict_do_update(
+            index_elements=[DailyStats.date_local, DailyStats.timezone],
+            set_={
+                "done_count": DailyStats.done_count + stats_insert.excluded.done_count,
+                "late_count": DailyStats.late_count + stats_insert.excluded.late_count,
+            },
+        ).cte("ingest_stats")
+
+        summary_insert = pg_insert(UserSummary).from_select(
+            [
+                "user_id",
+                "current_streak",
+                "best_streak",
+                "total_done",
+                "total_missed",
+                "last_done_date",
+                "history_end",
+                "done_bits",
+                "missed_bits",
+            ],
+            select(
+                flags.c.user_id,
+                literal(1),
+                literal(1),
+                literal(1),
+                literal(0),
+                flags.c.date_local,
+                flags.c.date_local,
+                cast(1, BigInteger),
+                cast(0, BigInteger),
+            ).where(flags.c.was_pending),
+        )
+        summary = summary_insert.on_conflict_do_update(
+            index_elements=[UserSummary.user_id],
+            set_=summary_done_values(summary_insert.excluded.last_done_date),
+        ).cte("ingest_summary")
+
+        stmt = (
+            select(
+                checkin.c.id.label("checkin_id"),
+                checkin.c.is_late,
+                state_row.c.user_id,
+                state_row.c.date_local,
+                state_row.c.deadline_at_utc,
+                flags.c.prior_state,
+                flags.c.escalation_sent_at,
+                flags.c.was_pending,
+                *(state_row.c[col.key].label(f"state_{col.key}") for col in _STATE_VIEW_COLUMNS),
+            )
+            .select_from(checkin.join(state_row, true()).join(flags, true()))
+            .add_cte(stats, summary)
+        )
+        row = self.session.execute(stmt).one_or_none()
+        if row is not None:
+            state = DailyStateView._make(row[-len(_STATE_VIEW_COLUMNS) :])
+            state_cache.stage_snapshot(self.session, state)
+        return row
+
     def latest_for_user(self, user_id: int) -> Checkin | None:
         return (
             self.session.execute(
@@ -146,7 +439,7 @@ class CheckinRepository:
         )
 
     def latest_within(self, user_id: int, minutes: int) -> Checkin | None:
-        threshold = datetime.utcnow() - timedelta(minutes=minutes)
+        threshold = utc_now() - timedelta(minutes=minutes)
         return (
             self.session.execute(
                 select(Checkin)
@@ -157,17 +450,33 @@ class CheckinRepository:
             .first()
         )
 
+    def attach_geo_to_latest(self, tg_user_id: int, lat: float, lon: float, minutes: int) -> bool:
+        # The user lookup, the latest_within query and attach_geo in one UPDATE.
+        latest = (
+            select(Checkin.id)
+            .join(User, User.id == Checkin.user_id)
+            .where(
+                User.tg_user_id == tg_user_id,
+                Checkin.created_at >= utc_now() - timedelta(minutes=minutes),
+            )
+            .order_by(Checkin.created_at.desc(), Checkin.id.desc())
+            .limit(1)
+            .scalar_subquery()
+        )
+        result = self.session.execute(
+            update(Checkin).where(Checkin.id == latest).values(geo_lat=lat, geo_lon=lon)
+        )
+        return result.rowcount > 0
+
 
 class DailyStateRepository:
     def __init__(self, session):
         self.session = session
 
     def upsert_state(self, user_id: int, date_local: date, due_at_utc, deadline_at_utc):
-        existing = self.session.execute(
-            select(DailyState).where(
-                DailyState.user_id == user_id, DailyState.date_local == date_local
-            )
-        ).scalar_one_or_none()
+        # Existing days come back as DailyStateView, so a scheduling pass does
+        # not fill the identity map with a DailyState per user.
+        existing = self.get_state(user_id, date_local)
         if existing:
             return existing
         state = DailyState(
@@ -180,63 +489,80 @@ class DailyStateRepository:
         )
         self.session.add(state)
         self.session.flush()
+        state_cache.stage_snapshot(self.session, state)
         return state
 
-    def get_state(self, user_id: int, date_local: date) -> DailyState | None:
-        return self.session.execute(
-            select(DailyState).where(
-                DailyState.user_id == user_id, DailyState.date_local == date_local
-            )
-        ).scalar_one_or_none()
+    def get_state(self, user_id: int, date_local: date) -> DailyStateView | None:
+        params = {"user_id": user_id, "date_local": date_local}
+        row = self.session.execute(_STATE_VIEW, params).one_or_none()
+        if row is None:
+            return None
+        state = DailyStateView._make(row)
+        state_cache.stage_snapshot(self.session, state)
+        return state
 
-    def mark_done(self, user_id: int, date_local: date):
-        self.session.execute(
+    def _update_state(self, user_id: int, date_local: date, **values):
+        # The returned row goes to the cache with its new version, so a snapshot
+        # read by an older transaction cannot overwrite it.
+        row = self.session.execute(
             update(DailyState)
             .where(DailyState.user_id == user_id, DailyState.date_local == date_local)
-            .values(state=DailyStateEnum.DONE)
-        )
+            .values(version=DailyState.version + 1, **values)
+            .returning(*_STATE_VIEW_COLUMNS)
+        ).one_or_none()
+        if row is not None:
+            state_cache.stage_snapshot(self.session, DailyStateView._make(row))
+
+    def mark_done(self, user_id: int, date_local: date):
+        self._update_state(user_id, date_local, state=DailyStateEnum.DONE)
 
     def increment_reminders(self, user_id: int, date_local: date):
-        self.session.execute(
-            update(DailyState)
-            .where(DailyState.user_id == user_id, DailyState.date_local == date_local)
-            .values(reminders_sent_count=DailyState.reminders_sent_count + 1)
+        self._update_state(
+            user_id, date_local, reminders_sent_count=DailyState.reminders_sent_count + 1
         )
 
     def mark_missed(self, user_id: int, date_local: date):
-        self.session.execute(
-            update(DailyState)
-            .where(DailyState.user_id == user_id, DailyState.date_local == date_local)
-            .values(state=DailyStateEnum.MISSED)
-        )
+        self._update_state(user_id, date_local, state=DailyStateEnum.MISSED)
 
     def set_escalation_sent(self, user_id: int, date_local: date, sent_at: datetime):
-        self.session.execute(
-            update(DailyState)
-            .where(DailyState.user_id == user_id, DailyState.date_local == date_local)
-            .values(escalation_sent_at=sent_at)
-        )
+        self._update_state(user_id, date_local, escalation_sent_at=sent_at)
 
     def mark_late_prompt_sent(self, user_id: int, date_local: date, sent_at: datetime):
-        self.session.execute(
-            update(DailyState)
-            .where(DailyState.user_id == user_id, DailyState.date_local == date_local)
-            .values(late_prompt_sent_at=sent_at)
-        )
+        self._update_state(user_id, date_local, late_prompt_sent_at=sent_at)
 
     def set_late_response(self, user_id: int, date_local: date, notify: bool):
-        self.session.execute(
-            update(DailyState)
-            .where(DailyState.user_id == user_id, DailyState.date_local == date_local)
-            .values(late_prompt_response_at=datetime.utcnow(), late_notify_contacts=notify)
+        self._update_state(
+            user_id,
+            date_local,
+            late_prompt_response_at=utc_now(),
+            late_notify_contacts=notify,
         )
 
+# FORBIDDEN (blocked bot, deleted chat) will not get better by trying again.
+RETRYABLE_ERROR_CODES = frozenset({"API_ERROR", "SEND_ERROR", "RATE_LIMIT"})
+
+
+def retry_delay(attempts: int) -> timedelta:
+    # Exponential backoff with jitter: drawn from the upper half of the window.
+    ceiling = min(
+        settings.notification_retry_base_seconds * 2 ** (attempts - 1),
+        settings.notification_retry_max_delay_seconds,
+    )
+    return timedelta(seconds=random.uniform(ceiling / 2, ceiling))
+
 
 class NotificationLogRepository:
     def __init__(self, session):
         self.session = session
 
-    def try_insert(self, key: str, type_: str, user_id: int, target_chat_id: int) -> bool:
+    def try_insert(
+        self,
+        key: str,
+        type_: str,
+        user_id: int,
+        target_chat_id: int,
+        scheduled_for: datetime | None = None,
+    ) -> bool:
         try:
             self.session.execute(
                 insert(NotificationLog).values(
@@ -244,6 +570,7 @@ class NotificationLogRepository:
                     type=type_,
                     user_id=user_id,
                     target_chat_id=target_chat_id,
+                    scheduled_for=scheduled_for,
                     status="PENDING",
                 )
             )
@@ -252,16 +579,377 @@ class NotificationLogRepository:
             self.session.rollback()
             return False
 
+    def release(self, key: str):
+        self.session.execute(
+            delete(NotificationLog).where(
+                NotificationLog.idempotency_key == key, NotificationLog.status == "PENDING"
+            )
+        )
+
     def mark_sent(self, key: str):
         self.session.execute(
             update(NotificationLog)
             .where(NotificationLog.idempotency_key == key)
-            .values(status="SENT", sent_at=datetime.utcnow())
+            .values(status="SENT", sent_at=utc_now())
         )
 
-    def mark_error(self, key: str, code: str, message: str):
+    def mark_error(self, key: str, code: str, message: str, payload: dict | None = None):
+        values = {
+            "status": "ERROR",
+            "error_code": code,
+            "error_message": message,
+            "attempts": NotificationLog.attempts + 1,
+        }
+        if payload is not None and code in RETRYABLE_ERROR_CODES:
+            values["payload"] = payload
+            values["next_attempt_at"] = utc_now() + retry_delay(1)
         self.session.execute(
-            update(NotificationLog)
-            .where(NotificationLog.idempotency_key == key)
-            .values(status="ERROR", error_code=code, error_message=message)
+            update(NotificationLog).where(NotificationLog.idempotency_key == key).values(**values)
         )
+
+    def claim_due(self, now: datetime, limit: int, lease: timedelta) -> list:
+        # Claimed rows are pushed out by the lease, so another engine run skips
+        # them and a crashed run's rows come back once it expires.
+        rows = self.session.execute(
+            select(
+                NotificationLog.id,
+                NotificationLog.type,
+                NotificationLog.user_id,
+                NotificationLog.target_chat_id,
+                NotificationLog.scheduled_for,
+                NotificationLog.attempts,
+                NotificationLog.payload,
+            )
+            .where(NotificationLog.status == "ERROR", NotificationLog.next_attempt_at <= now)
+            .order_by(NotificationLog.next_attempt_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if rows:
+            self.session.execute(
+                update(NotificationLog)
+                .where(NotificationLog.id.in_([row.id for row in rows]))
+                .values(next_attempt_at=now + lease)
+            )
+        return rows
+
+    def apply_results(self, results: list[dict]):
+        if results:
+            self.session.execute(update(NotificationLog), results)
+
+
+class OutboxRepository:
+    def __init__(self, session):
+        self.session = session
+
+    def add(self, messages) -> None:
+        rows = [
+            {
+                "task_name": message.name,
+                "args": list(message.args),
+                "kwargs": message.kwargs or None,
+                "eta": message.eta,
+            }
+            for message in messages
+        ]
+        if rows:
+            self.session.execute(insert(TaskOutbox), rows)
+
+    def claim(self, limit: int) -> list:
+        # Locked until the relay commits, so parallel relays take disjoint batches.
+        return self.session.execute(
+            select(TaskOutbox.id, TaskOutbox.task_name, TaskOutbox.args, TaskOutbox.kwargs, TaskOutbox.eta)
+            .order_by(TaskOutbox.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        ).all()
+
+    def delete(self, ids: list[int]) -> None:
+        self.session.execute(delete(TaskOutbox).where(TaskOutbox.id.in_(ids)))
+
+
+class BroadcastRepository:
+    def __init__(self, session):
+        self.session = session
+
+    def create(self, text: str) -> int:
+        broadcast = Broadcast(
+            text=text, status="PENDING", last_user_id=0, sent_count=0, failed_count=0
+        )
+        self.session.add(broadcast)
+        self.session.flush()
+        return broadcast.id
+
+    def start(self, broadcast_id: int):
+        broadcast = self.session.execute(
+            select(Broadcast.id, Broadcast.text, Broadcast.status, Broadcast.last_user_id).where(
+                Broadcast.id == broadcast_id
+            )
+        ).one_or_none()
+        if broadcast is None or broadcast.status == "DONE":
+            return None
+        self.session.execute(
+            update(Broadcast).where(Broadcast.id == broadcast_id).values(status="RUNNING")
+        )
+        return broadcast
+
+    def recipients_after(self, after_user_id: int, limit: int) -> list:
+        return self.session.execute(
+            select(User.id, User.tg_chat_id)
+            .where(User.status == UserStatus.ACTIVE, User.id > after_user_id)
+            .order_by(User.id)
+            .limit(limit)
+        ).all()
+
+    def record_page(self, broadcast_id: int, results: list[dict], last_user_id: int):
+        # Results and the checkpoint commit together: a page is either fully
+        # recorded or resent after a crash.
+        if results:
+            dialect_insert = _dialect_insert(self.session)
+            self.session.execute(
+                dialect_insert(BroadcastDelivery)
+                .values([{"broadcast_id": broadcast_id, **result} for result in results])
+                .on_conflict_do_nothing()
+            )
+        sent = sum(1 for result in results if result["status"] == "SENT")
+        self.session.execute(
+            update(Broadcast)
+            .where(Broadcast.id == broadcast_id)
+            .values(
+                last_user_id=last_user_id,
+                sent_count=Broadcast.sent_count + sent,
+                failed_count=Broadcast.failed_count + len(results) - sent,
+            )
+        )
+
+    def finish(self, broadcast_id: int, finished_at: datetime):
+        self.session.execute(
+            update(Broadcast)
+            .where(Broadcast.id == broadcast_id)
+            .values(status="DONE", finished_at=finished_at)
+        )
+
+    def get(self, broadcast_id: int) -> Broadcast | None:
+        return self.session.get(Broadcast, broadcast_id)
+
+
+def _dialect_insert(session):
+    if session.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    return dialect_insert
+
+
+STAT_COLUMNS = ("done_count", "missed_count", "late_count", "escalation_count")
+
+
+class StatsRepository:
+    def __init__(self, session):
+        self.session = session
+
+    def increment(self, date_local: date, timezone_name: str, **deltas: int):
+        values = {column: deltas.get(column, 0) for column in STAT_COLUMNS}
+        if not any(values.values()):
+            return
+        stmt = _dialect_insert(self.session)(DailyStats).values(
+            date_local=date_local, timezone=timezone_name, **values
+        )
+        self.session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[DailyStats.date_local, DailyStats.timezone],
+                set_={
+                    column: getattr(DailyStats, column) + getattr(stmt.excluded, column)
+                    for column, delta in values.items()
+                    if delta
+                },
+            )
+        )
+
+    def for_date(self, date_local: date, timezone_name: str | None = None) -> dict[str, int]:
+        columns = [func.coalesce(func.sum(getattr(DailyStats, c)), 0) for c in STAT_COLUMNS]
+        stmt = select(*columns).where(DailyStats.date_local == date_local)
+        if timezone_name is not None:
+            stmt = stmt.where(DailyStats.timezone == timezone_name)
+        row = self.session.execute(stmt).one()
+        return dict(zip(STAT_COLUMNS, (int(value) for value in row)))
+
+    def rebuild(self, start: date, end: date) -> int:
+        counts: dict[tuple[date, str], dict[str, int]] = {}
+
+        def collect(column: str, stmt):
+            for date_local, timezone_name, count in self.session.execute(stmt):
+                row = counts.setdefault((date_local, timezone_name), dict.fromkeys(STAT_COLUMNS, 0))
+                row[column] = count
+
+        in_range = DailyState.date_local.between(start, end)
+        for column, condition in (
+            ("done_count", DailyState.state == DailyStateEnum.DONE),
+            ("missed_count", DailyState.state == DailyStateEnum.MISSED),
+            ("escalation_count", DailyState.escalation_sent_at.is_not(None)),
+        ):
+            collect(
+                column,
+                select(DailyState.date_local, User.timezone, func.count())
+                .join(User, User.id == DailyState.user_id)
+                .where(in_range, condition)
+                .group_by(DailyState.date_local, User.timezone),
+            )
+        collect(
+            "late_count",
+            select(Checkin.date_local, User.timezone, func.count())
+            .join(User, User.id == Checkin.user_id)
+            .where(Checkin.date_local.between(start, end), Checkin.is_late.is_(True))
+            .group_by(Checkin.date_local, User.timezone),
+        )
+
+        self.session.execute(delete(DailyStats).where(DailyStats.date_local.between(start, end)))
+        if counts:
+            self.session.execute(
+                insert(DailyStats),
+                [
+                    {"date_local": date_local, "timezone": timezone_name, **values}
+                    for (date_local, timezone_name), values in counts.items()
+                ],
+            )
+        return len(counts)
+
+
+HISTORY_DAYS = 62
+_HISTORY_MASK = (1 << HISTORY_DAYS) - 1
+
+
+def apply_day_result(summary: UserSummary, date_local: date, done: bool) -> None:
+    if summary.history_end is None or date_local > summary.history_end:
+        shift = HISTORY_DAYS
+        if summary.history_end is not None:
+            shift = min((date_local - summary.history_end).days, HISTORY_DAYS)
+        summary.done_bits = (summary.done_bits << shift) & _HISTORY_MASK
+        summary.missed_bits = (summary.missed_bits << shift) & _HISTORY_MASK
+        summary.history_end = date_local
+
+    offset = (summary.history_end - date_local).days
+    if offset < HISTORY_DAYS:
+        bit = 1 << offset
+        if done:
+            summary.done_bits |= bit
+            summary.missed_bits &= ~bit
+        else:
+            summary.missed_bits |= bit
+            summary.done_bits &= ~bit
+
+    is_newest = summary.last_done_date is None or date_local > summary.last_done_date
+    if done:
+        summary.total_done = summary.total_done + 1
+        if is_newest:
+            if summary.last_done_date == date_local - timedelta(days=1):
+                summary.current_streak = summary.current_streak + 1
+            else:
+                summary.current_streak = 1
+            summary.last_done_date = date_local
+            summary.best_streak = max(summary.best_streak, summary.current_streak)
+    else:
+        summary.total_missed = summary.total_missed + 1
+        if is_newest:
+            summary.current_streak = 0
+
+
+def summary_done_values(date_local) -> dict:
+    # SQL counterpart of apply_day_result(..., done=True); keep the two in sync.
+    history_end = UserSummary.history_end
+    shift = case(
+        (history_end.is_(None), HISTORY_DAYS),
+        (date_local > history_end, func.least(date_local - history_end, HISTORY_DAYS)),
+        else_=0,
+    )
+    mask = cast(_HISTORY_MASK, BigInteger)
+    done_bits = UserSummary.done_bits.op("<<")(shift).op("&")(mask)
+    missed_bits = UserSummary.missed_bits.op("<<")(shift).op("&")(mask)
+    new_end = case(
+        (or_(history_end.is_(None), date_local > history_end), date_local), else_=history_end
+    )
+    offset = new_end - date_local
+    bit = case((offset < HISTORY_DAYS, cast(1, BigInteger).op("<<")(offset)), else_=cast(0, BigInteger))
+
+    is_newest = or_(UserSummary.last_done_date.is_(None), date_local > UserSummary.last_done_date)
+    streak = case(
+        (~is_newest, UserSummary.current_streak),
+        (UserSummary.last_done_date == date_local - 1, UserSummary.current_streak + 1),
+        else_=1,
+    )
+    return {
+        "history_end": new_end,
+        "done_bits": done_bits.op("|")(bit),
+        "missed_bits": missed_bits - missed_bits.op("&")(bit),
+        "total_done": UserSummary.total_done + 1,
+        "current_streak": streak,
+        "best_streak": func.greatest(UserSummary.best_streak, streak),
+        "last_done_date": case((is_newest, date_local), else_=UserSummary.last_done_date),
+    }
+
+
+class UserSummaryRepository:
+    def __init__(self, session):
+        self.session = session
+
+    def get(self, user_id: int) -> UserSummary | None:
+        return self.session.execute(
+            select(UserSummary).where(UserSummary.user_id == user_id)
+        ).scalar_one_or_none()
+
+    def record(self, user_id: int, date_local: date, done: bool) -> UserSummary:
+        self.session.execute(
+            _dialect_insert(self.session)(UserSummary)
+            .values(user_id=user_id)
+            .on_conflict_do_nothing(index_elements=[UserSummary.user_id])
+        )
+        summary = self.session.execute(
+            select(UserSummary)
+            .where(UserSummary.user_id == user_id)
+            .with_for_update()
+            .execution_options(populate_existing=True)
+        ).scalar_one()
+        apply_day_result(summary, date_local, done)
+        self.session.flush()
+        return summary
+
+    def rebuild_all(self, batch_size: int = 1000) -> int:
+        self.session.execute(delete(UserSummary))
+        stmt = (
+            select(DailyState.user_id, DailyState.date_local, DailyState.state)
+            .where(DailyState.state.in_([DailyStateEnum.DONE, DailyStateEnum.MISSED]))
+            .order_by(DailyState.user_id, DailyState.date_local)
+            .execution_options(yield_per=batch_size)
+        )
+        columns = [column.key for column in UserSummary.__table__.columns]
+        rows: list[dict] = []
+        count = 0
+
+        def flush():
+            nonlocal count
+            if rows:
+                self.session.execute(insert(UserSummary), rows)
+                count += len(rows)
+                rows.clear()
+
+        summary = None
+        for user_id, date_local, state in self.session.execute(stmt):
+            if summary is None or summary.user_id != user_id:
+                if summary is not None:
+                    rows.append({column: getattr(summary, column) for column in columns})
+                    if len(rows) >= batch_size:
+                        flush()
+                summary = UserSummary(
+                    user_id=user_id,
+                    current_streak=0,
+                    best_streak=0,
+                    total_done=0,
+                    total_missed=0,
+                    done_bits=0,
+                    missed_bits=0,
+                )
+            apply_day_result(summary, date_local, state == DailyStateEnum.DONE)
+        if summary is not None:
+            rows.append({column: getattr(summary, column) for column in columns})
+        flush()
+        return count
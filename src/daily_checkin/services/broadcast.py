@@ -0,0 +1,123 @@
+﻿from __future__ import annotations
+
+import asyncio
+
+from ..config import settings
+from ..db import session_scope
+from ..metrics import BROADCAST_MESSAGES
+from ..repositories import BroadcastRepository, UserRepository
+from ..utils_time import utc_now
+from .notifications import _is_flood_error, send_error_code
+
+
+class BroadcastAborted(Exception):
+    def __init__(self, broadcast_id: int, reason: str):
+        super().__init__(f"broadcast {broadcast_id} stopped, every recipient failed with: {reason}")
+        self.broadcast_id = broadcast_id
+        self.reason = reason
+
+
+def _is_global_error(exc: Exception) -> bool:
+    # Failures caused by the bot, the network or the text rather than the recipient.
+    from aiogram.exceptions import (
+        TelegramBadRequest,
+        TelegramNetworkError,
+        TelegramUnauthorizedError,
+    )
+
+    if isinstance(exc, (TelegramUnauthorizedError, TelegramNetworkError)):
+        return True
+    return isinstance(exc, TelegramBadRequest) and "can't parse entities" in exc.message
+
+
+async def _deliver(bot, chat_id: int, text: str) -> tuple[str, str | None, Exception | None]:
+    while True:
+        try:
+            # Admin text is sent as is: the bot's default HTML parse mode would
+            # reject any message containing '<' or '&'.
+            await bot.send_message(chat_id, text, parse_mode=None)
+            return "SENT", None, None
+        except Exception as exc:
+            if _is_flood_error(exc):
+                # Every sender is paused by the shared gate; wait it out and retry.
+                await asyncio.sleep(exc.retry_after)
+                continue
+            code = send_error_code(exc)
+            return ("FORBIDDEN" if code == "FORBIDDEN" else "ERROR"), code, exc
+
+
+async def _run(broadcast, page_size: int) -> dict[str, int]:
+    from ..telegram.bot import create_bot
+
+    # One bot and one HTTP session for the whole run, paced by the shared rate limiter.
+    bot = create_bot(enforce_flood_gate=True)
+    semaphore = asyncio.Semaphore(settings.broadcast_concurrency)
+    totals = {"SENT": 0, "FORBIDDEN": 0, "ERROR": 0}
+
+    async def send(chat_id: int):
+        async with semaphore:
+            return await _deliver(bot, chat_id, broadcast.text)
+
+    last_user_id = broadcast.last_user_id
+    try:
+        while True:
+            with session_scope() as session:
+                page = BroadcastRepository(session).recipients_after(last_user_id, page_size)
+            if not page:
+                break
+
+            outcomes = await asyncio.gather(*(send(row.tg_chat_id) for row in page))
+            # One error for the whole page points at the bot or the text rather than
+            # the recipients: stop before the checkpoint so --resume sends it again.
+            # A single recipient only stops the run on an error that is global.
+            errors = [error for status, _, error in outcomes if status == "ERROR"]
+            reasons = {f"{send_error_code(error)}: {error}" for error in errors}
+            if (
+                len(errors) == len(page)
+                and len(reasons) == 1
+                and (len(page) > 1 or _is_global_error(errors[0]))
+            ):
+                raise BroadcastAborted(broadcast.id, reasons.pop())
+
+            now = utc_now()
+            results = []
+            forbidden = []
+            for row, (status, code, _) in zip(page, outcomes):
+                results.append(
+                    {
+                        "user_id": row.id,
+                        "status": status,
+                        "error_code": code,
+                        "sent_at": now if status == "SENT" else None,
+                    }
+                )
+                if status == "FORBIDDEN":
+                    forbidden.append(row.id)
+                totals[status] += 1
+                BROADCAST_MESSAGES.labels(status).inc()
+            last_user_id = page[-1].id
+
+            with session_scope() as session:
+                BroadcastRepository(session).record_page(broadcast.id, results, last_user_id)
+                UserRepository(session).mark_unreachable_many(forbidden, now)
+
+        with session_scope() as session:
+            BroadcastRepository(session).finish(broadcast.id, utc_now())
+    finally:
+        await bot.session.close()
+    return totals
+
+
+def run_broadcast(broadcast_id: int, page_size: int | None = None) -> dict[str, int] | None:
+    # Resumes from the checkpoint when the broadcast was interrupted; only one
+    # runner per broadcast should be started at a time.
+    with session_scope() as session:
+        broadcast = BroadcastRepository(session).start(broadcast_id)
+    if broadcast is None:
+        return None
+    return asyncio.run(_run(broadcast, page_size or settings.broadcast_page_size))
+
+
+def create_broadcast(text: str) -> int:
+    with session_scope() as session:
+        return BroadcastRepository(session).create(text)
@@ -0,0 +1,131 @@
+﻿from __future__ import annotations
+
+from array import array
+from bisect import bisect_left
+from datetime import datetime, time, timezone
+from typing import Iterable
+from zoneinfo import ZoneInfo
+
+MINUTES_PER_DAY = 24 * 60
+_MINUTE_BITS = 11
+_MINUTE_MASK = (1 << _MINUTE_BITS) - 1
+
+
+def utc_minute_of_day(instant: datetime) -> int:
+    instant = instant.astimezone(timezone.utc)
+    return instant.hour * 60 + instant.minute
+
+
+class DueIndex:
+    # Users are kept in flat arrays rather than objects: a sorted directory of ids
+    # with a packed (timezone index, local minute) word each, plus the id again in
+    # the bucket of its UTC minute of day. That is 20 bytes per user.
+
+    def __init__(self, as_of: datetime):
+        self._ids = array("q")
+        self._meta = array("I")
+        self._buckets = [array("q") for _ in range(MINUTES_PER_DAY)]
+        self._timezones: list[str] = []
+        self._tz_index: dict[str, int] = {}
+        # Minutes east of UTC per timezone index, valid at `as_of`.
+        self._offsets = array("i")
+        self.as_of = as_of
+
+    @classmethod
+    def build(cls, rows: Iterable[tuple[int, str, time]], as_of: datetime) -> DueIndex:
+        index = cls(as_of)
+        for user_id, tz_name, local_time in rows:
+            if index._ids and user_id <= index._ids[-1]:
+                index.upsert(user_id, tz_name, local_time)
+                continue
+            # Rows ordered by id append to the directory without a search.
+            meta = index._pack(tz_name, local_time)
+            index._ids.append(user_id)
+            index._meta.append(meta)
+            index._buckets[index._bucket(meta)].append(user_id)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, user_id: int) -> bool:
+        return self._find(user_id) is not None
+
+    def upsert(self, user_id: int, tz_name: str, local_time: time) -> None:
+        meta = self._pack(tz_name, local_time)
+        pos = bisect_left(self._ids, user_id)
+        if pos < len(self._ids) and self._ids[pos] == user_id:
+            old = self._meta[pos]
+            if old == meta:
+                return
+            self._buckets[self._bucket(old)].remove(user_id)
+            self._meta[pos] = meta
+        else:
+            self._ids.insert(pos, user_id)
+            self._meta.insert(pos, meta)
+        self._buckets[self._bucket(meta)].append(user_id)
+
+    def remove(self, user_id: int) -> bool:
+        pos = self._find(user_id)
+        if pos is None:
+            return False
+        self._buckets[self._bucket(self._meta[pos])].remove(user_id)
+        del self._ids[pos]
+        del self._meta[pos]
+        return True
+
+    def due(self, minute: int) -> array:
+        return array("q", self._buckets[minute % MINUTES_PER_DAY])
+
+    def due_at(self, instant: datetime) -> array:
+        return self.due(utc_minute_of_day(instant))
+
+    def refresh_offsets(self, as_of: datetime) -> int:
+        # Re-buckets only the users of timezones whose UTC offset changed (DST).
+        self.as_of = as_of
+        changed = {}
+        for tz_index, tz_name in enumerate(self._timezones):
+            offset = _utc_offset(tz_name, as_of)
+            if offset != self._offsets[tz_index]:
+                changed[tz_index] = self._offsets[tz_index]
+                self._offsets[tz_index] = offset
+        if not changed:
+            return 0
+
+        moved = 0
+        for pos, meta in enumerate(self._meta):
+            tz_index = meta >> _MINUTE_BITS
+            if tz_index not in changed:
+                continue
+            local_minute = meta & _MINUTE_MASK
+            old_bucket = (local_minute - changed[tz_index]) % MINUTES_PER_DAY
+            self._buckets[old_bucket].remove(self._ids[pos])
+            self._buckets[self._bucket(meta)].append(self._ids[pos])
+            moved += 1
+        return moved
+
+    def memory_bytes(self) -> int:
+        arrays = [self._ids, self._meta, self._offsets, *self._buckets]
+        return sum(len(values) * values.itemsize for values in arrays)
+
+    def _find(self, user_id: int) -> int | None:
+        pos = bisect_left(self._ids, user_id)
+        if pos < len(self._ids) and self._ids[pos] == user_id:
+            return pos
+        return None
+
+    def _pack(self, tz_name: str, local_time: time) -> int:
+        tz_index = self._tz_index.get(tz_name)
+        if tz_index is None:
+            tz_index = len(self._timezones)
+            self._timezones.append(tz_name)
+            self._tz_index[tz_name] = tz_index
+            self._offsets.append(_utc_offset(tz_name, self.as_of))
+        return tz_index << _MINUTE_BITS | (local_time.hour * 60 + local_time.minute)
+
+    def _bucket(self, meta: int) -> int:
+        return ((meta & _MINUTE_MASK) - self._offsets[meta >> _MINUTE_BITS]) % MINUTES_PER_DAY
+
+
+def _utc_offset(tz_name: str, as_of: datetime) -> int:
+    return int(as_of.astimezone(ZoneInfo(tz_name)).utcoffset().total_seconds() // 60)
@@ -0,0 +1,142 @@
+﻿from __future__ import annotations
+
+import csv
+import io
+from datetime import date
+from typing import Iterable, Iterator
+
+from sqlalchemy import and_, select
+
+from ..config import settings
+from ..models import Checkin, DailyState
+
+EXPORT_COLUMNS = (
+    "checkin_id",
+    "user_id",
+    "date_local",
+    "created_at",
+    "is_late",
+    "geo_lat",
+    "geo_lon",
+    "photo_file_id",
+    "photo_s3_key",
+    "state",
+    "due_at_utc",
+    "deadline_at_utc",
+    "reminders_sent_count",
+    "escalation_sent_at",
+)
+
+
+def checkin_export_query(date_from: date, date_to: date, user_ids: Iterable[int] | None = None):
+    stmt = (
+        select(
+            Checkin.id.label("checkin_id"),
+            Checkin.user_id,
+            Checkin.date_local,
+            Checkin.created_at,
+            Checkin.is_late,
+            Checkin.geo_lat,
+            Checkin.geo_lon,
+            Checkin.photo_file_id,
+            Checkin.photo_s3_key,
+            DailyState.state,
+            DailyState.due_at_utc,
+            DailyState.deadline_at_utc,
+            DailyState.reminders_sent_count,
+            DailyState.escalation_sent_at,
+        )
+        .outerjoin(
+            DailyState,
+            and_(DailyState.user_id == Checkin.user_id, DailyState.date_local == Checkin.date_local),
+        )
+        .where(Checkin.date_local >= date_from, Checkin.date_local <= date_to)
+        .order_by(Checkin.date_local, Checkin.id)
+        # yield_per streams through a server-side cursor on Postgres instead of
+        # buffering the whole result in the driver.
+        .execution_options(yield_per=settings.export_batch_size)
+    )
+    if user_ids:
+        stmt = stmt.where(Checkin.user_id.in_(list(user_ids)))
+    return stmt
+
+
+def iter_export_batches(session, date_from: date, date_to: date, user_ids=None) -> Iterator[list]:
+    result = session.execute(checkin_export_query(date_from, date_to, user_ids))
+    yield from result.partitions()
+
+
+def _plain(value):
+    if value is None:
+        return ""
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    if hasattr(value, "value"):
+        return value.value
+    return value
+
+
+def iter_csv(batches: Iterable[list]) -> Iterator[str]:
+    # One chunk per batch: the header first, then `export_batch_size` rows at a time.
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for batch in batches:
+        writer.writerows([_plain(value) for value in row] for row in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def write_csv(batches: Iterable[list], stream) -> int:
+    rows = 0
+
+    def counted():
+        nonlocal rows
+        for batch in batches:
+            rows += len(batch)
+            yield batch
+
+    for chunk in iter_csv(counted()):
+        stream.write(chunk)
+    return rows
+
+
+def write_parquet(batches: Iterable[list], path: str) -> int:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as exc:
+        raise RuntimeError(
+            "Parquet export needs pyarrow: pip install 'daily-checkin-bot[export]'"
+        ) from exc
+
+    schema = pa.schema(
+        [
+            ("checkin_id", pa.int64()),
+            ("user_id", pa.int64()),
+            ("date_local", pa.date32()),
+            ("created_at", pa.timestamp("us", tz="UTC")),
+            ("is_late", pa.bool_()),
+            ("geo_lat", pa.float64()),
+            ("geo_lon", pa.float64()),
+            ("photo_file_id", pa.string()),
+            ("photo_s3_key", pa.string()),
+            ("state", pa.string()),
+            ("due_at_utc", pa.timestamp("us", tz="UTC")),
+            ("deadline_at_utc", pa.timestamp("us", tz="UTC")),
+            ("reminders_sent_count", pa.int32()),
+            ("escalation_sent_at", pa.timestamp("us", tz="UTC")),
+        ]
+    )
+    state_column = EXPORT_COLUMNS.index("state")
+    rows = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for batch in batches:
+            columns = [list(column) for column in zip(*batch)]
+            columns[state_column] = [_plain(value) or None for value in columns[state_column]]
+            writer.write_batch(pa.record_batch(columns, schema=schema))
+            rows += len(batch)
+    return rows
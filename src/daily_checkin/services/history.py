@@ -0,0 +1,49 @@
+﻿from __future__ import annotations
+
+from datetime import date, timedelta
+
+from ..models import DailyStateEnum, UserSummary
+from ..repositories import HISTORY_DAYS
+
+DEFAULT_HISTORY_DAYS = 14
+
+
+def day_status(summary: UserSummary, day: date) -> DailyStateEnum | None:
+    if summary.history_end is None or day > summary.history_end:
+        return None
+    offset = (summary.history_end - day).days
+    if offset >= HISTORY_DAYS:
+        return None
+    if summary.done_bits >> offset & 1:
+        return DailyStateEnum.DONE
+    if summary.missed_bits >> offset & 1:
+        return DailyStateEnum.MISSED
+    return None
+
+
+def build_history(summary: UserSummary | None, today: date, days: int = DEFAULT_HISTORY_DAYS) -> dict:
+    days = max(1, min(days, HISTORY_DAYS))
+    if summary is None:
+        summary = UserSummary(
+            current_streak=0, best_streak=0, total_done=0, total_missed=0, done_bits=0, missed_bits=0
+        )
+
+    # The stored streak ends at the last completed day; it is still running only
+    # if that day is today or yesterday.
+    current_streak = summary.current_streak
+    if summary.last_done_date is None or summary.last_done_date < today - timedelta(days=1):
+        current_streak = 0
+
+    history = []
+    for i in range(days - 1, -1, -1):
+        day = today - timedelta(days=i)
+        status = day_status(summary, day)
+        history.append({"date": day.isoformat(), "status": status.value if status else None})
+
+    return {
+        "current_streak": current_streak,
+        "best_streak": summary.best_streak,
+        "total_done": summary.total_done,
+        "total_missed": summary.total_missed,
+        "days": history,
+    }
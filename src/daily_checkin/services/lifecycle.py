@@ -0,0 +1,32 @@
+﻿from __future__ import annotations
+
+from datetime import timedelta
+
+from ..celery_app import TaskMessage
+from ..config import settings
+from ..db import session_scope
+from ..repositories import OutboxRepository, UserRepository
+from ..utils_time import ensure_utc, utc_now
+
+UNREACHABLE_REASON = "Пользователь недоступен/возможно удалил или заблокировал бота."
+
+
+def sweep_user_lifecycle(batch_size: int | None = None) -> dict[str, int]:
+    now = utc_now()
+    recheck = timedelta(hours=settings.unreachable_recheck_hours)
+    with session_scope() as session:
+        users = UserRepository(session)
+        reactivated = users.reactivate_expired_pauses(now)
+        due = users.claim_unreachable_due(
+            now - recheck, now, batch_size or settings.lifecycle_sweep_batch_size
+        )
+        # Queued in the claiming transaction, so contacts are notified only if the claim
+        # commits; the escalation task already handles flood pauses.
+        OutboxRepository(session).add(
+            TaskMessage(
+                "tasks.notify_contacts_last_checkin",
+                [row.id, UNREACHABLE_REASON, (ensure_utc(row.unreachable_since) + recheck).isoformat()],
+            )
+            for row in due
+        )
+    return {"reactivated": reactivated, "unreachable": len(due)}
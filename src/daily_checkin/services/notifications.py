@@ -2,20 +2,17 @@
 
 import asyncio
 from datetime import datetime
-
-from aiogram import Bot
-from aiogram.utils.keyboard import InlineKeyboardBuilder
-from redis import Redis
+from typing import TYPE_CHECKING
 
 from ..config import settings
-from ..db import session_scope
+from ..db import read_session_scope, session_scope
+from ..metrics import observe_send_lag
 from ..models import TrustedContact
 from ..repositories import CheckinRepository, ContactRepository, NotificationLogRepository, UserRepository
-from ..telegram.rate_limiter import RateLimiter
-
+from ..utils_time import ensure_utc
 
-redis_client = Redis.from_url(settings.redis_url)
-rate_limiter = RateLimiter(redis_client, settings.telegram_rate_limit_per_sec)
+if TYPE_CHECKING:
+    from aiogram import Bot
 
 
 async def _send_message(bot: Bot, chat_id: int, text: str, reply_markup=None):
@@ -26,6 +23,32 @@ async def _send_photo(bot: Bot, chat_id: int, file_id: str, caption: str):
     await bot.send_photo(chat_id=chat_id, photo=file_id, caption=caption)
 
 
+def _create_bot() -> Bot:
+    from aiogram import Bot
+
+    from ..telegram.flood import FloodControlMiddleware, get_flood_gate
+
+    bot = Bot(token=settings.telegram_bot_token)
+    bot.session.middleware(FloodControlMiddleware(get_flood_gate()))
+    return bot
+
+
+def _is_flood_error(exc: Exception) -> bool:
+    from ..telegram.flood import FloodControlError
+
+    return isinstance(exc, FloodControlError)
+
+
+def send_error_code(exc: Exception) -> str:
+    from aiogram.exceptions import TelegramAPIError, TelegramForbiddenError
+
+    if isinstance(exc, TelegramForbiddenError):
+        return "FORBIDDEN"
+    if isinstance(exc, TelegramAPIError):
+        return "API_ERROR"
+    return "SEND_ERROR"
+
+
 def _run_async(coro):
     return asyncio.run(coro)
 
@@ -34,11 +57,13 @@ def send_contact_consent_request(user_id: int, contact_id: int):
     with session_scope() as session:
         users = UserRepository(session)
         contact = session.get(TrustedContact, contact_id)
-        user = users.get_by_id(user_id)
+        user = users.get_view(user_id)
         if not contact or not user:
             return
 
-    bot = Bot(token=settings.telegram_bot_token)
+    from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+    bot = _create_bot()
 
     kb = InlineKeyboardBuilder()
     kb.button(text="✅ Да", callback_data=f"contact_:approve_{contact_id}")
@@ -52,22 +77,26 @@ def send_contact_consent_request(user_id: int, contact_id: int):
     _run_async(_send_message(bot, contact.contact_chat_id, text, kb.as_markup()))
 
 
-def notify_contacts_last_checkin(user_id: int, reason: str):
+def notify_contacts_last_checkin(user_id: int, reason: str, scheduled_for: datetime | None = None):
+    with read_session_scope() as session:
+        contacts = ContactRepository(session).list_approved(user_id)
+        last = CheckinRepository(session).latest_for_user(user_id)
+    if not contacts:
+        return
+
     with session_scope() as session:
-        contacts_repo = ContactRepository(session)
-        checkins = CheckinRepository(session)
         logs = NotificationLogRepository(session)
-        contacts = contacts_repo.list_approved(user_id)
-        last = checkins.latest_for_user(user_id)
-
-        if not contacts:
-            return
-
-        bot = Bot(token=settings.telegram_bot_token)
+        bot = _create_bot()
+        flood = None
 
         for contact in contacts:
+            # scheduled_for tells one missed day or unreachable episode from the next.
             key = f"escalation:{user_id}:{contact.contact_chat_id}:{reason}"
-            if not logs.try_insert(key, "ESCALATION", user_id, contact.contact_chat_id):
+            if scheduled_for is not None:
+                key += f":{ensure_utc(scheduled_for).isoformat()}"
+            if not logs.try_insert(
+                key, "ESCALATION", user_id, contact.contact_chat_id, scheduled_for=scheduled_for
+            ):
                 continue
 
             text = "Пользователь не отметился вовремя. " + reason
@@ -75,26 +104,36 @@ def notify_contacts_last_checkin(user_id: int, reason: str):
                 text += f"\nПоследняя отметка: {last.created_at}"
                 if last.geo_lat is not None and last.geo_lon is not None:
                     text += f"\nГео: {last.geo_lat}, {last.geo_lon}"
+            payload = {"text": text, "photo_file_id": last.photo_file_id if last else None}
             try:
                 if last:
                     _run_async(_send_photo(bot, contact.contact_chat_id, last.photo_file_id, text))
                 else:
                     _run_async(_send_message(bot, contact.contact_chat_id, text))
                 logs.mark_sent(key)
+                observe_send_lag("ESCALATION", scheduled_for)
             except Exception as exc:
-                logs.mark_error(key, "SEND_ERROR", str(exc))
+                if _is_flood_error(exc):
+                    # Contacts already notified stay SENT; the rest go out on retry.
+                    logs.release(key)
+                    flood = exc
+                    break
+                logs.mark_error(key, send_error_code(exc), str(exc), payload)
+
+    if flood is not None:
+        raise flood
 
 
 def notify_contacts_online(user_id: int, when_text: str):
+    with read_session_scope() as session:
+        contacts = ContactRepository(session).list_approved(user_id)
+    if not contacts:
+        return
+
     with session_scope() as session:
-        contacts_repo = ContactRepository(session)
         logs = NotificationLogRepository(session)
-        contacts = contacts_repo.list_approved(user_id)
-
-        if not contacts:
-            return
-
-        bot = Bot(token=settings.telegram_bot_token)
+        bot = _create_bot()
+        flood = None
 
         for contact in contacts:
             key = f"online:{user_id}:{contact.contact_chat_id}:{when_text}"
@@ -106,4 +145,11 @@ def notify_contacts_online(user_id: int, when_text: str):
                 _run_async(_send_message(bot, contact.contact_chat_id, text))
                 logs.mark_sent(key)
             except Exception as exc:
-                logs.mark_error(key, "SEND_ERROR", str(exc))
+                if _is_flood_error(exc):
+                    logs.release(key)
+                    flood = exc
+                    break
+                logs.mark_error(key, send_error_code(exc), str(exc), {"text": text})
+
+    if flood is not None:
+        raise flood
@@ -0,0 +1,43 @@
+﻿from __future__ import annotations
+
+import logging
+import threading
+
+from ..celery_app import TaskMessage, publish_many
+from ..config import settings
+from ..db import session_scope
+from ..metrics import OUTBOX_RELAYED
+from ..repositories import OutboxRepository
+from ..utils_time import ensure_utc
+
+logger = logging.getLogger(__name__)
+
+
+def relay_batch(batch_size: int | None = None) -> int:
+    # Rows are deleted in the transaction that published them. A crash between
+    # publish and commit re-sends the batch; tasks dedupe through notification_log.
+    with session_scope() as session:
+        outbox = OutboxRepository(session)
+        rows = outbox.claim(batch_size or settings.outbox_batch_size)
+        if not rows:
+            return 0
+        publish_many(
+            TaskMessage(row.task_name, row.args, row.kwargs, ensure_utc(row.eta) if row.eta else None)
+            for row in rows
+        )
+        outbox.delete([row.id for row in rows])
+    OUTBOX_RELAYED.inc(len(rows))
+    return len(rows)
+
+
+def run_relay(stop: threading.Event) -> None:
+    batch_size = settings.outbox_batch_size
+    while not stop.is_set():
+        try:
+            relayed = relay_batch(batch_size)
+        except Exception:
+            logger.exception("outbox relay batch failed")
+            relayed = 0
+        # A full batch means more is waiting; otherwise idle until the next poll.
+        if relayed < batch_size:
+            stop.wait(settings.outbox_poll_interval_seconds)
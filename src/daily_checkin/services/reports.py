@@ -0,0 +1,58 @@
+﻿from __future__ import annotations
+
+import math
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import select
+
+from ..models import NotificationLog
+from ..utils_time import ensure_utc
+
+LAG_PERCENTILES = (50, 95, 99)
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        raise ValueError("percentile of an empty sequence")
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def _summarize(values: list[float]) -> dict:
+    values.sort()
+    summary = {"count": len(values)}
+    for pct in LAG_PERCENTILES:
+        summary[f"p{pct}"] = percentile(values, pct)
+    return summary
+
+
+def send_lag_report(session, since: datetime, until: datetime) -> dict:
+    stmt = (
+        select(NotificationLog.type, NotificationLog.scheduled_for, NotificationLog.sent_at)
+        .where(
+            NotificationLog.status == "SENT",
+            NotificationLog.scheduled_for.is_not(None),
+            NotificationLog.scheduled_for >= since,
+            NotificationLog.scheduled_for < until,
+        )
+        .execution_options(yield_per=5000)
+    )
+
+    by_type: dict[str, list[float]] = defaultdict(list)
+    by_hour: dict[tuple[str, int], list[float]] = defaultdict(list)
+    for type_, scheduled_for, sent_at in session.execute(stmt):
+        scheduled_for = ensure_utc(scheduled_for)
+        lag = max((ensure_utc(sent_at) - scheduled_for).total_seconds(), 0.0)
+        by_type[type_].append(lag)
+        by_hour[(type_, scheduled_for.hour)].append(lag)
+
+    return {
+        "since": since.isoformat(),
+        "until": until.isoformat(),
+        "by_type": {type_: _summarize(values) for type_, values in sorted(by_type.items())},
+        "by_hour": {
+            f"{type_}:{hour:02d}": _summarize(values)
+            for (type_, hour), values in sorted(by_hour.items())
+        },
+    }
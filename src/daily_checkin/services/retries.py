@@ -0,0 +1,137 @@
+﻿from __future__ import annotations
+
+import asyncio
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import select, tuple_
+
+from ..config import settings
+from ..db import session_scope
+from ..metrics import NOTIFICATION_RETRIES, observe_send_lag
+from ..models import DailyState, DailyStateEnum
+from ..repositories import NotificationLogRepository, retry_delay
+from ..utils_time import ensure_utc, utc_now
+from .notifications import _create_bot, _is_flood_error, _send_message, _send_photo, send_error_code
+
+RETRY_CONCURRENCY = 10
+
+
+def _lease() -> timedelta:
+    # Long enough for a whole batch to go out before the rows become claimable again.
+    return timedelta(seconds=max(settings.notification_retry_interval_seconds * 5, 300))
+
+
+def _is_stale(row, now: datetime, states: dict) -> bool:
+    payload = row.payload or {}
+    expires_at = payload.get("expires_at")
+    if expires_at and ensure_utc(datetime.fromisoformat(expires_at)) <= now:
+        return True
+    state = states.get((row.user_id, payload.get("date_local")))
+    if row.type == "REMINDER":
+        return state is None or state.state != DailyStateEnum.PENDING
+    if row.type == "LATE_PROMPT":
+        return state is None or state.late_prompt_response_at is not None
+    return False
+
+
+def _load_states(session, rows) -> dict:
+    keys = {
+        (row.user_id, date.fromisoformat(row.payload["date_local"]))
+        for row in rows
+        if row.type in ("REMINDER", "LATE_PROMPT") and (row.payload or {}).get("date_local")
+    }
+    if not keys:
+        return {}
+    stmt = select(
+        DailyState.user_id,
+        DailyState.date_local,
+        DailyState.state,
+        DailyState.late_prompt_response_at,
+    ).where(tuple_(DailyState.user_id, DailyState.date_local).in_(keys))
+    return {(state.user_id, state.date_local.isoformat()): state for state in session.execute(stmt)}
+
+
+async def _resend(bot, row):
+    payload = row.payload
+    if payload.get("photo_file_id"):
+        await _send_photo(bot, row.target_chat_id, payload["photo_file_id"], payload["text"])
+        return
+    reply_markup = None
+    if payload.get("reply_markup"):
+        from aiogram.types import InlineKeyboardMarkup
+
+        reply_markup = InlineKeyboardMarkup.model_validate(payload["reply_markup"])
+    await _send_message(bot, row.target_chat_id, payload["text"], reply_markup)
+
+
+async def _resend_all(rows) -> list:
+    bot = _create_bot()
+    semaphore = asyncio.Semaphore(RETRY_CONCURRENCY)
+
+    async def send(row):
+        async with semaphore:
+            try:
+                await _resend(bot, row)
+            except Exception as exc:
+                return exc
+            return None
+
+    try:
+        return await asyncio.gather(*(send(row) for row in rows))
+    finally:
+        await bot.session.close()
+
+
+def _result(row, error: Exception | None, now: datetime) -> tuple[dict, str]:
+    if error is None:
+        observe_send_lag(row.type, row.scheduled_for)
+        return {"id": row.id, "status": "SENT", "sent_at": now, "next_attempt_at": None}, "sent"
+    if _is_flood_error(error):
+        # Deferred by Telegram, not a failed attempt.
+        return {"id": row.id, "next_attempt_at": now + timedelta(seconds=error.retry_after)}, "deferred"
+
+    attempts = row.attempts + 1
+    code = send_error_code(error)
+    values = {"id": row.id, "attempts": attempts, "error_code": code, "error_message": str(error)}
+    if code == "FORBIDDEN":
+        values["next_attempt_at"] = None
+        return values, "forbidden"
+    if attempts >= settings.notification_retry_max_attempts:
+        values.update(status="DEAD", next_attempt_at=None)
+        return values, "dead"
+    values["next_attempt_at"] = now + retry_delay(attempts)
+    return values, "failed"
+
+
+def retry_failed_notifications(batch_size: int | None = None) -> dict[str, int]:
+    now = utc_now()
+    limit = batch_size or settings.notification_retry_batch_size
+    with session_scope() as session:
+        rows = NotificationLogRepository(session).claim_due(now, limit, _lease())
+        states = _load_states(session, rows)
+
+    results = []
+    outcomes: dict[str, int] = {}
+
+    def record(row, values: dict, outcome: str):
+        results.append(values)
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        NOTIFICATION_RETRIES.labels(row.type, outcome).inc()
+
+    due = []
+    for row in rows:
+        if not row.payload or _is_stale(row, now, states):
+            expired = {"id": row.id, "status": "DEAD", "error_code": "EXPIRED", "next_attempt_at": None}
+            record(row, expired, "expired")
+        else:
+            due.append(row)
+
+    if due:
+        errors = asyncio.run(_resend_all(due))
+        sent_at = utc_now()
+        for row, error in zip(due, errors):
+            record(row, *_result(row, error, sent_at))
+
+    with session_scope() as session:
+        NotificationLogRepository(session).apply_results(results)
+    return outcomes
@@ -1,44 +1,37 @@
 ﻿from __future__ import annotations
 
-from datetime import datetime, timedelta, timezone
+import logging
+import threading
+from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 
-from celery import Celery
-
+from ..celery_app import TaskMessage, publish_many
 from ..config import settings
-from ..db import session_scope
+from ..db import read_session_scope, session_scope
 from ..repositories import DailyStateRepository, UserRepository
-from ..models import UserStatus
-from ..utils_time import combine_local_to_utc, add_minutes
+from ..utils_time import combine_local_to_utc, add_minutes, utc_now
+from .due_index import DueIndex
+from .tasks import checkin_due
+
+logger = logging.getLogger(__name__)
 
-celery_app = Celery(
-    "daily_checkin",
-    broker=settings.celery_broker_url,
-    backend=settings.celery_result_backend,
-)
-celery_app.conf.enable_utc = True
-celery_app.conf.timezone = "UTC"
+LAST_MINUTE_KEY = "daily_checkin:scheduler:last_minute"
 
 
-def enqueue_checkin_due(user_id: int):
-    celery_app.send_task("tasks.checkin_due", args=[user_id])
+def enqueue_checkin_due(session, user_id: int):
+    checkin_due.enqueue(session, user_id)
 
 
 def schedule_window():
+    pending: list[TaskMessage] = []
     with session_scope() as session:
         users_repo = UserRepository(session)
         states = DailyStateRepository(session)
-        now_utc = datetime.utcnow().replace(tzinfo=timezone.utc)
+        now_utc = utc_now()
         window_end = now_utc + timedelta(hours=settings.scheduler_window_hours)
 
-        for user in users_repo.list_all():
-            if user.status == UserStatus.PAUSED and user.pause_until:
-                if user.pause_until <= now_utc:
-                    user.status = UserStatus.ACTIVE
-                else:
-                    continue
-            if user.status != UserStatus.ACTIVE:
-                continue
+        users_repo.reactivate_expired_pauses(now_utc)
+        for user in users_repo.list_active():
             tz = ZoneInfo(user.timezone)
             local_start = now_utc.astimezone(tz).date()
             local_end = window_end.astimezone(tz).date()
@@ -47,5 +40,113 @@ def schedule_window():
                 due_at = combine_local_to_utc(user.timezone, current, user.checkin_time_local)
                 deadline_at = add_minutes(due_at, 90)
                 states.upsert_state(user.id, current, due_at, deadline_at)
-                celery_app.send_task("tasks.checkin_due", args=[user.id, current.isoformat()], eta=due_at)
+                pending.append(TaskMessage("tasks.checkin_due", [user.id, current.isoformat()], eta=due_at))
                 current = current + timedelta(days=1)
+            if len(pending) >= settings.celery_publish_batch_size:
+                publish_many(pending)
+                pending.clear()
+
+        publish_many(pending)
+
+
+def load_due_index(now: datetime) -> DueIndex:
+    with read_session_scope() as session:
+        return DueIndex.build(UserRepository(session).iter_schedule_rows(), now)
+
+
+def patch_due_index(index: DueIndex, user_ids: set[int]) -> None:
+    # Runs right after the change commits on the primary; a lagging replica would
+    # still return the old slot until the next full rebuild.
+    with session_scope() as session:
+        rows = UserRepository(session).iter_schedule_rows(user_ids).all()
+    for user_id, tz_name, local_time in rows:
+        index.upsert(user_id, tz_name, local_time)
+    for user_id in user_ids - {row.id for row in rows}:
+        index.remove(user_id)
+
+
+def schedule_due_minute(index: DueIndex, minute_start: datetime) -> int:
+    user_ids = index.due_at(minute_start)
+    if not user_ids:
+        return 0
+    minute_end = minute_start + timedelta(minutes=1)
+    pending: list[TaskMessage] = []
+    with session_scope() as session:
+        states = DailyStateRepository(session)
+        for user_id, tz_name, local_time in UserRepository(session).list_due_candidates(
+            user_ids, minute_start
+        ):
+            local_date = minute_start.astimezone(ZoneInfo(tz_name)).date()
+            due_at = combine_local_to_utc(tz_name, local_date, local_time)
+            if not minute_start <= due_at < minute_end:
+                continue
+            states.upsert_state(user_id, local_date, due_at, add_minutes(due_at, 90))
+            pending.append(TaskMessage("tasks.checkin_due", [user_id, local_date.isoformat()], eta=due_at))
+    publish_many(pending)
+    return len(pending)
+
+
+def _first_minute(redis, now: datetime) -> datetime:
+    # Minutes missed while the loop was down are replayed from the last one it
+    # scheduled; past minutes run without waiting and their tasks are due at once.
+    # Without a usable mark one schedule_window pass covers the gap instead.
+    from redis.exceptions import RedisError
+
+    current = now.replace(second=0, microsecond=0)
+    try:
+        stored = redis.get(LAST_MINUTE_KEY)
+    except RedisError:
+        logger.warning("last scheduled minute read failed", exc_info=True)
+        stored = None
+    if stored is not None:
+        last = datetime.fromisoformat(stored.decode())
+        if current - last <= timedelta(hours=settings.scheduler_window_hours):
+            return last + timedelta(minutes=1)
+    logger.info("no recent scheduled minute, running schedule_window to catch up")
+    schedule_window()
+    return current
+
+
+def _remember_minute(redis, minute: datetime) -> None:
+    from redis.exceptions import RedisError
+
+    try:
+        redis.set(LAST_MINUTE_KEY, minute.isoformat())
+    except RedisError:
+        logger.warning("last scheduled minute write failed", exc_info=True)
+
+
+def run_due_loop(stop: threading.Event) -> None:
+    # Long-running alternative to schedule_window: each minute is scheduled
+    # `due_index_lead_seconds` ahead from the in-memory index.
+    from ..user_events import ScheduleChangeListener
+
+    listener = ScheduleChangeListener()
+    listener.drain()
+    now = utc_now()
+    index = load_due_index(now)
+    rebuild_every = timedelta(minutes=settings.due_index_rebuild_minutes)
+    rebuilt_at = now
+    logger.info("due index built: %d users, %d bytes", len(index), index.memory_bytes())
+
+    lead = timedelta(seconds=settings.due_index_lead_seconds)
+    minute = _first_minute(listener.redis, now)
+    while not stop.is_set():
+        try:
+            changed = listener.drain()
+            if listener.lost or utc_now() - rebuilt_at >= rebuild_every:
+                listener.lost = False
+                rebuilt_at = utc_now()
+                index = load_due_index(rebuilt_at)
+            elif changed:
+                patch_due_index(index, changed)
+            index.refresh_offsets(minute)
+            schedule_due_minute(index, minute)
+            _remember_minute(listener.redis, minute)
+        except Exception:
+            # The same minute is retried, so its users are late rather than skipped.
+            logger.exception("scheduling minute %s failed", minute.isoformat())
+            stop.wait(5)
+            continue
+        minute += timedelta(minutes=1)
+        stop.wait(max((minute - lead - utc_now()).total_seconds(), 0))
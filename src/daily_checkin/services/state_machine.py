@@ -1,28 +1,61 @@
 ﻿from __future__ import annotations
 
-from datetime import datetime, timezone
+from datetime import date, datetime
+from typing import NamedTuple
 
-from ..repositories import CheckinRepository, DailyStateRepository
+from ..repositories import (
+    CheckinRepository,
+    DailyStateRepository,
+    StatsRepository,
+    UserRepository,
+    UserSummaryRepository,
+)
 from ..models import DailyStateEnum
-from ..utils_time import combine_local_to_utc, local_date_for, add_minutes, add_hours
+from ..utils_time import (
+    add_hours,
+    add_minutes,
+    combine_local_to_utc,
+    ensure_utc,
+    local_date_for,
+    utc_now,
+)
 from ..config import settings
 from .tasks import send_late_checkin_prompt
 
+DEADLINE_MINUTES = 90
 
-def record_checkin(session, user, photo_file_id: str):
+
+class CheckinResult(NamedTuple):
+    checkin_id: int
+    user_id: int
+    date_local: date
+    is_late: bool
+    late_prompt_due: bool
+
+
+def _late_prompt_due(is_late, state, escalation_sent_at, deadline_at_utc, now_utc) -> bool:
+    return (
+        is_late
+        and state == DailyStateEnum.MISSED
+        and escalation_sent_at is not None
+        and now_utc <= add_hours(ensure_utc(deadline_at_utc), settings.checkin_grace_hours)
+    )
+
+
+def _record_checkin(session, user, photo_file_id: str, now_utc: datetime):
     states = DailyStateRepository(session)
     checkins = CheckinRepository(session)
 
-    now_utc = datetime.utcnow().replace(tzinfo=timezone.utc)
     local_date = local_date_for(user.timezone, now_utc)
 
     state = states.get_state(user.id, local_date)
     if not state:
         due_at = combine_local_to_utc(user.timezone, local_date, user.checkin_time_local)
-        deadline_at = add_minutes(due_at, 90)
+        deadline_at = add_minutes(due_at, DEADLINE_MINUTES)
         state = states.upsert_state(user.id, local_date, due_at, deadline_at)
 
-    is_late = now_utc > state.deadline_at_utc
+    deadline_at_utc = ensure_utc(state.deadline_at_utc)
+    is_late = now_utc > deadline_at_utc
 
     checkin = checkins.create_checkin(
         user_id=user.id,
@@ -32,15 +65,44 @@ def record_checkin(session, user, photo_file_id: str):
         is_late=is_late,
     )
 
-    if state.state == DailyStateEnum.PENDING:
+    was_pending = state.state == DailyStateEnum.PENDING
+    if was_pending:
         states.mark_done(user.id, local_date)
+        UserSummaryRepository(session).record(user.id, local_date, done=True)
+    StatsRepository(session).increment(
+        local_date, user.timezone, done_count=int(was_pending), late_count=int(is_late)
+    )
 
-    if (
-        is_late
-        and state.state == DailyStateEnum.MISSED
-        and state.escalation_sent_at is not None
-        and now_utc <= add_hours(state.deadline_at_utc, settings.checkin_grace_hours)
-    ):
-        send_late_checkin_prompt.delay(user.id, local_date.isoformat())
+    late_prompt_due = _late_prompt_due(
+        is_late, state.state, state.escalation_sent_at, deadline_at_utc, now_utc
+    )
+    return checkin, late_prompt_due
 
+
+def record_checkin(session, user, photo_file_id: str):
+    now_utc = utc_now()
+    checkin, late_prompt_due = _record_checkin(session, user, photo_file_id, now_utc)
+    if late_prompt_due:
+        send_late_checkin_prompt.enqueue(session, user.id, checkin.date_local.isoformat())
     return checkin
+
+
+def ingest_checkin(session, tg_user_id: int, photo_file_id: str) -> CheckinResult | None:
+    now_utc = utc_now()
+
+    if session.get_bind().dialect.name == "postgresql":
+        row = CheckinRepository(session).ingest(
+            tg_user_id, photo_file_id, now_utc, DEADLINE_MINUTES
+        )
+        if row is None:
+            return None
+        late_prompt_due = _late_prompt_due(
+            row.is_late, row.prior_state, row.escalation_sent_at, row.deadline_at_utc, now_utc
+        )
+        return CheckinResult(row.checkin_id, row.user_id, row.date_local, row.is_late, late_prompt_due)
+
+    user = UserRepository(session).get_by_tg_user_id(tg_user_id)
+    if not user:
+        return None
+    checkin, late_prompt_due = _record_checkin(session, user, photo_file_id, now_utc)
+    return CheckinResult(checkin.id, user.id, checkin.date_local, checkin.is_late, late_prompt_due)
@@ -0,0 +1,154 @@
+﻿from __future__ import annotations
+
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from functools import lru_cache
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .models import DailyStateEnum
+
+logger = logging.getLogger(__name__)
+
+_PENDING_KEY = "daily_state_cache_snapshots"
+
+# Every write is a full snapshot carrying daily_state.version. A snapshot read
+# by an older transaction can land after a newer one, so it only replaces the
+# hash when its version is higher.
+_SET_IF_NEWER = """
+local current = redis.call('HGET', KEYS[1], 'version')
+if current and tonumber(current) >= tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV, 3))
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+_TIMESTAMP_FIELDS = (
+    "due_at_utc",
+    "deadline_at_utc",
+    "escalation_sent_at",
+    "late_prompt_sent_at",
+    "late_prompt_response_at",
+)
+
+
+class CachedState:
+    __slots__ = (
+        "user_id",
+        "date_local",
+        "state",
+        "due_at_utc",
+        "deadline_at_utc",
+        "reminders_sent_count",
+        "escalation_sent_at",
+        "late_prompt_sent_at",
+        "late_prompt_response_at",
+        "late_notify_contacts",
+    )
+
+    def __init__(self, user_id: int, date_local: date, fields: dict[bytes, bytes]):
+        self.user_id = user_id
+        self.date_local = date_local
+        self.state = DailyStateEnum(fields[b"state"].decode())
+        self.reminders_sent_count = int(fields.get(b"reminders_sent_count", 0))
+        for name in _TIMESTAMP_FIELDS:
+            raw = fields.get(name.encode(), b"")
+            setattr(self, name, datetime.fromisoformat(raw.decode()) if raw else None)
+        notify = fields.get(b"late_notify_contacts", b"")
+        self.late_notify_contacts = None if not notify else notify == b"1"
+
+
+@lru_cache(maxsize=1)
+def _client():
+    from redis import Redis
+
+    return Redis.from_url(settings.redis_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+
+def _key(user_id: int, date_local: date) -> str:
+    return f"daily_state:{user_id}:{date_local.isoformat()}"
+
+
+def _encode(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, DailyStateEnum):
+        return value.value
+    return str(value)
+
+
+def get(user_id: int, date_local: date) -> CachedState | None:
+    if not settings.daily_state_cache_enabled:
+        return None
+    from redis.exceptions import RedisError
+
+    try:
+        fields = _client().hgetall(_key(user_id, date_local))
+    except RedisError:
+        logger.warning("daily state cache read failed", exc_info=True)
+        return None
+    if not fields:
+        return None
+    return CachedState(user_id, date_local, fields)
+
+
+def stage_snapshot(session, state) -> None:
+    if not settings.daily_state_cache_enabled:
+        return
+    mapping = {
+        "state": _encode(state.state),
+        "reminders_sent_count": _encode(state.reminders_sent_count or 0),
+        "late_notify_contacts": _encode(state.late_notify_contacts),
+        "version": _encode(state.version or 0),
+    }
+    for name in _TIMESTAMP_FIELDS:
+        mapping[name] = _encode(getattr(state, name))
+    # Within a transaction the last snapshot of a row is the newest one.
+    session.info.setdefault(_PENDING_KEY, {})[_key(state.user_id, state.date_local)] = mapping
+
+
+@lru_cache(maxsize=1)
+def _writer() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="daily-state-cache")
+
+
+# A forked worker process does not inherit the writer thread.
+os.register_at_fork(after_in_child=_writer.cache_clear)
+
+
+def _write(snapshots: dict[str, dict[str, str]]) -> None:
+    from redis.exceptions import RedisError
+
+    ttl = settings.daily_state_cache_ttl_seconds
+    try:
+        pipe = _client().pipeline(transaction=False)
+        for key, mapping in snapshots.items():
+            args = [item for pair in mapping.items() for item in pair]
+            pipe.eval(_SET_IF_NEWER, 1, key, ttl, mapping["version"], *args)
+        pipe.execute()
+    except RedisError:
+        logger.warning("daily state cache write failed", exc_info=True)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_after_commit(session):
+    # The API handlers commit on the event loop, so the Redis round trip runs on
+    # a background thread instead; versions make the order of writes irrelevant.
+    snapshots = session.info.pop(_PENDING_KEY, None)
+    if snapshots:
+        _writer().submit(_write, snapshots)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
@@ -1,13 +1,14 @@
 ﻿from __future__ import annotations
 
-import io
-
-import boto3
+from functools import lru_cache
 
 from .config import settings
 
 
+@lru_cache(maxsize=1)
 def _client():
+    import boto3
+
     return boto3.client(
         "s3",
         endpoint_url=settings.s3_endpoint,
@@ -3,16 +3,38 @@
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
+from aiogram.fsm.storage.base import BaseStorage
 
 from ..config import settings
+from .middlewares import (
+    BotApiMetricsMiddleware,
+    HandlerMetricsMiddleware,
+    UnitOfWorkMiddleware,
+    UpdateLanesMiddleware,
+    UpdateMetricsMiddleware,
+)
+from .flood import FloodControlMiddleware, get_flood_gate
+from .lanes import LaneExecutor
 
 
-def create_bot() -> Bot:
-    return Bot(
+def create_bot(enforce_flood_gate: bool = False) -> Bot:
+    bot = Bot(
         token=settings.telegram_bot_token,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML),
     )
+    bot.session.middleware(BotApiMetricsMiddleware())
+    bot.session.middleware(FloodControlMiddleware(get_flood_gate(), enforce=enforce_flood_gate))
+    return bot
 
 
-def create_dispatcher() -> Dispatcher:
-    return Dispatcher()
\ No newline at end of file
+def create_dispatcher(
+    storage: BaseStorage | None = None, lanes: LaneExecutor | None = None
+) -> Dispatcher:
+    dp = Dispatcher(storage=storage)
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    if lanes is not None:
+        dp.update.outer_middleware(UpdateLanesMiddleware(lanes))
+    for observer in (dp.message, dp.callback_query):
+        observer.middleware(HandlerMetricsMiddleware())
+        observer.middleware(UnitOfWorkMiddleware())
+    return dp
\ No newline at end of file
@@ -0,0 +1,83 @@
+﻿from __future__ import annotations
+
+import asyncio
+import contextlib
+import hashlib
+import logging
+
+from aiogram import Bot, Dispatcher
+from redis.asyncio import Redis
+from redis.exceptions import LockError, RedisError
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_LOCK_KEY = "daily_checkin:lock:set_webhook"
+WEBHOOK_FINGERPRINT_KEY = "daily_checkin:webhook_fingerprint"
+POLLING_LOCK_KEY = "daily_checkin:lock:polling"
+
+
+async def register_webhook(bot: Bot, redis: Redis, url: str, secret: str | None) -> bool:
+    # Every API process runs startup; one of them registers the webhook and the
+    # rest skip. Telegram does not echo the secret back, so a fingerprint of the
+    # last registered url+secret is kept next to the lock.
+    lock = redis.lock(WEBHOOK_LOCK_KEY, timeout=60)
+    if not await lock.acquire(blocking=False):
+        return False
+    try:
+        fingerprint = hashlib.sha256(f"{url}\n{secret or ''}".encode()).hexdigest()
+        stored = await redis.get(WEBHOOK_FINGERPRINT_KEY)
+        info = await bot.get_webhook_info()
+        if info.url == url and stored is not None and stored.decode() == fingerprint:
+            return False
+        await bot.set_webhook(url=url, secret_token=secret)
+        await redis.set(WEBHOOK_FINGERPRINT_KEY, fingerprint)
+        logger.info("webhook registered at %s", url)
+        return True
+    finally:
+        with contextlib.suppress(LockError):
+            await lock.release()
+
+
+class PollingLeader:
+    # Only the holder of a Redis lock polls Telegram; the lock is renewed while
+    # polling runs, and the other processes keep trying so one of them takes
+    # over if the leader dies.
+    def __init__(self, dp: Dispatcher, bot: Bot, redis: Redis, ttl: int):
+        self.dp = dp
+        self.bot = bot
+        self.redis = redis
+        self.ttl = ttl
+
+    async def run(self) -> None:
+        while True:
+            lock = self.redis.lock(POLLING_LOCK_KEY, timeout=self.ttl)
+            try:
+                if await lock.acquire(blocking=False):
+                    await self._lead(lock)
+            except RedisError:
+                logger.warning("polling leader election failed", exc_info=True)
+            await asyncio.sleep(self.ttl / 2)
+
+    async def _lead(self, lock) -> None:
+        logger.info("acquired polling leadership")
+        # Updates queued while leadership changed hands belong to this poller. Only
+        # a webhook still registered from webhook mode is removed with its backlog.
+        info = await self.bot.get_webhook_info()
+        if info.url:
+            logger.info("switching from webhook %s to polling", info.url)
+            await self.bot.delete_webhook(drop_pending_updates=True)
+        polling = asyncio.create_task(
+            self.dp.start_polling(self.bot, handle_signals=False, close_bot_session=False)
+        )
+        try:
+            while not polling.done():
+                await asyncio.sleep(self.ttl / 3)
+                await lock.extend(self.ttl, replace_ttl=True)
+        except LockError:
+            logger.warning("lost polling leadership")
+        finally:
+            polling.cancel()
+            with contextlib.suppress(asyncio.CancelledError, Exception):
+                await polling
+            with contextlib.suppress(LockError):
+                await lock.release()
@@ -0,0 +1,45 @@
+﻿from __future__ import annotations
+
+import logging
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+# update_id grows monotonically, so one bitmap covers a contiguous range of ids
+# (8 KiB per 65536 updates) and expires as a whole once the range is old.
+BUCKET_BITS = 1 << 16
+KEY_PREFIX = "daily_checkin:updates_seen"
+
+
+def _location(update_id: int) -> tuple[str, int]:
+    bucket, offset = divmod(update_id, BUCKET_BITS)
+    return f"{KEY_PREFIX}:{bucket}", offset
+
+
+class UpdateDeduplicator:
+    def __init__(self, redis: Redis, ttl: int):
+        self.redis = redis
+        self.ttl = ttl
+
+    async def seen(self, update_id: int) -> bool:
+        # SETBIT returns the previous bit, so check and mark is one atomic call.
+        key, offset = _location(update_id)
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.setbit(key, offset, 1)
+                pipe.expire(key, self.ttl)
+                previous, _ = await pipe.execute()
+        except RedisError:
+            logger.warning("update dedup check failed", exc_info=True)
+            return False
+        return bool(previous)
+
+    async def forget(self, update_id: int) -> None:
+        # Lets Telegram's retry through when processing the first delivery failed.
+        key, offset = _location(update_id)
+        try:
+            await self.redis.setbit(key, offset, 0)
+        except RedisError:
+            logger.warning("update dedup reset failed", exc_info=True)
@@ -0,0 +1,90 @@
+﻿from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from functools import lru_cache
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from redis import Redis
+from redis.exceptions import RedisError
+
+from ..config import settings
+from ..metrics import TELEGRAM_FLOOD_DEFERRED, TELEGRAM_FLOOD_PAUSES
+from .rate_limiter import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+FLOOD_KEY = "daily_checkin:telegram_flood"
+
+# Only ever lengthens the pause: a shorter retry_after seen later must not cut
+# a longer one short.
+_EXTEND_PAUSE = """
+if redis.call('PTTL', KEYS[1]) < tonumber(ARGV[1]) then
+    redis.call('SET', KEYS[1], '1', 'PX', ARGV[1])
+end
+"""
+
+
+class FloodControlError(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"Telegram flood control, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class FloodGate:
+    def __init__(self, redis: Redis, rate_limiter: RateLimiter):
+        self.redis = redis
+        self.rate_limiter = rate_limiter
+
+    def remaining(self) -> float:
+        try:
+            ttl_ms = self.redis.pttl(FLOOD_KEY)
+        except RedisError:
+            logger.warning("flood gate check failed", exc_info=True)
+            return 0.0
+        return max(ttl_ms, 0) / 1000
+
+    def pause(self, seconds: float) -> None:
+        try:
+            self.redis.eval(_EXTEND_PAUSE, 1, FLOOD_KEY, int(seconds * 1000))
+        except RedisError:
+            logger.warning("flood gate update failed", exc_info=True)
+
+    def slot_available(self) -> bool:
+        try:
+            return self.rate_limiter.allow("global")
+        except RedisError:
+            logger.warning("rate limiter check failed", exc_info=True)
+            return True
+
+
+@lru_cache(maxsize=1)
+def get_flood_gate() -> FloodGate:
+    redis = Redis.from_url(settings.redis_url)
+    return FloodGate(redis, RateLimiter(redis, settings.telegram_rate_limit_per_sec))
+
+
+class FloodControlMiddleware(BaseRequestMiddleware):
+    # With enforce=True (worker senders) calls are refused while the cluster-wide
+    # pause is active and paced to TG_RATE_LIMIT_PER_SEC; the caller reschedules
+    # on FloodControlError. Without it (API replies) 429s are only recorded.
+    def __init__(self, gate: FloodGate, enforce: bool = True):
+        self.gate = gate
+        self.enforce = enforce
+
+    async def __call__(self, make_request, bot, method):
+        if self.enforce:
+            remaining = self.gate.remaining()
+            if remaining > 0:
+                TELEGRAM_FLOOD_DEFERRED.inc()
+                raise FloodControlError(remaining)
+            while not self.gate.slot_available():
+                await asyncio.sleep(1 - time.time() % 1)
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter as exc:
+            TELEGRAM_FLOOD_PAUSES.inc()
+            self.gate.pause(exc.retry_after)
+            raise FloodControlError(exc.retry_after) from exc
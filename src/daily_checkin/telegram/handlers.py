@@ -1,6 +1,6 @@
 ﻿from __future__ import annotations
 
-from datetime import datetime, time as dtime, timedelta, timezone
+from datetime import datetime, time as dtime, timedelta
 
 from aiogram import Router, F
 from aiogram.enums import ContentType
@@ -8,18 +8,28 @@ from aiogram.filters import Command
 from aiogram.types import Message, CallbackQuery
 from zoneinfo import ZoneInfo
 
+from .. import state_cache, user_events
 from ..db import session_scope
 from ..config import settings
 from ..repositories import (
     CheckinRepository,
     ContactRepository,
     DailyStateRepository,
+    OutboxRepository,
     UserRepository,
+    UserSummaryRepository,
 )
 from ..models import ContactStatus, UserStatus
+from ..services.history import build_history
 from ..services.scheduler import enqueue_checkin_due
-from ..services.state_machine import record_checkin
-from ..services.tasks import store_media_s3, send_online_status
+from ..services.state_machine import ingest_checkin
+from ..services.tasks import (
+    send_contact_consent_request,
+    send_late_checkin_prompt,
+    send_online_status,
+    store_media_s3,
+)
+from ..utils_time import local_date_for, utc_now
 
 router = Router()
 
@@ -61,6 +71,7 @@ async def set_timezone(message: Message):
             await message.answer("Сначала укажите время: /set_time HH:MM")
             return
         user.timezone = tz_name
+        user_events.stage_schedule_change(session, user.id)
         await message.answer("Таймзона сохранена.")
 
 
@@ -90,12 +101,13 @@ async def set_time(message: Message):
             )
         else:
             user.checkin_time_local = t
+        user_events.stage_schedule_change(session, user.id)
 
         await message.answer(
             "Время сохранено. Укажите таймзону: /set_timezone Europe/Moscow"
         )
 
-        enqueue_checkin_due(user.id)
+        enqueue_checkin_due(session, user.id)
 
 
 @router.message(Command("pause"))
@@ -105,7 +117,7 @@ async def pause_cmd(message: Message):
         await message.answer("Формат: /pause 1d или /pause 1w")
         return
     delta = timedelta(days=1) if parts[1] == "1d" else timedelta(days=7)
-    until = datetime.utcnow().replace(tzinfo=timezone.utc) + delta
+    until = utc_now() + delta
 
     with session_scope() as session:
         users = UserRepository(session)
@@ -156,17 +168,16 @@ async def add_contact_forward(message: Message):
             contact_tg_user_id=contact_user.id,
             contact_chat_id=contact_user.id,
         )
-        await message.answer(
-            "Запрос согласия отправлен контакту. Он должен подтвердить получение информации."
-        )
-
-    from ..services.tasks import send_contact_consent_request
+        send_contact_consent_request.enqueue(session, user.id, contact.id)
 
-    send_contact_consent_request.delay(user.id, contact.id)
+    await message.answer(
+        "Запрос согласия отправлен контакту. Он должен подтвердить получение информации."
+    )
 
 
 @router.message(Command("status"))
 async def status_cmd(message: Message):
+    # Read from the primary: /status usually follows a check-in the replica may lack.
     with session_scope() as session:
         users = UserRepository(session)
         states = DailyStateRepository(session)
@@ -174,8 +185,8 @@ async def status_cmd(message: Message):
         if not user:
             await message.answer("Пользователь не найден. /start")
             return
-        today = datetime.utcnow().astimezone(ZoneInfo(user.timezone)).date()
-        state = states.get_state(user.id, today)
+        today = utc_now().astimezone(ZoneInfo(user.timezone)).date()
+        state = state_cache.get(user.id, today) or states.get_state(user.id, today)
         if not state:
             await message.answer("Сегодняшний статус еще не создан.")
             return
@@ -186,42 +197,65 @@ async def status_cmd(message: Message):
         )
 
 
-@router.message(F.content_type == ContentType.PHOTO)
-async def checkin_photo(message: Message):
+_HISTORY_MARKS = {"DONE": "✅", "MISSED": "❌", None: "▫️"}
+
+
+@router.message(Command("history"))
+async def history_cmd(message: Message):
     with session_scope() as session:
         users = UserRepository(session)
         user = users.get_by_tg_user_id(message.from_user.id)
         if not user:
-            await message.answer("Сначала /start")
+            await message.answer("Пользователь не найден. /start")
             return
+        today = local_date_for(user.timezone, utc_now())
+        history = build_history(UserSummaryRepository(session).get(user.id), today)
 
-        photo = message.photo[-1]
-        checkin = record_checkin(
-            session=session,
-            user=user,
-            photo_file_id=photo.file_id,
-        )
+    marks = "".join(_HISTORY_MARKS[day["status"]] for day in history["days"])
+    await message.answer(
+        f"Серия: {history['current_streak']} (лучшая: {history['best_streak']})\n"
+        f"Отметок: {history['total_done']}, пропусков: {history['total_missed']}\n"
+        f"Последние {len(history['days'])} дней: {marks}"
+    )
 
-        if settings.store_media_in_s3:
-            store_media_s3.delay(checkin.id, photo.file_id)
+
+@router.message(F.content_type == ContentType.PHOTO)
+async def checkin_photo(message: Message):
+    photo_file_id = message.photo[-1].file_id
+    with session_scope() as session:
+        result = ingest_checkin(session, message.from_user.id, photo_file_id)
+        if result:
+            UserRepository(session).clear_unreachable(result.user_id)
+            follow_ups = []
+            if result.late_prompt_due:
+                follow_ups.append(
+                    send_late_checkin_prompt.message(result.user_id, result.date_local.isoformat())
+                )
+            if settings.store_media_in_s3:
+                follow_ups.append(store_media_s3.message(result.checkin_id, photo_file_id))
+            OutboxRepository(session).add(follow_ups)
+    if not result:
+        await message.answer("Сначала /start")
+        return
 
     await message.answer("Отметка сохранена. Спасибо!")
 
 
 @router.message(F.content_type == ContentType.LOCATION)
 async def checkin_geo(message: Message):
+    # The photo is committed before it is acknowledged, so a location handled by
+    # any process finds the row to update.
+    location = message.location
     with session_scope() as session:
-        users = UserRepository(session)
-        checkins = CheckinRepository(session)
-        user = users.get_by_tg_user_id(message.from_user.id)
-        if not user:
+        attached = CheckinRepository(session).attach_geo_to_latest(
+            message.from_user.id, location.latitude, location.longitude, minutes=5
+        )
+        if not attached and not UserRepository(session).get_by_tg_user_id(message.from_user.id):
             await message.answer("Сначала /start")
             return
-        recent = checkins.latest_within(user.id, minutes=5)
-        if not recent:
-            await message.answer("Нет свежей отметки, чтобы прикрепить геолокацию.")
-            return
-        checkins.attach_geo(recent.id, message.location.latitude, message.location.longitude)
+    if not attached:
+        await message.answer("Нет свежей отметки, чтобы прикрепить геолокацию.")
+        return
     await message.answer("Геолокация добавлена.")
 
 
@@ -260,9 +294,8 @@ async def late_notify_callback(callback: CallbackQuery):
             await callback.answer("Пользователь не найден")
             return
         states.set_late_response(user.id, datetime.fromisoformat(date_local).date(), notify)
-
-    if notify:
-        send_online_status.delay(user.id, date_local)
+        if notify:
+            send_online_status.enqueue(session, user.id, date_local)
 
     await callback.message.answer("Готово, ваш ответ сохранен.")
     await callback.answer()
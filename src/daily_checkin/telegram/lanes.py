@@ -0,0 +1,63 @@
+﻿from __future__ import annotations
+
+import asyncio
+import contextvars
+import time
+from typing import Any, Awaitable, Callable
+
+from ..metrics import LANE_QUEUE_DEPTH, LANE_WAIT_SECONDS
+
+
+class LaneExecutor:
+    # Updates of one chat always land on the same lane and run one after another;
+    # different chats spread over the lanes and run concurrently.
+    def __init__(self, lanes: int, queue_size: int):
+        self.size = lanes
+        self.queue_size = queue_size
+        self._queues: list[asyncio.Queue] = []
+        self._workers: list[asyncio.Task] = []
+
+    def _start(self) -> None:
+        self._queues = [asyncio.Queue(maxsize=self.queue_size) for _ in range(self.size)]
+        self._workers = [
+            asyncio.create_task(self._work(index, queue)) for index, queue in enumerate(self._queues)
+        ]
+
+    async def run(self, chat_id: int, func: Callable[..., Awaitable[Any]], *args) -> Any:
+        if not self._workers:
+            self._start()
+        index = chat_id % self.size
+        future = asyncio.get_running_loop().create_future()
+        # Blocks when the lane is full, which pushes back on the webhook caller.
+        await self._queues[index].put(
+            (func, args, future, contextvars.copy_context(), time.perf_counter())
+        )
+        LANE_QUEUE_DEPTH.labels(str(index)).set(self._queues[index].qsize())
+        return await future
+
+    async def _work(self, index: int, queue: asyncio.Queue) -> None:
+        lane = str(index)
+        while True:
+            func, args, future, context, enqueued_at = await queue.get()
+            LANE_QUEUE_DEPTH.labels(lane).set(queue.qsize())
+            LANE_WAIT_SECONDS.labels(lane).observe(time.perf_counter() - enqueued_at)
+            if future.cancelled():
+                continue
+            try:
+                result = await asyncio.create_task(func(*args), context=context)
+            except asyncio.CancelledError:
+                future.cancel()
+                if asyncio.current_task().cancelling():
+                    raise
+            except Exception as exc:
+                if not future.done():
+                    future.set_exception(exc)
+            else:
+                if not future.done():
+                    future.set_result(result)
+
+    async def close(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
@@ -0,0 +1,91 @@
+﻿from __future__ import annotations
+
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+from ..metrics import (
+    BOT_API_ERRORS,
+    BOT_API_LATENCY,
+    HANDLER_ERRORS,
+    HANDLER_LATENCY,
+    UPDATES_IN_FLIGHT,
+)
+from ..tracing import unit_of_work
+from .lanes import LaneExecutor
+
+
+def _handler_name(data: dict[str, Any]) -> str:
+    handler_object = data.get("handler")
+    return getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[Any, dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: dict[str, Any],
+    ) -> Any:
+        with UPDATES_IN_FLIGHT.track_inprogress():
+            return await handler(event, data)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[Any, dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: dict[str, Any],
+    ) -> Any:
+        name = _handler_name(data)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.labels(name).inc()
+            raise
+        finally:
+            HANDLER_LATENCY.labels(name).observe(time.perf_counter() - started)
+
+
+class BotApiMetricsMiddleware(BaseRequestMiddleware):
+    async def __call__(self, make_request, bot, method):
+        name = getattr(method, "__api_method__", type(method).__name__)
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as exc:
+            BOT_API_ERRORS.labels(name, type(exc).__name__).inc()
+            raise
+        finally:
+            BOT_API_LATENCY.labels(name).observe(time.perf_counter() - started)
+
+
+class UnitOfWorkMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[Any, dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: dict[str, Any],
+    ) -> Any:
+        with unit_of_work(f"handler.{_handler_name(data)}"):
+            return await handler(event, data)
+
+
+class UpdateLanesMiddleware(BaseMiddleware):
+    def __init__(self, lanes: LaneExecutor):
+        self.lanes = lanes
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: dict[str, Any],
+    ) -> Any:
+        chat = data.get("event_chat")
+        if chat is None:
+            return await handler(event, data)
+        return await self.lanes.run(chat.id, handler, event, data)
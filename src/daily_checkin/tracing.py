@@ -0,0 +1,101 @@
+﻿from __future__ import annotations
+
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+
+from sqlalchemy import event
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+_current_unit: ContextVar[UnitOfWork | None] = ContextVar("daily_checkin_unit_of_work", default=None)
+
+
+class UnitOfWork:
+    __slots__ = ("name", "statements", "db_time", "shapes")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.statements = 0
+        self.db_time = 0.0
+        self.shapes: dict[str, int] = {}
+
+
+def current_unit() -> UnitOfWork | None:
+    return _current_unit.get()
+
+
+def begin_unit(name: str) -> Token:
+    return _current_unit.set(UnitOfWork(name))
+
+
+def end_unit(token: Token) -> UnitOfWork | None:
+    unit = _current_unit.get()
+    _current_unit.reset(token)
+    if unit is not None and unit.statements:
+        from .metrics import UOW_DB_SECONDS, UOW_STATEMENTS
+
+        UOW_STATEMENTS.labels(unit.name).observe(unit.statements)
+        UOW_DB_SECONDS.labels(unit.name).observe(unit.db_time)
+    return unit
+
+
+@contextmanager
+def unit_of_work(name: str):
+    token = begin_unit(name)
+    try:
+        yield _current_unit.get()
+    finally:
+        end_unit(token)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+    if settings.sql_tracing_comment:
+        unit = _current_unit.get()
+        if unit is not None:
+            statement = f"{statement} /* unit='{unit.name}' */"
+    return statement, parameters
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    unit = _current_unit.get()
+    unit_name = unit.name if unit is not None else "-"
+
+    if elapsed * 1000 >= settings.sql_slow_query_ms:
+        logger.warning("slow query (%.1f ms) in %s: %s", elapsed * 1000, unit_name, statement[:500])
+
+    if unit is None:
+        return
+    unit.statements += 1
+    unit.db_time += elapsed
+    count = unit.shapes.get(statement, 0) + 1
+    unit.shapes[statement] = count
+    if count == settings.sql_repeat_warn_threshold + 1:
+        logger.warning(
+            "possible N+1 in %s: statement executed more than %d times: %s",
+            unit_name,
+            settings.sql_repeat_warn_threshold,
+            statement[:500],
+        )
+
+
+def _handle_error(context):
+    # ExceptionContextImpl in SQLAlchemy 2.1 never sets `cursor`; reading it
+    # replaced errors such as IntegrityError with AttributeError. The timer pushed
+    # by before_cursor_execute is dropped because after_cursor_execute won't run.
+    if context.connection is None:
+        return
+    started = context.connection.info.get("query_started")
+    if started:
+        started.pop()
+
+
+def instrument_engine(engine) -> None:
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute, retval=True)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
@@ -0,0 +1,84 @@
+﻿from __future__ import annotations
+
+import logging
+from functools import lru_cache
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_CHANNEL = "daily_checkin:user_schedule_changes"
+
+_PENDING_KEY = "user_schedule_changes"
+
+
+@lru_cache(maxsize=1)
+def _client():
+    from redis import Redis
+
+    return Redis.from_url(settings.redis_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+
+def stage_schedule_change(session, user_id: int) -> None:
+    # Published after commit so the scheduler re-reads a row that is already visible.
+    session.info.setdefault(_PENDING_KEY, set()).add(user_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_after_commit(session):
+    user_ids = session.info.pop(_PENDING_KEY, None)
+    if not user_ids:
+        return
+    from redis.exceptions import RedisError
+
+    try:
+        pipe = _client().pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.publish(SCHEDULE_CHANNEL, user_id)
+        pipe.execute()
+    except RedisError:
+        # The scheduler rebuilds its index periodically and picks the change up then.
+        logger.warning("user schedule change publish failed", exc_info=True)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+class ScheduleChangeListener:
+    def __init__(self, redis=None):
+        self.redis = redis or _client()
+        self._pubsub = None
+        self._failed = False
+        # Set on resubscribing after a failure: messages may have been missed, the
+        # caller should rebuild from the database and reset it.
+        self.lost = False
+
+    def drain(self) -> set[int]:
+        from redis.exceptions import RedisError
+
+        user_ids: set[int] = set()
+        try:
+            if self._pubsub is None:
+                self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                self._pubsub.subscribe(SCHEDULE_CHANNEL)
+                self.lost, self._failed = self._failed, False
+            while (message := self._pubsub.get_message(timeout=0)) is not None:
+                user_ids.add(int(message["data"]))
+        except RedisError:
+            logger.warning("user schedule change listener failed", exc_info=True)
+            self.close()
+            self._failed = True
+        return user_ids
+
+    def close(self) -> None:
+        if self._pubsub is not None:
+            try:
+                self._pubsub.close()
+            except Exception:
+                pass
+            self._pubsub = None
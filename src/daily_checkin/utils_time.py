@@ -1,10 +1,25 @@
 ﻿from __future__ import annotations
 
 from datetime import datetime, date, time, timedelta, timezone
+from typing import Callable
 from zoneinfo import ZoneInfo
 
+# Replaced by the simulation harness to run the services on virtual time.
+_clock: Callable[[], datetime] | None = None
 
-def _ensure_utc(dt_utc: datetime) -> datetime:
+
+def utc_now() -> datetime:
+    if _clock is not None:
+        return _clock()
+    return datetime.now(timezone.utc)
+
+
+def set_clock(clock: Callable[[], datetime] | None) -> None:
+    global _clock
+    _clock = clock
+
+
+def ensure_utc(dt_utc: datetime) -> datetime:
     if dt_utc.tzinfo is None:
         return dt_utc.replace(tzinfo=timezone.utc)
     return dt_utc.astimezone(timezone.utc)
@@ -12,7 +27,7 @@ def _ensure_utc(dt_utc: datetime) -> datetime:
 
 def local_date_for(tz_name: str, dt_utc: datetime) -> date:
     tz = ZoneInfo(tz_name)
-    return _ensure_utc(dt_utc).astimezone(tz).date()
+    return ensure_utc(dt_utc).astimezone(tz).date()
 
 
 def combine_local_to_utc(tz_name: str, d: date, t: time) -> datetime:
@@ -0,0 +1,27 @@
+﻿import pytest
+
+from benchmarks import run
+from benchmarks.compare import compare
+
+
+def test_compare_flags_regressions_over_threshold():
+    baseline = {"results": {"sqlite/10/a": {"median": 1.0}, "sqlite/10/b": {"median": 1.0}}}
+    current = {
+        "results": {
+            "sqlite/10/a": {"median": 1.3},
+            "sqlite/10/b": {"median": 1.05},
+            "sqlite/10/c": {"median": 0.5},
+        }
+    }
+
+    rows = {row["key"]: row["status"] for row in compare(baseline, current, threshold=0.15)}
+
+    assert rows == {"sqlite/10/a": "REGRESSION", "sqlite/10/b": "OK", "sqlite/10/c": "NEW"}
+
+
+def test_broker_cases_require_broker_flag(capsys):
+    with pytest.raises(SystemExit) as exc:
+        run.main(["--cases", "broker.publish"])
+
+    assert exc.value.code == 2
+    assert "require --broker" in capsys.readouterr().err
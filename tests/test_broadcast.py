@@ -0,0 +1,158 @@
+﻿from contextlib import contextmanager
+from datetime import time
+
+import pytest
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from aiogram.methods import SendMessage
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from daily_checkin.models import Base, Broadcast, BroadcastDelivery, User, UserStatus
+from daily_checkin.repositories import BroadcastRepository
+from daily_checkin.services import broadcast
+from daily_checkin.telegram import bot as telegram_bot
+
+
+class FakeSession:
+    async def close(self):
+        pass
+
+
+class FakeBot:
+    def __init__(self, sent, blocked, broken=False, missing=()):
+        self.session = FakeSession()
+        self.sent = sent
+        self.blocked = blocked
+        self.broken = broken
+        self.missing = missing
+
+    async def send_message(self, chat_id, text, parse_mode="HTML"):
+        method = SendMessage(chat_id=chat_id, text=text)
+        if self.broken:
+            raise TelegramBadRequest(method=method, message="can't parse entities")
+        if chat_id in self.missing:
+            raise TelegramBadRequest(method=method, message="chat not found")
+        if chat_id in self.blocked:
+            raise TelegramForbiddenError(method=method, message="bot was blocked by the user")
+        assert parse_mode is None
+        self.sent.append(chat_id)
+
+
+def test_broadcast_checkpoints_pages_and_resumes(monkeypatch):
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+
+    @contextmanager
+    def session_scope():
+        with Session() as session:
+            yield session
+            session.commit()
+
+    with session_scope() as session:
+        session.add_all(
+            User(
+                tg_user_id=chat_id,
+                tg_chat_id=chat_id,
+                timezone="UTC",
+                checkin_time_local=time(9, 0),
+                status=UserStatus.PAUSED if chat_id == 7 else UserStatus.ACTIVE,
+            )
+            for chat_id in range(1, 11)
+        )
+
+    sent = []
+    monkeypatch.setattr(broadcast, "session_scope", session_scope)
+    monkeypatch.setattr(broadcast.settings, "broadcast_concurrency", 2)
+    monkeypatch.setattr(telegram_bot, "create_bot", lambda **_: FakeBot(sent, blocked={3}))
+
+    # The run dies after sending the second page, before its checkpoint is written.
+    record_page = BroadcastRepository.record_page
+    pages = []
+
+    def crash_on_second_page(self, *args):
+        pages.append(args)
+        if len(pages) == 2:
+            raise RuntimeError("worker died")
+        record_page(self, *args)
+
+    monkeypatch.setattr(BroadcastRepository, "record_page", crash_on_second_page)
+    broadcast_id = broadcast.create_broadcast("Привет")
+    with pytest.raises(RuntimeError):
+        broadcast.run_broadcast(broadcast_id, page_size=3)
+
+    with session_scope() as session:
+        interrupted = session.get(Broadcast, broadcast_id)
+        assert interrupted.status == "RUNNING"
+        assert interrupted.last_user_id == 3
+
+    monkeypatch.setattr(BroadcastRepository, "record_page", record_page)
+    totals = broadcast.run_broadcast(broadcast_id, page_size=3)
+    assert totals == {"SENT": 6, "FORBIDDEN": 0, "ERROR": 0}
+    assert broadcast.run_broadcast(broadcast_id) is None
+    # At least once: the page without a checkpoint goes out again.
+    assert sent == [1, 2, 4, 5, 6, 4, 5, 6, 8, 9, 10]
+
+    with session_scope() as session:
+        finished = session.get(Broadcast, broadcast_id)
+        assert finished.status == "DONE"
+        assert (finished.sent_count, finished.failed_count) == (8, 1)
+        deliveries = dict(
+            session.execute(select(BroadcastDelivery.user_id, BroadcastDelivery.status)).all()
+        )
+        assert len(deliveries) == 9 and deliveries[3] == "FORBIDDEN"
+        unreachable = session.execute(
+            select(User.tg_user_id).where(User.unreachable_since.is_not(None))
+        ).scalars()
+        assert list(unreachable) == [3]
+
+
+def test_broadcast_stops_when_every_recipient_fails_the_same_way(monkeypatch):
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+
+    @contextmanager
+    def session_scope():
+        with Session() as session:
+            yield session
+            session.commit()
+
+    with session_scope() as session:
+        session.add_all(
+            User(
+                tg_user_id=chat_id,
+                tg_chat_id=chat_id,
+                timezone="UTC",
+                checkin_time_local=time(9, 0),
+                status=UserStatus.ACTIVE,
+            )
+            for chat_id in range(1, 6)
+        )
+
+    sent = []
+    monkeypatch.setattr(broadcast, "session_scope", session_scope)
+    monkeypatch.setattr(
+        telegram_bot, "create_bot", lambda **_: FakeBot(sent, blocked=set(), broken=True)
+    )
+    broadcast_id = broadcast.create_broadcast("Цены < 100 & скидки")
+    with pytest.raises(broadcast.BroadcastAborted, match="can't parse entities"):
+        broadcast.run_broadcast(broadcast_id, page_size=2)
+
+    with session_scope() as session:
+        aborted = session.get(Broadcast, broadcast_id)
+        assert (aborted.status, aborted.last_user_id, aborted.failed_count) == ("RUNNING", 0, 0)
+
+    # The last page holds one recipient whose chat is gone: recorded, not a stop.
+    monkeypatch.setattr(
+        telegram_bot, "create_bot", lambda **_: FakeBot(sent, blocked=set(), missing={5})
+    )
+    assert broadcast.run_broadcast(broadcast_id, page_size=2) == {
+        "SENT": 4,
+        "FORBIDDEN": 0,
+        "ERROR": 1,
+    }
+    assert sent == [1, 2, 3, 4]
+    with session_scope() as session:
+        assert session.get(Broadcast, broadcast_id).status == "DONE"
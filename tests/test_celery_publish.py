@@ -0,0 +1,82 @@
+﻿from types import SimpleNamespace
+
+import pytest
+from celery import Celery
+from kombu.transport import redis as kombu_redis
+from redis.client import Pipeline
+
+from daily_checkin import celery_app
+from daily_checkin.celery_app import TaskMessage, _redis_pipeline, publish_many
+from daily_checkin.config import settings
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+@pytest.fixture
+def redis_app(monkeypatch):
+    server = fakeredis.FakeServer()
+    client = fakeredis.FakeRedis(server=server)
+    monkeypatch.setattr(
+        kombu_redis.Channel,
+        "_get_client",
+        lambda self: lambda **kwargs: fakeredis.FakeRedis(server=server),
+    )
+    # Celery prefers CELERY_BROKER_URL from the environment over `broker`.
+    monkeypatch.delenv("CELERY_BROKER_URL", raising=False)
+    app = Celery("test_publish", broker="redis://localhost:6379/0")
+    monkeypatch.setattr(celery_app, "get_celery_app", lambda: app)
+    monkeypatch.setattr(settings, "celery_publish_batch_size", 2)
+    yield app, client
+    app.close()
+
+
+def test_publish_many_sends_each_batch_in_one_pipeline(redis_app, monkeypatch):
+    app, client = redis_app
+    batches = []
+    execute = Pipeline.execute
+
+    def counting_execute(self, *args, **kwargs):
+        # kombu sizes a queue on declare through a pipeline of its own.
+        commands = [command[0][0] for command in self.command_stack]
+        if "LPUSH" in commands:
+            batches.append(commands)
+        return execute(self, *args, **kwargs)
+
+    monkeypatch.setattr(Pipeline, "execute", counting_execute)
+
+    messages = [TaskMessage("tasks.checkin_due", (user_id,)) for user_id in range(5)]
+    assert publish_many(messages) == 5
+
+    # The first batch also carries the binding SADD from declaring the queue.
+    assert [commands.count("LPUSH") for commands in batches] == [2, 2, 1]
+    assert client.llen("celery") == 5
+
+
+def test_publish_many_restores_channel_after_error(redis_app, monkeypatch):
+    app, client = redis_app
+    channels = []
+    send_task = app.send_task
+
+    def failing_send_task(name, producer=None, **kwargs):
+        channels.append(producer.channel)
+        if len(channels) == 2:
+            raise RuntimeError("broker down")
+        return send_task(name, producer=producer, **kwargs)
+
+    monkeypatch.setattr(app, "send_task", failing_send_task)
+
+    with pytest.raises(RuntimeError):
+        publish_many([TaskMessage("tasks.checkin_due", (user_id,)) for user_id in range(3)])
+
+    channel = channels[0]
+    assert "conn_or_acquire" not in vars(channel)
+    assert channel.conn_or_acquire.__func__ is kombu_redis.Channel.conn_or_acquire
+
+
+def test_redis_pipeline_falls_back_without_kombu_hooks():
+    producer = SimpleNamespace(
+        connection=SimpleNamespace(transport=SimpleNamespace(driver_type="redis")),
+        channel=SimpleNamespace(),
+    )
+    with _redis_pipeline(producer) as pipe:
+        assert pipe is None
@@ -0,0 +1,74 @@
+﻿import asyncio
+from contextlib import contextmanager
+from datetime import time
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from daily_checkin.config import settings
+from daily_checkin.models import Base, Checkin, User, UserStatus
+from daily_checkin.telegram import handlers
+
+
+class FakeMessage:
+    def __init__(self, tg_user_id: int, photo: str | None = None, location=None):
+        self.from_user = SimpleNamespace(id=tg_user_id)
+        self.photo = [SimpleNamespace(file_id=photo)] if photo else None
+        self.location = location and SimpleNamespace(latitude=location[0], longitude=location[1])
+        self.answers = []
+
+    async def answer(self, text, **kwargs):
+        self.answers.append(text)
+
+
+def test_photo_is_stored_before_the_reply_and_location_updates_it(monkeypatch):
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+
+    @contextmanager
+    def session_scope():
+        with Session() as session:
+            yield session
+            session.commit()
+
+    monkeypatch.setattr(handlers, "session_scope", session_scope)
+    monkeypatch.setattr(settings, "daily_state_cache_enabled", False)
+    monkeypatch.setattr(settings, "store_media_in_s3", False)
+    with session_scope() as session:
+        session.add_all(
+            User(
+                tg_user_id=tg_user_id,
+                tg_chat_id=tg_user_id,
+                timezone="UTC",
+                checkin_time_local=time(9, 0),
+                status=UserStatus.ACTIVE,
+            )
+            for tg_user_id in (1, 2)
+        )
+
+    def geo(photo_file_id):
+        with session_scope() as session:
+            return session.execute(
+                select(Checkin.geo_lat, Checkin.geo_lon).where(Checkin.photo_file_id == photo_file_id)
+            ).one()
+
+    photo = FakeMessage(1, photo="selfie")
+    asyncio.run(handlers.checkin_photo(photo))
+    assert photo.answers == ["Отметка сохранена. Спасибо!"]
+    assert tuple(geo("selfie")) == (None, None)
+
+    # No state is kept between the two updates, so any API process can take the location.
+    location = FakeMessage(1, location=(55.75, 37.61))
+    asyncio.run(handlers.checkin_geo(location))
+    assert location.answers == ["Геолокация добавлена."]
+    assert tuple(geo("selfie")) == (55.75, 37.61)
+
+    no_checkin = FakeMessage(2, location=(55.75, 37.61))
+    asyncio.run(handlers.checkin_geo(no_checkin))
+    assert no_checkin.answers == ["Нет свежей отметки, чтобы прикрепить геолокацию."]
+
+    stranger = FakeMessage(3, location=(55.75, 37.61))
+    asyncio.run(handlers.checkin_geo(stranger))
+    assert stranger.answers == ["Сначала /start"]
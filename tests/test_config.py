@@ -0,0 +1,14 @@
+﻿import pytest
+
+from daily_checkin.config import get_settings, settings
+
+
+def test_patched_settings_are_restored_on_the_real_instance():
+    original = get_settings().celery_publish_batch_size
+
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(settings, "celery_publish_batch_size", original + 1)
+        assert get_settings().celery_publish_batch_size == original + 1
+
+    assert "celery_publish_batch_size" not in vars(settings)
+    assert settings.celery_publish_batch_size == get_settings().celery_publish_batch_size == original
@@ -0,0 +1,44 @@
+﻿import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from daily_checkin.telegram.coordination import PollingLeader
+
+
+class FakeBot:
+    def __init__(self, webhook_url: str):
+        self.webhook_url = webhook_url
+        self.deleted = []
+
+    async def get_webhook_info(self):
+        return SimpleNamespace(url=self.webhook_url)
+
+    async def delete_webhook(self, drop_pending_updates=None):
+        self.deleted.append(drop_pending_updates)
+        self.webhook_url = ""
+
+
+class FakeDispatcher:
+    async def start_polling(self, bot, **kwargs):
+        return None
+
+
+class FakeLock:
+    async def extend(self, *args, **kwargs):
+        return True
+
+    async def release(self):
+        return None
+
+
+@pytest.mark.parametrize(
+    ("webhook_url", "deleted"), [("", []), ("https://bot.example/webhook", [True])]
+)
+def test_polling_takeover_keeps_pending_updates(webhook_url, deleted):
+    bot = FakeBot(webhook_url)
+    leader = PollingLeader(FakeDispatcher(), bot, redis=None, ttl=0.03)
+
+    asyncio.run(leader._lead(FakeLock()))
+
+    assert bot.deleted == deleted
@@ -0,0 +1,98 @@
+﻿import sqlite3
+from datetime import datetime, time, timezone
+
+import pytest
+from sqlalchemy import create_engine, event, func, select
+
+from daily_checkin import db
+from daily_checkin.config import settings
+from daily_checkin.models import Base, User, UserStatus
+from daily_checkin.services.due_index import DueIndex
+from daily_checkin.services.scheduler import patch_due_index
+
+
+@pytest.fixture
+def two_databases(tmp_path, monkeypatch):
+    urls = {}
+    for name, users in (("primary", 2), ("replica", 1)):
+        url = f"sqlite:///{tmp_path / name}.db"
+        engine = create_engine(url)
+        Base.metadata.create_all(engine)
+        with engine.begin() as conn:
+            for tg_user_id in range(users):
+                conn.execute(
+                    User.__table__.insert().values(
+                        tg_user_id=tg_user_id,
+                        tg_chat_id=tg_user_id,
+                        timezone="UTC",
+                        checkin_time_local=time(9, 0),
+                        status=UserStatus.ACTIVE,
+                    )
+                )
+        engine.dispose()
+        urls[name] = url
+
+    monkeypatch.setattr(settings, "database_url", urls["primary"])
+    monkeypatch.setattr(settings, "database_replica_url", urls["replica"])
+    monkeypatch.setattr(db, "_replica_health", None)
+    db.dispose_engine()
+    yield urls
+    db.dispose_engine()
+
+
+def _count_users():
+    with db.read_session_scope() as session:
+        return session.scalar(select(func.count()).select_from(User))
+
+
+def test_reads_go_to_replica_and_fall_back_to_primary(two_databases, monkeypatch):
+    measure_lag = db._replica_lag_seconds
+    assert _count_users() == 1
+    with db.session_scope() as session:
+        assert session.scalar(select(func.count()).select_from(User)) == 2
+
+    # Too far behind: the primary serves reads until the next health check.
+    monkeypatch.setattr(db, "_replica_lag_seconds", lambda engine: 60.0)
+    monkeypatch.setattr(db, "_replica_health", None)
+    assert _count_users() == 2
+    monkeypatch.setattr(db, "_replica_lag_seconds", lambda engine: 0.0)
+    assert _count_users() == 2
+
+    monkeypatch.setattr(settings, "db_replica_check_interval_seconds", 0)
+    assert _count_users() == 1
+
+    # Unreachable replica.
+    monkeypatch.setattr(db, "_replica_lag_seconds", measure_lag)
+    monkeypatch.setattr(settings, "database_replica_url", "sqlite:////nonexistent/replica.db")
+    db.dispose_engine()
+    assert _count_users() == 2
+
+    monkeypatch.setattr(settings, "database_replica_url", None)
+    assert _count_users() == 2
+
+
+def test_read_is_retried_on_primary_when_replica_drops(two_databases, monkeypatch):
+    count = select(func.count()).select_from(User)
+
+    def connection_lost(cursor, statement, parameters, context):
+        raise sqlite3.OperationalError("server closed the connection unexpectedly")
+
+    with db.read_session_scope() as session:
+        assert session.scalar(count) == 1
+        replica = db.get_replica_engine()
+        monkeypatch.setattr(replica.dialect, "is_disconnect", lambda *args: True)
+        event.listen(replica, "do_execute", connection_lost)
+
+        assert session.scalar(count) == 2
+        assert session.scalars(select(User.tg_user_id).order_by(User.tg_user_id)).all() == [0, 1]
+
+    assert db._replica_health[1] is False
+    assert _count_users() == 2
+
+
+def test_due_index_patch_reads_the_primary(two_databases):
+    index = DueIndex(datetime(2024, 5, 1, tzinfo=timezone.utc))
+    # User 2 exists only on the primary, as if the replica had not caught up yet.
+    patch_due_index(index, {1, 2})
+
+    assert 1 in index and 2 in index
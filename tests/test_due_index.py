@@ -0,0 +1,71 @@
+﻿from datetime import datetime, time, timedelta, timezone
+
+import pytest
+
+from daily_checkin.services import scheduler
+from daily_checkin.services.due_index import DueIndex
+
+
+def test_due_index_buckets_by_utc_minute_and_follows_dst():
+    winter = datetime(2024, 3, 30, 12, 0, tzinfo=timezone.utc)
+    index = DueIndex.build(
+        [
+            (1, "UTC", time(9, 0)),
+            (2, "Europe/Berlin", time(10, 0)),
+            (3, "Europe/Moscow", time(12, 0)),
+            (5, "Asia/Kolkata", time(15, 30)),
+        ],
+        winter,
+    )
+    nine = datetime(2024, 3, 30, 9, 0, tzinfo=timezone.utc)
+    assert sorted(index.due_at(nine)) == [1, 2, 3]
+    assert list(index.due_at(nine.replace(minute=1))) == []
+    assert list(index.due(10 * 60)) == [5]
+    assert list(index.due(10 * 60 + 1440)) == [5]
+
+    index.upsert(4, "UTC", time(9, 0))
+    index.upsert(1, "UTC", time(8, 0))
+    assert index.remove(3)
+    assert not index.remove(3)
+    assert sorted(index.due(9 * 60)) == [2, 4]
+    assert list(index.due(8 * 60)) == [1]
+
+    # Berlin moves to UTC+2 on 2024-03-31; only its users change buckets.
+    assert index.refresh_offsets(datetime(2024, 3, 31, 12, 0, tzinfo=timezone.utc)) == 1
+    assert list(index.due(8 * 60)) == [1, 2]
+    assert len(index) == 4
+
+
+def test_due_index_memory_per_user():
+    as_of = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    zones = ["UTC", "Europe/Moscow", "America/New_York", "Asia/Tokyo"]
+    users = 100_000
+    index = DueIndex.build(
+        ((user_id, zones[user_id % 4], time(user_id % 24, user_id % 60)) for user_id in range(users)),
+        as_of,
+    )
+    assert len(index) == users
+    assert index.memory_bytes() / users <= 24
+
+
+def test_due_loop_catches_up_on_missed_minutes(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    redis = fakeredis.FakeRedis()
+    windows = []
+    monkeypatch.setattr(scheduler, "schedule_window", lambda: windows.append(1))
+    now = datetime(2024, 5, 1, 9, 7, 40, tzinfo=timezone.utc)
+    current = datetime(2024, 5, 1, 9, 7, tzinfo=timezone.utc)
+
+    # First start: one window pass, then the current minute is covered too.
+    assert scheduler._first_minute(redis, now) == current
+    assert windows == [1]
+
+    # Restart after a few minutes down: replay from the minute after the last one.
+    scheduler._remember_minute(redis, datetime(2024, 5, 1, 9, 2, tzinfo=timezone.utc))
+    assert scheduler._first_minute(redis, now) == datetime(2024, 5, 1, 9, 3, tzinfo=timezone.utc)
+    assert windows == [1]
+
+    # Down for longer than the scheduling window: fall back to schedule_window.
+    scheduler._remember_minute(redis, current - timedelta(hours=40))
+    assert scheduler._first_minute(redis, now) == current
+    assert windows == [1, 1]
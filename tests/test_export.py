@@ -0,0 +1,77 @@
+﻿import csv
+import io
+from datetime import date, datetime, time, timezone
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from apps.cli.main import main
+from daily_checkin.config import settings
+from daily_checkin.models import Base, Checkin, DailyState, DailyStateEnum, User, UserStatus
+from daily_checkin.services.export import EXPORT_COLUMNS, iter_csv, iter_export_batches, write_csv
+
+
+def test_export_streams_checkins_joined_with_state(monkeypatch):
+    monkeypatch.setattr(settings, "export_batch_size", 2)
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+
+    day = date(2024, 5, 1)
+    due = datetime(2024, 5, 1, 9, 0, tzinfo=timezone.utc)
+    with Session() as session:
+        for tg_user_id in (1, 2):
+            session.add(
+                User(
+                    tg_user_id=tg_user_id,
+                    tg_chat_id=tg_user_id,
+                    timezone="UTC",
+                    checkin_time_local=time(9, 0),
+                    status=UserStatus.ACTIVE,
+                )
+            )
+        session.flush()
+        session.add(
+            DailyState(
+                user_id=1,
+                date_local=day,
+                due_at_utc=due,
+                deadline_at_utc=due,
+                state=DailyStateEnum.DONE,
+            )
+        )
+        session.add_all(
+            [
+                Checkin(user_id=1, date_local=day, photo_file_id="a"),
+                Checkin(user_id=1, date_local=day, photo_file_id="b"),
+                Checkin(user_id=2, date_local=day, photo_file_id="c"),
+                Checkin(user_id=1, date_local=date(2024, 6, 1), photo_file_id="d"),
+            ]
+        )
+        session.commit()
+
+        chunks = list(iter_csv(iter_export_batches(session, day, day)))
+        assert len(chunks) == 2
+
+        stream = io.StringIO()
+        assert write_csv(iter_export_batches(session, day, day, [2]), stream) == 1
+
+    rows = list(csv.DictReader(io.StringIO("".join(chunks))))
+    assert list(rows[0]) == list(EXPORT_COLUMNS)
+    assert [(row["photo_file_id"], row["state"]) for row in rows] == [
+        ("a", "DONE"),
+        ("b", "DONE"),
+        ("c", ""),
+    ]
+    assert stream.getvalue().splitlines()[1].split(",")[7] == "c"
+
+
+def test_parquet_export_requires_output_file(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(SystemExit) as exc:
+        main(["export-checkins", "--from", "2024-05-01", "--to", "2024-05-02", "--format", "parquet"])
+
+    assert exc.value.code == 2
+    assert "--output" in capsys.readouterr().err
+    assert not (tmp_path / "-").exists()
@@ -0,0 +1,76 @@
+﻿import asyncio
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from daily_checkin.telegram.flood import FLOOD_KEY, FloodControlError, FloodControlMiddleware, FloodGate
+from daily_checkin.telegram.rate_limiter import RateLimiter
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+@pytest.fixture
+def gate():
+    redis = fakeredis.FakeRedis()
+    return FloodGate(redis, RateLimiter(redis, 30))
+
+
+def _retry_after(seconds: int) -> TelegramRetryAfter:
+    return TelegramRetryAfter(SendMessage(chat_id=1, text="x"), "Too Many Requests", seconds)
+
+
+def _call(middleware, make_request):
+    return asyncio.run(middleware(make_request, None, SendMessage(chat_id=1, text="x")))
+
+
+def test_pause_only_extends(gate):
+    gate.pause(10)
+    gate.pause(2)
+
+    assert 9 < gate.remaining() <= 10
+
+    gate.pause(20)
+
+    assert 19 < gate.remaining() <= 20
+
+
+def test_no_pause_means_zero_remaining(gate):
+    assert gate.remaining() == 0
+
+
+def test_enforcing_middleware_refuses_while_paused(gate):
+    gate.pause(5)
+    calls = []
+
+    async def make_request(bot, method):
+        calls.append(method)
+
+    with pytest.raises(FloodControlError) as info:
+        _call(FloodControlMiddleware(gate), make_request)
+
+    assert calls == []
+    assert 4 < info.value.retry_after <= 5
+
+
+def test_record_only_middleware_calls_through_while_paused(gate):
+    gate.pause(5)
+
+    async def make_request(bot, method):
+        return "ok"
+
+    assert _call(FloodControlMiddleware(gate, enforce=False), make_request) == "ok"
+
+
+@pytest.mark.parametrize("enforce", [True, False])
+def test_retry_after_becomes_flood_error_and_pauses_everyone(gate, enforce):
+    async def make_request(bot, method):
+        raise _retry_after(7)
+
+    with pytest.raises(FloodControlError) as info:
+        _call(FloodControlMiddleware(gate, enforce=enforce), make_request)
+
+    assert info.value.retry_after == 7
+    assert isinstance(info.value.__cause__, TelegramRetryAfter)
+    assert 6 < gate.remaining() <= 7
+    assert gate.redis.exists(FLOOD_KEY)
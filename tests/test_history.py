@@ -0,0 +1,57 @@
+﻿from datetime import date, datetime, time, timedelta, timezone
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from daily_checkin.models import Base, DailyState, DailyStateEnum, User, UserStatus
+from daily_checkin.repositories import UserSummaryRepository
+from daily_checkin.services.history import build_history
+
+
+def test_summary_tracks_streaks_and_matches_rebuild():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    start = date(2024, 5, 1)
+    outcomes = [True, True, False, True, True, True]
+
+    with Session() as session:
+        user = User(
+            tg_user_id=1,
+            tg_chat_id=1,
+            timezone="UTC",
+            checkin_time_local=time(9, 0),
+            status=UserStatus.ACTIVE,
+        )
+        session.add(user)
+        session.flush()
+        summaries = UserSummaryRepository(session)
+        due = datetime(2024, 5, 1, 9, tzinfo=timezone.utc)
+        for i, done in enumerate(outcomes):
+            day = start + timedelta(days=i)
+            session.add(
+                DailyState(
+                    user_id=user.id,
+                    date_local=day,
+                    due_at_utc=due,
+                    deadline_at_utc=due,
+                    state=DailyStateEnum.DONE if done else DailyStateEnum.MISSED,
+                )
+            )
+            summaries.record(user.id, day, done)
+        session.commit()
+
+        today = start + timedelta(days=len(outcomes) - 1)
+        history = build_history(summaries.get(user.id), today, days=7)
+        assert history["current_streak"] == 3
+        assert history["best_streak"] == 3
+        assert (history["total_done"], history["total_missed"]) == (5, 1)
+        assert [day["status"] for day in history["days"]] == [
+            None, "DONE", "DONE", "MISSED", "DONE", "DONE", "DONE"
+        ]
+        assert build_history(summaries.get(user.id), today + timedelta(days=2))["current_streak"] == 0
+
+        summaries.rebuild_all()
+        session.commit()
+        session.expire_all()
+        assert build_history(summaries.get(user.id), today, days=7) == history
@@ -0,0 +1,10 @@
+﻿import pytest
+
+from benchmarks.import_time import ENTRY_POINTS, IMPORT_BUDGETS, probe
+
+
+@pytest.mark.parametrize("module", sorted(ENTRY_POINTS))
+def test_entry_point_does_not_load_heavy_dependencies(module):
+    elapsed, loaded = probe(module)
+    assert not loaded.intersection(ENTRY_POINTS[module])
+    assert elapsed <= IMPORT_BUDGETS[module]
@@ -0,0 +1,130 @@
+﻿import os
+from datetime import date, datetime, time, timezone
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from daily_checkin import state_cache
+from daily_checkin.models import Base, Checkin, DailyState, DailyStats, User, UserStatus, UserSummary
+from daily_checkin.repositories import DailyStateRepository, UserRepository
+from daily_checkin.services.state_machine import _record_checkin, ingest_checkin
+from daily_checkin.utils_time import set_clock
+
+# Tables in this database are dropped and recreated.
+POSTGRES_URL = os.environ.get("TEST_POSTGRES_URL")
+# Set in CI, where skipping the only execution of the PostgreSQL ingest is not allowed.
+if not POSTGRES_URL and os.environ.get("REQUIRE_POSTGRES_TESTS"):
+    raise RuntimeError("REQUIRE_POSTGRES_TESTS is set but TEST_POSTGRES_URL is not")
+
+pytestmark = pytest.mark.skipif(not POSTGRES_URL, reason="TEST_POSTGRES_URL is not set")
+
+# Same offset, different names: each path gets its own daily_stats row.
+INGESTED_TZ, RECORDED_TZ = "UTC", "Etc/UTC"
+
+
+def _day(session, tg_user_id: int, timezone_name: str, day: date):
+    user_id = session.scalar(select(User.id).where(User.tg_user_id == tg_user_id))
+    state = session.execute(
+        select(DailyState.state, DailyState.due_at_utc, DailyState.deadline_at_utc).where(
+            DailyState.user_id == user_id, DailyState.date_local == day
+        )
+    ).one()
+    checkins = session.scalars(
+        select(Checkin.is_late)
+        .where(Checkin.user_id == user_id, Checkin.date_local == day)
+        .order_by(Checkin.id)
+    ).all()
+    stats = session.execute(
+        select(
+            DailyStats.done_count,
+            DailyStats.missed_count,
+            DailyStats.late_count,
+            DailyStats.escalation_count,
+        ).where(DailyStats.date_local == day, DailyStats.timezone == timezone_name)
+    ).one()
+    summary = session.execute(
+        select(
+            UserSummary.current_streak,
+            UserSummary.best_streak,
+            UserSummary.total_done,
+            UserSummary.total_missed,
+            UserSummary.last_done_date,
+            UserSummary.history_end,
+            UserSummary.done_bits,
+            UserSummary.missed_bits,
+        ).where(UserSummary.user_id == user_id)
+    ).one_or_none()
+    return tuple(state), checkins, tuple(stats), summary and tuple(summary)
+
+
+def test_postgres_ingest_matches_orm_checkin():
+    engine = create_engine(POSTGRES_URL)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    day_1, day_2 = date(2024, 5, 1), date(2024, 5, 2)
+    clock = {}
+    set_clock(lambda: clock["now"])
+
+    def check_in(session, now: datetime, day: date):
+        clock["now"] = now
+        ingested = ingest_checkin(session, 1, f"file_{now:%d%H%M}")
+        user = UserRepository(session).get_by_tg_user_id(2)
+        checkin, late_prompt_due = _record_checkin(session, user, f"file_{now:%d%H%M}", now)
+        session.flush()
+        session.expire_all()
+        assert (ingested.date_local, ingested.is_late, ingested.late_prompt_due) == (
+            checkin.date_local,
+            checkin.is_late,
+            late_prompt_due,
+        )
+        assert _day(session, 1, INGESTED_TZ, day) == _day(session, 2, RECORDED_TZ, day)
+        return ingested
+
+    try:
+        with Session() as session:
+            session.add_all(
+                User(
+                    tg_user_id=tg_user_id,
+                    tg_chat_id=tg_user_id,
+                    timezone=timezone_name,
+                    checkin_time_local=time(9, 0),
+                    status=UserStatus.ACTIVE,
+                )
+                for tg_user_id, timezone_name in ((1, INGESTED_TZ), (2, RECORDED_TZ))
+            )
+            session.flush()
+
+            first = check_in(session, datetime(2024, 5, 1, 9, 30, tzinfo=timezone.utc), day_1)
+            assert not first.is_late
+            repeat = check_in(session, datetime(2024, 5, 1, 9, 40, tzinfo=timezone.utc), day_1)
+            assert repeat.checkin_id != first.checkin_id
+            state, checkins, stats, summary = _day(session, 1, INGESTED_TZ, day_1)
+            assert (state[0], checkins, stats[0], summary[2]) == ("DONE", [False, False], 1, 1)
+            # The repeat bumped the row's version, and the cache gets the new one.
+            staged = session.info[state_cache._PENDING_KEY][state_cache._key(first.user_id, day_1)]
+            assert (staged["state"], staged["version"]) == ("DONE", "1")
+
+            # The day was escalated as MISSED before the late check-in arrives.
+            escalated_at = datetime(2024, 5, 2, 10, 31, tzinfo=timezone.utc)
+            states = DailyStateRepository(session)
+            for tg_user_id in (1, 2):
+                user = UserRepository(session).get_by_tg_user_id(tg_user_id)
+                states.upsert_state(
+                    user.id,
+                    day_2,
+                    datetime(2024, 5, 2, 9, 0, tzinfo=timezone.utc),
+                    datetime(2024, 5, 2, 10, 30, tzinfo=timezone.utc),
+                )
+                states.mark_missed(user.id, day_2)
+                states.set_escalation_sent(user.id, day_2, escalated_at)
+
+            late = check_in(session, datetime(2024, 5, 2, 11, 0, tzinfo=timezone.utc), day_2)
+            assert late.is_late and late.late_prompt_due
+            state, checkins, stats, _ = _day(session, 1, INGESTED_TZ, day_2)
+            assert (state[0], checkins, stats[2]) == ("MISSED", [True], 1)
+            session.rollback()
+    finally:
+        set_clock(None)
+        engine.dispose()
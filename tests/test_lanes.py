@@ -0,0 +1,29 @@
+﻿import asyncio
+
+from daily_checkin.telegram.lanes import LaneExecutor
+
+
+def test_same_chat_runs_in_order_other_chats_in_parallel():
+    events = []
+
+    async def handle(chat_id, n, delay):
+        events.append(("start", chat_id, n))
+        await asyncio.sleep(delay)
+        events.append(("end", chat_id, n))
+        return n
+
+    async def scenario():
+        lanes = LaneExecutor(lanes=4, queue_size=10)
+        results = await asyncio.gather(
+            lanes.run(1, handle, 1, 1, 0.05),
+            lanes.run(1, handle, 1, 2, 0),
+            lanes.run(2, handle, 2, 1, 0),
+        )
+        await lanes.close()
+        return results
+
+    assert asyncio.run(scenario()) == [1, 2, 1]
+    chat_1 = [event for event in events if event[1] == 1]
+    assert chat_1 == [("start", 1, 1), ("end", 1, 1), ("start", 1, 2), ("end", 1, 2)]
+    # chat 2 does not wait for chat 1's slow update
+    assert events.index(("end", 2, 1)) < events.index(("end", 1, 1))
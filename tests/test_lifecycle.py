@@ -0,0 +1,59 @@
+﻿from contextlib import contextmanager
+from datetime import datetime, time, timedelta, timezone
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from daily_checkin.models import Base, TaskOutbox, User, UserStatus
+from daily_checkin.repositories import UserRepository
+from daily_checkin.services import lifecycle
+
+
+def test_sweep_reactivates_pauses_and_notifies_unreachable_once(monkeypatch):
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+
+    @contextmanager
+    def session_scope():
+        with Session() as session:
+            yield session
+            session.commit()
+
+    now = datetime.now(timezone.utc)
+
+    def user(tg_user_id, **fields):
+        return User(
+            tg_user_id=tg_user_id,
+            tg_chat_id=tg_user_id,
+            timezone="UTC",
+            checkin_time_local=time(9, 0),
+            **fields,
+        )
+
+    with session_scope() as session:
+        session.add_all(
+            [
+                user(1, status=UserStatus.PAUSED, pause_until=now - timedelta(minutes=1)),
+                user(2, status=UserStatus.PAUSED, pause_until=now + timedelta(days=1)),
+                user(3, status=UserStatus.ACTIVE, unreachable_since=now - timedelta(days=1)),
+                user(4, status=UserStatus.ACTIVE, unreachable_since=now - timedelta(minutes=5)),
+            ]
+        )
+
+    monkeypatch.setattr(lifecycle, "session_scope", session_scope)
+    assert lifecycle.sweep_user_lifecycle() == {"reactivated": 1, "unreachable": 1}
+    assert lifecycle.sweep_user_lifecycle() == {"reactivated": 0, "unreachable": 0}
+
+    with session_scope() as session:
+        statuses = dict(session.execute(select(User.tg_user_id, User.status)).all())
+        assert statuses[1] == UserStatus.ACTIVE
+        assert statuses[2] == UserStatus.PAUSED
+        queued = session.execute(select(TaskOutbox.task_name, TaskOutbox.args)).all()
+        assert [(name, args[0]) for name, args in queued] == [("tasks.notify_contacts_last_checkin", 3)]
+
+        UserRepository(session).clear_unreachable(3)
+    with session_scope() as session:
+        returned = session.execute(select(User).where(User.tg_user_id == 3)).scalar_one()
+        assert returned.unreachable_since is None
+        assert returned.unreachable_notified_at is None
@@ -0,0 +1,56 @@
+﻿from contextlib import contextmanager
+from datetime import datetime, time, timezone
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from daily_checkin.models import Base, ContactStatus, TrustedContact, User, UserStatus
+from daily_checkin.services import notifications
+
+
+def test_escalation_is_sent_once_per_missed_day(monkeypatch):
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, expire_on_commit=False)
+
+    @contextmanager
+    def session_scope():
+        with Session() as session:
+            yield session
+            session.commit()
+
+    with session_scope() as session:
+        user = User(
+            tg_user_id=1,
+            tg_chat_id=1,
+            timezone="UTC",
+            checkin_time_local=time(9, 0),
+            status=UserStatus.ACTIVE,
+        )
+        session.add(user)
+        session.flush()
+        session.add(
+            TrustedContact(
+                user_id=user.id,
+                contact_tg_user_id=2,
+                contact_chat_id=2,
+                status=ContactStatus.APPROVED,
+            )
+        )
+
+    sent = []
+
+    async def send_message(bot, chat_id, text, reply_markup=None):
+        sent.append(chat_id)
+
+    monkeypatch.setattr(notifications, "session_scope", session_scope)
+    monkeypatch.setattr(notifications, "read_session_scope", session_scope)
+    monkeypatch.setattr(notifications, "_create_bot", lambda: None)
+    monkeypatch.setattr(notifications, "_send_message", send_message)
+
+    day_1 = datetime(2024, 5, 1, 10, 30, tzinfo=timezone.utc)
+    day_2 = datetime(2024, 5, 2, 10, 30, tzinfo=timezone.utc)
+    for scheduled_for in (day_1, day_1, day_2):
+        notifications.notify_contacts_last_checkin(1, "missed", scheduled_for)
+
+    assert sent == [2, 2]
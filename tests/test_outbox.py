@@ -0,0 +1,46 @@
+﻿from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from daily_checkin.celery_app import set_message_sink
+from daily_checkin.models import Base, TaskOutbox
+from daily_checkin.services import outbox
+from daily_checkin.services.tasks import send_online_status, store_media_s3
+
+
+def test_relay_publishes_committed_tasks_in_order(monkeypatch):
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+
+    @contextmanager
+    def session_scope():
+        with Session() as session:
+            yield session
+            session.commit()
+
+    eta = datetime(2024, 5, 1, 9, 0, tzinfo=timezone.utc)
+    with session_scope() as session:
+        send_online_status.enqueue(session, 1, "2024-05-01")
+        store_media_s3.enqueue(session, 7, "file_1")
+        session.add(TaskOutbox(task_name="tasks.checkin_due", args=[1], eta=eta))
+
+    published = []
+    monkeypatch.setattr(outbox, "session_scope", session_scope)
+    set_message_sink(published.extend)
+    try:
+        assert outbox.relay_batch(batch_size=2) == 2
+        assert outbox.relay_batch(batch_size=2) == 1
+        assert outbox.relay_batch(batch_size=2) == 0
+    finally:
+        set_message_sink(None)
+
+    assert [(m.name, list(m.args), m.eta) for m in published] == [
+        ("tasks.send_online_status", [1, "2024-05-01"], None),
+        ("tasks.store_media_s3", [7, "file_1"], None),
+        ("tasks.checkin_due", [1], eta),
+    ]
+    with session_scope() as session:
+        assert session.scalar(select(func.count()).select_from(TaskOutbox)) == 0
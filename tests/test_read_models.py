@@ -0,0 +1,65 @@
+﻿from datetime import date, datetime, time, timezone
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from daily_checkin.models import (
+    Base,
+    ContactStatus,
+    DailyStateEnum,
+    TrustedContact,
+    User,
+    UserStatus,
+)
+from daily_checkin.read_models import ContactView, DailyStateView, UserView
+from daily_checkin.repositories import ContactRepository, DailyStateRepository, UserRepository
+
+
+def test_hot_reads_return_detached_views():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    day = date(2024, 3, 4)
+    due_at = datetime(2024, 3, 4, 9, tzinfo=timezone.utc)
+
+    with Session() as session:
+        for tg_user_id, status in ((1, UserStatus.ACTIVE), (2, UserStatus.PAUSED)):
+            session.add(
+                User(
+                    tg_user_id=tg_user_id,
+                    tg_chat_id=100 + tg_user_id,
+                    timezone="Europe/Berlin",
+                    checkin_time_local=time(10, 0),
+                    status=status,
+                )
+            )
+        session.flush()
+        session.add_all(
+            TrustedContact(
+                user_id=1, contact_tg_user_id=chat_id, contact_chat_id=chat_id, status=status
+            )
+            for chat_id, status in ((7, ContactStatus.APPROVED), (8, ContactStatus.PENDING))
+        )
+        session.commit()
+
+        users = UserRepository(session)
+        # The prebuilt statement is shared; each call binds its own user id.
+        first, second = users.get_view(1), users.get_view(2)
+        assert isinstance(first, UserView) and first.tg_chat_id == 101
+        assert second.status == UserStatus.PAUSED
+        assert users.get_view(3) is None
+        assert [user.id for user in users.list_active()] == [1]
+        with pytest.raises(AttributeError):
+            first.status = UserStatus.DISABLED
+
+        contacts = ContactRepository(session).list_approved(1)
+        assert contacts == [ContactView(1, 1, 7, 7, ContactStatus.APPROVED)]
+
+        states = DailyStateRepository(session)
+        states.upsert_state(1, day, due_at, due_at)
+        states.mark_done(1, day)
+        state = states.get_state(1, day)
+        assert isinstance(state, DailyStateView)
+        assert state.state == DailyStateEnum.DONE
+        assert states.upsert_state(1, day, due_at, due_at) == state
@@ -0,0 +1,53 @@
+﻿from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from daily_checkin.models import Base, NotificationLog
+from daily_checkin.services.reports import percentile, send_lag_report
+
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert percentile([7.0], 99) == 7.0
+
+
+def test_send_lag_report_groups_by_type_and_hour():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    base = datetime(2024, 5, 1, 9, 0, tzinfo=timezone.utc)
+
+    with Session() as session:
+        for i, lag in enumerate([10, 20, 30, 40]):
+            session.add(
+                NotificationLog(
+                    idempotency_key=f"reminder:{i}",
+                    type="REMINDER",
+                    user_id=i,
+                    target_chat_id=i,
+                    scheduled_for=base,
+                    sent_at=base + timedelta(seconds=lag),
+                    status="SENT",
+                )
+            )
+        session.add(
+            NotificationLog(
+                idempotency_key="escalation:1",
+                type="ESCALATION",
+                user_id=1,
+                target_chat_id=1,
+                scheduled_for=base,
+                status="ERROR",
+            )
+        )
+        session.commit()
+
+        report = send_lag_report(session, base - timedelta(days=1), base + timedelta(days=1))
+
+    assert list(report["by_type"]) == ["REMINDER"]
+    assert report["by_type"]["REMINDER"] == {"count": 4, "p50": 20.0, "p95": 40.0, "p99": 40.0}
+    assert report["by_hour"]["REMINDER:09"]["count"] == 4
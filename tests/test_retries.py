@@ -0,0 +1,71 @@
+﻿from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta, timezone
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from daily_checkin.models import Base, DailyState, DailyStateEnum, NotificationLog, User, UserStatus
+from daily_checkin.repositories import NotificationLogRepository
+from daily_checkin.services import retries
+
+
+def test_retry_engine_resends_and_expires(monkeypatch):
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+
+    @contextmanager
+    def session_scope():
+        with Session() as session:
+            yield session
+            session.commit()
+
+    now = datetime.now(timezone.utc)
+    today = date.today()
+    with session_scope() as session:
+        user = User(
+            tg_user_id=1,
+            tg_chat_id=1,
+            timezone="UTC",
+            checkin_time_local=time(9, 0),
+            status=UserStatus.ACTIVE,
+        )
+        session.add(user)
+        session.flush()
+        session.add(
+            DailyState(
+                user_id=user.id,
+                date_local=today,
+                due_at_utc=now,
+                deadline_at_utc=now + timedelta(hours=1),
+                state=DailyStateEnum.DONE,
+            )
+        )
+        logs = NotificationLogRepository(session)
+        for key, type_, payload in (
+            ("online", "ONLINE", {"text": "hi"}),
+            ("reminder", "REMINDER", {"text": "hi", "date_local": today.isoformat()}),
+            ("blocked", "ONLINE", {"text": "hi"}),
+        ):
+            logs.try_insert(key, type_, user.id, user.tg_chat_id)
+            logs.mark_error(key, "API_ERROR" if key != "blocked" else "FORBIDDEN", "boom", payload)
+        session.execute(
+            NotificationLog.__table__.update()
+            .where(NotificationLog.next_attempt_at.is_not(None))
+            .values(next_attempt_at=now - timedelta(seconds=1))
+        )
+
+    sent = []
+
+    async def fake_resend_all(rows):
+        sent.extend(row.id for row in rows)
+        return [None] * len(rows)
+
+    monkeypatch.setattr(retries, "session_scope", session_scope)
+    monkeypatch.setattr(retries, "_resend_all", fake_resend_all)
+
+    assert retries.retry_failed_notifications() == {"sent": 1, "expired": 1}
+    with session_scope() as session:
+        status = dict(session.execute(select(NotificationLog.idempotency_key, NotificationLog.status)).all())
+    assert status == {"online": "SENT", "reminder": "DEAD", "blocked": "ERROR"}
+    assert len(sent) == 1
@@ -0,0 +1,36 @@
+﻿from datetime import datetime, timezone
+
+import pytest
+
+from benchmarks.seed import reset_schema, seed_users
+from benchmarks.simulate import simulate
+from daily_checkin import db
+from daily_checkin.config import settings
+from daily_checkin.utils_time import utc_now
+
+
+@pytest.fixture
+def sim_database(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "database_url", f"sqlite:///{tmp_path / 'sim.db'}")
+    db.dispose_engine()
+    engine = db.get_engine()
+    reset_schema(engine)
+    seed_users(engine, 24)
+    yield
+    db.dispose_engine()
+
+
+def test_simulated_day_runs_on_virtual_time(sim_database):
+    start = datetime(2024, 3, 4, tzinfo=timezone.utc)
+    report = simulate(start, hours=24, scheduler="loop", warmup_hours=2)
+
+    assert report["user_days"] == 24
+    assert report["task_errors"] == {}
+    assert sum(report["outcomes"].values()) <= 24
+    assert report["outcomes"].get("DONE", 0) >= 12
+    # Each user-day is scheduled once, with three reminders and a deadline behind it.
+    assert report["broker_messages_by_task"]["tasks.checkin_due"] <= 24
+    assert report["broker_messages_by_task"]["tasks.deadline_missed"] <= 24
+    assert report["queries"] > 0 and report["sends"] > 0
+    # The real clock is back once the run is over.
+    assert abs((utc_now() - datetime.now(timezone.utc)).total_seconds()) < 5
@@ -0,0 +1,95 @@
+﻿from datetime import date, datetime, time, timezone
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from daily_checkin import state_cache
+from daily_checkin.models import Base, DailyStateEnum, User, UserStatus
+from daily_checkin.repositories import DailyStateRepository
+from daily_checkin.utils_time import ensure_utc
+
+fakeredis = pytest.importorskip("fakeredis")
+
+DAY = date(2024, 5, 1)
+
+
+@pytest.fixture
+def Session(tmp_path, monkeypatch):
+    # A file database, so two sessions really are two transactions.
+    engine = create_engine(f"sqlite:///{tmp_path / 'state.db'}")
+    Base.metadata.create_all(engine)
+    redis = fakeredis.FakeRedis()
+    monkeypatch.setattr(state_cache, "_client", lambda: redis)
+
+    Session = sessionmaker(bind=engine)
+    with Session() as session:
+        user = User(
+            tg_user_id=1,
+            tg_chat_id=1,
+            timezone="UTC",
+            checkin_time_local=time(9, 0),
+            status=UserStatus.ACTIVE,
+        )
+        session.add(user)
+        session.flush()
+        due = datetime(2024, 5, 1, 9, 0, tzinfo=timezone.utc)
+        DailyStateRepository(session).upsert_state(user.id, DAY, due, due)
+        session.commit()
+    return Session
+
+
+def _cached():
+    state_cache._writer().submit(lambda: None).result()
+    return state_cache.get(1, DAY)
+
+
+def test_snapshot_read_before_an_increment_does_not_double_count(Session):
+    with Session() as reader:
+        DailyStateRepository(reader).get_state(1, DAY)
+        with Session() as writer:
+            DailyStateRepository(writer).increment_reminders(1, DAY)
+            writer.commit()
+        reader.commit()
+
+    cached = _cached()
+    assert cached.reminders_sent_count == 1
+
+    with Session() as session:
+        DailyStateRepository(session).increment_reminders(1, DAY)
+        session.commit()
+
+    assert _cached().reminders_sent_count == 2
+
+
+def test_older_snapshot_does_not_overwrite_a_terminal_state(Session):
+    with Session() as reader:
+        assert DailyStateRepository(reader).get_state(1, DAY).state == DailyStateEnum.PENDING
+        with Session() as writer:
+            DailyStateRepository(writer).mark_done(1, DAY)
+            writer.commit()
+        reader.commit()
+
+    assert _cached().state == DailyStateEnum.DONE
+
+
+def test_update_fills_an_empty_cache_with_the_whole_row(Session):
+    state_cache._client().flushall()
+
+    with Session() as session:
+        DailyStateRepository(session).mark_missed(1, DAY)
+        session.commit()
+
+    cached = _cached()
+    assert cached.state == DailyStateEnum.MISSED
+    assert cached.reminders_sent_count == 0
+    # SQLite hands timestamps back without a timezone.
+    assert ensure_utc(cached.deadline_at_utc) == datetime(2024, 5, 1, 9, 0, tzinfo=timezone.utc)
+
+
+def test_rolled_back_update_is_not_cached(Session):
+    with Session() as session:
+        DailyStateRepository(session).mark_done(1, DAY)
+        session.rollback()
+
+    assert _cached().state == DailyStateEnum.PENDING
@@ -4,7 +4,7 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
 from daily_checkin.models import Base, User, UserStatus
-from daily_checkin.services.state_machine import record_checkin
+from daily_checkin.services.state_machine import ingest_checkin, record_checkin
 from daily_checkin.repositories import DailyStateRepository, CheckinRepository
 
 
@@ -35,4 +35,30 @@ def test_record_checkin_marks_done():
 
         today = datetime.now(tz.utc).date()
         state = states.get_state(user.id, today)
-        assert state is not None
\ No newline at end of file
+        assert state is not None
+
+
+def test_ingest_checkin_resolves_user_and_completes_day():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+
+    with Session() as session:
+        session.add(
+            User(
+                tg_user_id=7,
+                tg_chat_id=7,
+                timezone="UTC",
+                checkin_time_local=time(9, 0),
+                status=UserStatus.ACTIVE,
+            )
+        )
+        session.commit()
+
+        assert ingest_checkin(session, 8, "file_1") is None
+        result = ingest_checkin(session, 7, "file_1")
+        assert result is not None
+        assert not result.late_prompt_due
+
+        state = DailyStateRepository(session).get_state(result.user_id, result.date_local)
+        assert state.state == "DONE"
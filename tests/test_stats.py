@@ -0,0 +1,39 @@
+﻿from datetime import datetime, time, timezone
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from daily_checkin.models import Base, User, UserStatus
+from daily_checkin.repositories import StatsRepository
+from daily_checkin.services.state_machine import record_checkin
+
+
+def test_incremental_stats_match_rebuild():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+
+    with Session() as session:
+        user = User(
+            tg_user_id=1,
+            tg_chat_id=1,
+            timezone="UTC",
+            checkin_time_local=time(9, 0),
+            status=UserStatus.ACTIVE,
+        )
+        session.add(user)
+        session.commit()
+
+        record_checkin(session, user, "file_1")
+        record_checkin(session, user, "file_2")
+        session.commit()
+
+        today = datetime.now(timezone.utc).date()
+        stats = StatsRepository(session)
+        incremental = stats.for_date(today)
+        assert incremental["done_count"] == 1
+
+        stats.rebuild(today, today)
+        session.commit()
+        assert stats.for_date(today) == incremental
+        assert stats.for_date(today, "Europe/Moscow")["done_count"] == 0
@@ -0,0 +1,37 @@
+﻿import logging
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import IntegrityError
+
+from daily_checkin.config import settings
+from daily_checkin.tracing import instrument_engine, unit_of_work
+
+
+def test_unit_of_work_counts_statements_and_flags_repeats(caplog):
+    engine = create_engine("sqlite:///:memory:")
+    instrument_engine(engine)
+    repeats = settings.sql_repeat_warn_threshold + 1
+
+    with caplog.at_level(logging.WARNING, logger="daily_checkin.tracing"):
+        with unit_of_work("tasks.example") as unit, engine.connect() as conn:
+            for i in range(repeats):
+                conn.execute(text("SELECT :value"), {"value": i})
+            conn.execute(text("SELECT 1"))
+
+    assert unit.statements == repeats + 1
+    assert unit.db_time > 0
+    warnings = [r for r in caplog.records if "possible N+1 in tasks.example" in r.getMessage()]
+    assert len(warnings) == 1
+
+
+def test_integrity_error_reaches_caller_on_instrumented_engine():
+    engine = create_engine("sqlite:///:memory:")
+    instrument_engine(engine)
+
+    with unit_of_work("tasks.example"), engine.connect() as conn:
+        conn.execute(text("CREATE TABLE log (key TEXT PRIMARY KEY)"))
+        conn.execute(text("INSERT INTO log VALUES ('a')"))
+        with pytest.raises(IntegrityError):
+            conn.execute(text("INSERT INTO log VALUES ('a')"))
+        assert not conn.info["query_started"]
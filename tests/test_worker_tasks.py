@@ -0,0 +1,180 @@
+﻿from contextlib import contextmanager
+from datetime import datetime, time, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from apps.worker import main as worker
+from daily_checkin.celery_app import set_message_sink
+from daily_checkin.models import (
+    Base,
+    ContactStatus,
+    DailyState,
+    DailyStateEnum,
+    NotificationLog,
+    TrustedContact,
+    User,
+    UserStatus,
+)
+from daily_checkin.services import notifications
+from daily_checkin.services.reports import send_lag_report
+
+
+@pytest.fixture
+def worker_db(monkeypatch):
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, expire_on_commit=False)
+
+    @contextmanager
+    def session_scope():
+        with Session() as session:
+            yield session
+            session.commit()
+
+    published = []
+    monkeypatch.setattr(worker, "session_scope", session_scope)
+    set_message_sink(published.extend)
+    yield session_scope, published
+    set_message_sink(None)
+
+
+def test_checkin_due_treats_expired_pause_as_active(worker_db):
+    session_scope, published = worker_db
+    now = datetime.now(timezone.utc)
+    today = now.date()
+    with session_scope() as session:
+        user = User(
+            tg_user_id=1,
+            tg_chat_id=1,
+            timezone="UTC",
+            checkin_time_local=time(9, 0),
+            status=UserStatus.PAUSED,
+            pause_until=now - timedelta(minutes=1),
+        )
+        session.add(user)
+        session.flush()
+        due = datetime.combine(today, time(9, 0), timezone.utc)
+        session.add(
+            DailyState(
+                user_id=user.id,
+                date_local=today,
+                due_at_utc=due,
+                deadline_at_utc=due + timedelta(minutes=90),
+                state=DailyStateEnum.PENDING,
+                reminders_sent_count=0,
+            )
+        )
+
+    # SQLite hands pause_until back without a timezone.
+    worker.checkin_due(1, today.isoformat())
+
+    assert [message.name for message in published] == ["tasks.reminder"] * 3 + ["tasks.deadline_missed"]
+
+
+def test_deadline_missed_is_recorded_for_the_lag_report(worker_db, monkeypatch):
+    session_scope, published = worker_db
+    monkeypatch.setattr(worker, "_notify_contacts_or_defer", lambda *args: None)
+    now = datetime.now(timezone.utc)
+    today = now.date()
+    deadline = now - timedelta(minutes=2)
+    with session_scope() as session:
+        user = User(
+            tg_user_id=1,
+            tg_chat_id=1,
+            timezone="UTC",
+            checkin_time_local=time(9, 0),
+            status=UserStatus.ACTIVE,
+        )
+        session.add(user)
+        session.flush()
+        session.add(
+            DailyState(
+                user_id=user.id,
+                date_local=today,
+                due_at_utc=deadline - timedelta(minutes=90),
+                deadline_at_utc=deadline,
+                state=DailyStateEnum.PENDING,
+                reminders_sent_count=0,
+            )
+        )
+
+    worker.deadline_missed(1, today.isoformat())
+
+    with session_scope() as session:
+        log = session.execute(select(NotificationLog)).scalar_one()
+        assert (log.type, log.status) == ("DEADLINE", "SENT")
+        report = send_lag_report(session, deadline - timedelta(hours=1), now + timedelta(hours=1))
+    assert report["by_type"]["DEADLINE"]["count"] == 1
+    assert report["by_type"]["DEADLINE"]["p50"] >= 120
+
+
+def test_flood_pause_defers_the_escalation_without_losing_or_repeating_sends(worker_db, monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    from aiogram.exceptions import TelegramRetryAfter
+    from aiogram.methods import SendMessage
+
+    from daily_checkin.telegram.flood import FLOOD_KEY, FloodControlMiddleware, FloodGate
+    from daily_checkin.telegram.rate_limiter import RateLimiter
+
+    session_scope, published = worker_db
+    with session_scope() as session:
+        user = User(
+            tg_user_id=1,
+            tg_chat_id=1,
+            timezone="UTC",
+            checkin_time_local=time(9, 0),
+            status=UserStatus.ACTIVE,
+        )
+        session.add(user)
+        session.flush()
+        for chat_id in (2, 3):
+            session.add(
+                TrustedContact(
+                    user_id=user.id,
+                    contact_tg_user_id=chat_id,
+                    contact_chat_id=chat_id,
+                    status=ContactStatus.APPROVED,
+                )
+            )
+
+    redis = fakeredis.FakeRedis()
+    middleware = FloodControlMiddleware(FloodGate(redis, RateLimiter(redis, 30)))
+    delivered = []
+    throttled = {3}
+
+    async def send_message(bot, chat_id, text, reply_markup=None):
+        async def make_request(bot, method):
+            if chat_id in throttled:
+                throttled.discard(chat_id)
+                raise TelegramRetryAfter(method, "Too Many Requests", 5)
+            delivered.append(chat_id)
+
+        await middleware(make_request, bot, SendMessage(chat_id=chat_id, text=text))
+
+    monkeypatch.setattr(notifications, "session_scope", session_scope)
+    monkeypatch.setattr(notifications, "read_session_scope", session_scope)
+    monkeypatch.setattr(notifications, "_create_bot", lambda: None)
+    monkeypatch.setattr(notifications, "_send_message", send_message)
+
+    deadline = datetime(2024, 5, 1, 10, 30, tzinfo=timezone.utc)
+    worker._notify_contacts_or_defer(1, "missed", deadline)
+
+    assert delivered == [2]
+    with session_scope() as session:
+        logs = session.execute(select(NotificationLog)).scalars().all()
+        # The throttled contact's claim is released, not left PENDING or marked failed.
+        assert [(log.target_chat_id, log.status) for log in logs] == [(2, "SENT")]
+    [deferred] = published
+    assert deferred.name == "tasks.notify_contacts_last_checkin"
+    assert deferred.eta >= datetime.now(timezone.utc) + timedelta(seconds=4)
+
+    redis.delete(FLOOD_KEY)
+    worker.notify_contacts_last_checkin_task(*deferred.args)
+    worker.notify_contacts_last_checkin_task(*deferred.args)
+
+    assert delivered == [2, 3]
+    with session_scope() as session:
+        logs = session.execute(select(NotificationLog)).scalars().all()
+        assert sorted((log.target_chat_id, log.status) for log in logs) == [(2, "SENT"), (3, "SENT")]